@@ -0,0 +1,320 @@
+"""
+Служебная HTTP-панель: воронка и здоровье бота в JSON и простой HTML.
+
+aiohttp-приложение на внутреннем порту (ADMIN_HTTP_HOST:ADMIN_HTTP_PORT,
+0 — панель выключена), запускается из main() рядом с polling, в кластере —
+в процессе-инжестере:
+
+    GET /             HTML: воронка, конверсии, длительности, здоровье
+    GET /api/funnel   шаги воронки, конверсии и p50/p90 переходов
+                      (метрики analytics_funnel.sql)
+    GET /api/health   состояние процесса: апдейты в обработке, очередь
+                      ограничителя, бэклог, транспорты, пул БД, логи, трассы
+
+Запросы к панели не ходят в БД: ответы берутся из кэша в памяти. Воронка
+пересчитывается раз в ADMIN_FUNNEL_REFRESH секунд по user_progress (через
+read_session — на реплику, если она есть), здоровье — раз в
+ADMIN_HEALTH_REFRESH секунд. Если данные не изменились, ответ и его ETag
+остаются прежними: дашборд, опрашивающий панель каждые несколько секунд с
+If-None-Match, получает 304 без тела.
+
+ADMIN_TOKEN (если задан) требуется в заголовке Authorization: Bearer <token>
+или в параметре ?token=.
+"""
+import asyncio
+import hashlib
+import hmac
+import html
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+from aiogram import Bot
+from aiohttp import web
+from loguru import logger
+
+import lifecycle
+import logging_setup
+import messaging
+import progress
+import tracing
+import user_profile
+from backlog import backlog_guard
+from database import engine, read_session, replica_health
+from funnel import FUNNEL_STEPS
+from middlewares.callback_answer_middleware import callback_answer
+from middlewares.callback_dedup_middleware import callback_dedup
+from middlewares.concurrency_limiter_middleware import concurrency_limiter
+from middlewares.throttling_middleware import throttling
+
+ADMIN_HTTP_HOST = os.getenv("ADMIN_HTTP_HOST", "127.0.0.1")
+ADMIN_HTTP_PORT = int(os.getenv("ADMIN_HTTP_PORT", "8081"))
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+ADMIN_FUNNEL_REFRESH = float(os.getenv("ADMIN_FUNNEL_REFRESH", "60"))
+ADMIN_HEALTH_REFRESH = float(os.getenv("ADMIN_HEALTH_REFRESH", "5"))
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class CachedResponse:
+    """Готовое тело ответа и его ETag; пересоздаётся только при изменении данных."""
+
+    def __init__(self, data: Dict[str, Any], updated_at: str, body: Optional[bytes] = None) -> None:
+        self.data = data
+        self.updated_at = updated_at
+        if body is None:
+            body = json.dumps({"updated_at": updated_at, **data}, ensure_ascii=False, default=str, indent=1).encode()
+        self.body = body
+        self.etag = f'"{hashlib.sha1(self.body).hexdigest()[:20]}"'
+
+
+def _refreshed(previous: Optional[CachedResponse], data: Dict[str, Any]) -> CachedResponse:
+    if previous is not None and previous.data == data:
+        return previous
+    return CachedResponse(data, _now())
+
+
+def _etag_matches(request: web.Request, etag: str) -> bool:
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in tags or etag in tags
+
+
+def health_snapshot(bot: Optional[Bot]) -> Dict[str, Any]:
+    """Состояние процесса из счётчиков модулей; без обращений к БД и сети."""
+    manager = getattr(bot.session, "manager", None) if bot is not None else None
+    return {
+        "pid": os.getpid(),
+        "inflight_updates": lifecycle.inflight_tracker.inflight_count,
+        "last_update_id": lifecycle.inflight_tracker.last_update_id,
+        "background_tasks": lifecycle.background_count(),
+        "limiter": concurrency_limiter.stats(),
+        "callback_dedup": callback_dedup.stats(),
+        "callback_answer": callback_answer.stats(),
+        "throttling": throttling.stats(),
+        "backlog": backlog_guard.stats(),
+        "transports": manager.stats() if manager is not None else None,
+        "db_pool": engine.pool.status(),
+        "replica": replica_health.stats(),
+        "profile_cache": user_profile.stats(),
+        "photo_captions": messaging.stats(),
+        "logging": logging_setup.stats(),
+        "tracing": tracing.exporter.stats(),
+    }
+
+
+async def funnel_snapshot() -> Dict[str, Any]:
+    """Воронка, распределение по текущим шагам и длительности переходов."""
+    started = time.monotonic()
+    async with read_session() as db:
+        counts = await progress.funnel_counts(db)
+        stages = await progress.stage_counts(db)
+        durations = await progress.duration_percentiles(db)
+    return {
+        "counts": counts,
+        "current_stage": {progress.STEP_LABELS.get(stage, str(stage)): count for stage, count in stages.items()},
+        "durations": durations,
+        "query_time": round(time.monotonic() - started, 3),
+    }
+
+
+def _fmt(value: Any) -> str:
+    if value is None:
+        return "—"
+    if isinstance(value, float):
+        return f"{value:.1f}"
+    return html.escape(str(value))
+
+
+def render_html(funnel: Optional[CachedResponse], health: Optional[CachedResponse], refresh: float) -> str:
+    parts = [
+        "<!doctype html><html><head><meta charset='utf-8'>",
+        f"<meta http-equiv='refresh' content='{max(1, int(refresh))}'>",
+        "<title>Бот: воронка и здоровье</title>",
+        "<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse;margin-bottom:2em}"
+        "td,th{border:1px solid #ccc;padding:4px 10px;text-align:right}th:first-child,td:first-child"
+        "{text-align:left}pre{background:#f6f6f6;padding:1em}</style></head><body>",
+    ]
+    if funnel is None:
+        parts.append("<p>Воронка ещё считается…</p>")
+    else:
+        counts = funnel.data["counts"]
+        total = counts["users_total"]
+        parts.append(f"<h2>Воронка</h2><p>обновлено {_fmt(funnel.updated_at)}</p>")
+        parts.append("<table><tr><th>шаг</th><th>пользователей</th><th>% от всех</th></tr>")
+        parts.append(f"<tr><td>users_total</td><td>{_fmt(total)}</td><td>100</td></tr>")
+        for _, label, _ in FUNNEL_STEPS:
+            share = 100.0 * counts[label] / total if total else None
+            parts.append(f"<tr><td>{_fmt(label)}</td><td>{_fmt(counts[label])}</td><td>{_fmt(share)}</td></tr>")
+        parts.append("</table><table><tr><th>конверсия</th><th>%</th></tr>")
+        for name, value in counts.items():
+            if name.startswith("conv_"):
+                parts.append(f"<tr><td>{_fmt(name)}</td><td>{_fmt(value)}</td></tr>")
+        parts.append("</table><table><tr><th>переход</th><th>пользователей</th><th>p50, с</th><th>p90, с</th></tr>")
+        for item in funnel.data["durations"]:
+            parts.append(
+                f"<tr><td>{_fmt(item['step'])}</td><td>{_fmt(item['users'])}</td>"
+                f"<td>{_fmt(item['p50_sec'])}</td><td>{_fmt(item['p90_sec'])}</td></tr>"
+            )
+        parts.append("</table>")
+    if health is not None:
+        parts.append(f"<h2>Здоровье</h2><p>обновлено {_fmt(health.updated_at)}</p>")
+        parts.append(f"<pre>{html.escape(json.dumps(health.data, ensure_ascii=False, default=str, indent=2))}</pre>")
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+class AdminDashboard:
+    def __init__(
+        self,
+        host: str = ADMIN_HTTP_HOST,
+        port: int = ADMIN_HTTP_PORT,
+        token: str = ADMIN_TOKEN,
+        funnel_refresh: float = ADMIN_FUNNEL_REFRESH,
+        health_refresh: float = ADMIN_HEALTH_REFRESH,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.token = token
+        self.funnel_refresh = funnel_refresh
+        self.health_refresh = health_refresh
+        self.bot: Optional[Bot] = None
+        self.funnel: Optional[CachedResponse] = None
+        self.health: Optional[CachedResponse] = None
+        self.page: Optional[CachedResponse] = None
+        self.funnel_error: Optional[str] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._tasks: list = []
+
+        self.requests = 0
+        self.not_modified = 0
+        self.funnel_refreshes = 0
+
+    # --- кэш ---
+
+    def _rebuild_page(self) -> None:
+        page = render_html(self.funnel, self.health, self.health_refresh)
+        if self.page is None or self.page.data["html"] != page:
+            self.page = CachedResponse({"html": page}, _now(), page.encode())
+
+    def refresh_health(self) -> None:
+        data = health_snapshot(self.bot)
+        # Счётчики запросов к самой панели сюда не входят: иначе каждый опрос менял бы ETag
+        data["funnel_error"] = self.funnel_error
+        self.health = _refreshed(self.health, data)
+        self._rebuild_page()
+
+    async def refresh_funnel(self) -> None:
+        try:
+            data = await funnel_snapshot()
+        except Exception as e:
+            # Последняя удачная воронка остаётся в кэше
+            self.funnel_error = f"{type(e).__name__}: {e}"
+            logger.warning("Панель: не удалось пересчитать воронку: {}", e)
+            return
+        self.funnel_error = None
+        self.funnel_refreshes += 1
+        query_time = data.pop("query_time")
+        self.funnel = _refreshed(self.funnel, data)
+        self._rebuild_page()
+        logger.debug("Панель: воронка пересчитана за {:.3f} с", query_time)
+
+    async def _loop(self, interval: float, refresh: Callable[[], Any]) -> None:
+        while True:
+            try:
+                result = refresh()
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                logger.warning("Панель: ошибка обновления кэша: {}", e)
+            await asyncio.sleep(interval)
+
+    # --- HTTP ---
+
+    @web.middleware
+    async def _auth(self, request: web.Request, handler: Callable) -> web.StreamResponse:
+        if self.token:
+            scheme, _, supplied = request.headers.get("Authorization", "").partition(" ")
+            if scheme != "Bearer":
+                supplied = request.query.get("token", "")
+            if not hmac.compare_digest(supplied.strip().encode(), self.token.encode()):
+                raise web.HTTPUnauthorized()
+        return await handler(request)
+
+    def _respond(self, request: web.Request, cached: Optional[CachedResponse], content_type: str) -> web.Response:
+        self.requests += 1
+        if cached is None:
+            return web.json_response({"status": "warming_up"}, status=503, headers={"Retry-After": "5"})
+        headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+        if _etag_matches(request, cached.etag):
+            self.not_modified += 1
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=cached.body, content_type=content_type, charset="utf-8", headers=headers)
+
+    async def _handle_funnel(self, request: web.Request) -> web.Response:
+        return self._respond(request, self.funnel, "application/json")
+
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        return self._respond(request, self.health, "application/json")
+
+    async def _handle_index(self, request: web.Request) -> web.Response:
+        return self._respond(request, self.page, "text/html")
+
+    def make_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._auth])
+        app.router.add_get("/", self._handle_index)
+        app.router.add_get("/api/funnel", self._handle_funnel)
+        app.router.add_get("/api/health", self._handle_health)
+        return app
+
+    # --- жизненный цикл ---
+
+    async def start(self, bot: Optional[Bot] = None) -> None:
+        if not self.port:
+            logger.info("Панель выключена (ADMIN_HTTP_PORT=0)")
+            return
+        self.bot = bot
+        self.refresh_health()
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        try:
+            await site.start()
+        except OSError as e:
+            # Панель не должна мешать боту стартовать
+            logger.error("Панель не запущена на {}:{}: {}", self.host, self.port, e)
+            await self._runner.cleanup()
+            self._runner = None
+            return
+        self._tasks = [
+            asyncio.create_task(self._loop(self.funnel_refresh, self.refresh_funnel), name="admin-funnel"),
+            asyncio.create_task(self._loop(self.health_refresh, self.refresh_health), name="admin-health"),
+        ]
+        logger.info("Панель: http://{}:{}/", self.host, self.port)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "not_modified": self.not_modified,
+            "funnel_refreshes": self.funnel_refreshes,
+            "funnel_error": self.funnel_error,
+        }
+
+
+admin_dashboard = AdminDashboard()
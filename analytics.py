@@ -1,14 +1,31 @@
-from typing import Optional, Dict, Any
-from sqlalchemy import select
-from database import AsyncSessionLocal
-from models import UserEvent, User, Quiz
+import asyncio
+from datetime import datetime
+from functools import partial
+from typing import Awaitable, Optional, Dict, Any
+from sqlalchemy import select, insert, literal
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import AsyncSessionLocal, IS_SQLITE
+from event_fields import split_payload
+from models import UserEvent, User
+from progress import progress_upsert
+from quiz_cache import get_quiz_id
+from lifecycle import spawn
+from logging_setup import sampled
 from loguru import logger
 
+_event_log = sampled("analytics.event_written")
+
+# telegram_id -> последняя фоновая запись событий пользователя
+_event_tails: Dict[int, asyncio.Task] = {}
+
 
 async def log_event(user_telegram_id: int, event_code: str, payload: Optional[Dict[str, Any]] = None, quiz_code: Optional[str] = None) -> None:
     """
     Логирование пользовательского события в таблицу user_events.
     Можно передать quiz_code, чтобы связать событие с конкретным квизом.
+    Ключи payload из event_fields.PROMOTED_FIELDS пишутся в свои колонки.
+    Шаг воронки в user_progress обновляется в той же транзакции.
     """
     async with AsyncSessionLocal() as db:
         # Найдём пользователя по telegram_id
@@ -18,19 +35,116 @@ async def log_event(user_telegram_id: int, event_code: str, payload: Optional[Di
             logger.warning("log_event: пользователь с tg={} не найден", user_telegram_id)
             return
 
-        quiz_id = None
-        if quiz_code:
-            qres = await db.execute(select(Quiz).where(Quiz.code == quiz_code))
-            quiz = qres.scalar_one_or_none()
-            if quiz:
-                quiz_id = quiz.id
+        quiz_id = await get_quiz_id(db, quiz_code) if quiz_code else None
 
+        fields, payload = split_payload(payload)
         event = UserEvent(
             user_id=user.id,
             quiz_id=quiz_id,
             event_code=event_code,
-            payload=payload or {},
+            payload=payload,
+            **fields,
         )
         db.add(event)
+        progress = progress_upsert(user.id, event_code)
+        if progress is not None:
+            await db.execute(progress)
         await db.commit()
-        logger.info("Записано событие {} для пользователя {}", event_code, user_telegram_id)
+        _event_log.info("Записано событие {} для пользователя {}", event_code, user_telegram_id)
+
+
+async def _after(previous: Optional[asyncio.Task], write: Awaitable[None]) -> None:
+    if previous is not None and not previous.done():
+        await asyncio.wait([previous])
+    await write
+
+
+def _release_tail(user_telegram_id: int, task: asyncio.Task) -> None:
+    if _event_tails.get(user_telegram_id) is task:
+        del _event_tails[user_telegram_id]
+
+
+def log_event_nowait(user_telegram_id: int, event_code: str, payload: Optional[Dict[str, Any]] = None, quiz_code: Optional[str] = None) -> asyncio.Task:
+    """
+    log_event в фоне (lifecycle.spawn): обработчик не ждёт записи и сразу
+    отправляет сообщения. События одного пользователя пишутся строго в
+    порядке вызова — следующая запись ждёт предыдущую, поэтому порядок
+    created_at и шаги воронки в user_progress не перемешиваются.
+    """
+    previous = _event_tails.get(user_telegram_id)
+    task = spawn(
+        _after(previous, log_event(user_telegram_id, event_code, payload, quiz_code)),
+        name=f"log_event:{event_code}",
+    )
+    _event_tails[user_telegram_id] = task
+    task.add_done_callback(partial(_release_tail, user_telegram_id))
+    return task
+
+
+async def flush_user_events(user_telegram_id: int) -> None:
+    """Дожидается фоновой записи событий пользователя (например, перед его удалением)."""
+    tail = _event_tails.get(user_telegram_id)
+    if tail is not None:
+        await asyncio.wait([tail])
+
+
+async def register_bot_start(telegram_id: int, telegram_username: Optional[str] = None) -> Optional[int]:
+    """
+    Регистрация /start за один запрос к БД.
+
+    INSERT ... ON CONFLICT (telegram_id) DO UPDATE ... RETURNING id создаёт
+    пользователя или обновляет его username, а событие bot_start пишется
+    в том же statement через CTE (как и шаг 1 в user_progress). Одновременные
+    /start одного пользователя не падают на уникальном индексе. Возвращает users.id.
+
+    SQLite не поддерживает INSERT внутри CTE: там upsert и событие —
+    два statement'а в одной транзакции.
+    """
+    if IS_SQLITE:
+        return await _register_bot_start_sqlite(telegram_id, telegram_username)
+
+    upsert = pg_insert(User).values(
+        telegram_id=telegram_id,
+        telegram_username=telegram_username,
+        bot_start_datetime=datetime.utcnow(),
+    )
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[User.telegram_id],
+        set_={"telegram_username": upsert.excluded.telegram_username},
+    ).returning(User.id).cte("upserted_user")
+
+    progress = progress_upsert(select(upsert.c.id).scalar_subquery(), "bot_start").cte("upserted_progress")
+
+    stmt = insert(UserEvent).from_select(
+        ["user_id", "event_code", "payload"],
+        select(upsert.c.id, literal("bot_start"), literal({}, JSONB)),
+    ).returning(UserEvent.user_id).add_cte(progress)
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(stmt)
+        user_id = result.scalar_one_or_none()
+        await db.commit()
+
+    _event_log.info("Записано событие bot_start для пользователя {}", telegram_id)
+    return user_id
+
+
+async def _register_bot_start_sqlite(telegram_id: int, telegram_username: Optional[str]) -> Optional[int]:
+    upsert = sqlite_insert(User).values(
+        telegram_id=telegram_id,
+        telegram_username=telegram_username,
+        bot_start_datetime=datetime.utcnow(),
+    )
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[User.telegram_id],
+        set_={"telegram_username": upsert.excluded.telegram_username},
+    ).returning(User.id)
+
+    async with AsyncSessionLocal() as db:
+        user_id = (await db.execute(upsert)).scalar_one()
+        await db.execute(insert(UserEvent).values(user_id=user_id, event_code="bot_start", payload={}))
+        await db.execute(progress_upsert(user_id, "bot_start"))
+        await db.commit()
+
+    _event_log.info("Записано событие bot_start для пользователя {}", telegram_id)
+    return user_id
@@ -4,19 +4,20 @@ WITH flags AS (
     u.id AS user_id,
     u.telegram_id,
     u.user_name,
-    MIN(e.created_at) FILTER (WHERE e.event_code = 'bot_start') AS ts_01_bot_start,
-    MIN(e.created_at) FILTER (WHERE e.event_code = 'name_confirmed') AS ts_02_name_confirmed,
-    MIN(e.created_at) FILTER (WHERE e.event_code = 'phone_confirmed') AS ts_03_phone_confirmed,
-    MIN(e.created_at) FILTER (WHERE e.event_code = 'goal_selected') AS ts_04_goal_selected,
-    MIN(e.created_at) FILTER (WHERE e.event_code IN ('start_quiz','quiz_started','discover_scenario','start_quiz_clicked')) AS ts_05_quiz_started,
-    MIN(e.created_at) FILTER (WHERE e.event_code IN ('show_quiz_results','quiz_completed')) AS ts_06_quiz_completed,
-    MIN(e.created_at) FILTER (WHERE e.event_code IN ('scenario_cost_started','non_psych_quiz_started')) AS ts_07_cost_started,
-    MIN(e.created_at) FILTER (WHERE e.event_code IN ('scenario_cost_completed','non_psych_quiz_completed')) AS ts_08_cost_completed,
-    MIN(e.created_at) FILTER (WHERE e.event_code = 'book_consultation_clicked') AS ts_09_book_consultation,
-    MIN(e.created_at) FILTER (WHERE e.event_code = 'book_call_requested') AS ts_10_book_call,
-    MIN(e.created_at) FILTER (WHERE e.event_code IN ('go_to_channel_clicked','gift_sent_success')) AS ts_11_channel_or_gift
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code = 'bot_start'), MIN(p.ts_01)) AS ts_01_bot_start,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code = 'name_confirmed'), MIN(p.ts_02)) AS ts_02_name_confirmed,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code = 'phone_confirmed'), MIN(p.ts_03)) AS ts_03_phone_confirmed,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code = 'goal_selected'), MIN(p.ts_04)) AS ts_04_goal_selected,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code IN ('start_quiz','quiz_started','discover_scenario','start_quiz_clicked')), MIN(p.ts_05)) AS ts_05_quiz_started,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code IN ('show_quiz_results','quiz_completed')), MIN(p.ts_06)) AS ts_06_quiz_completed,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code IN ('scenario_cost_started','non_psych_quiz_started')), MIN(p.ts_07)) AS ts_07_cost_started,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code IN ('scenario_cost_completed','non_psych_quiz_completed')), MIN(p.ts_08)) AS ts_08_cost_completed,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code = 'book_consultation_clicked'), MIN(p.ts_09)) AS ts_09_book_consultation,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code = 'book_call_requested'), MIN(p.ts_10)) AS ts_10_book_call,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code IN ('go_to_channel_clicked','gift_sent_success')), MIN(p.ts_11)) AS ts_11_channel_or_gift
   FROM users u
   LEFT JOIN user_events e ON e.user_id = u.id
+  LEFT JOIN user_progress p ON p.user_id = u.id AND p.compacted_at IS NOT NULL
   GROUP BY u.id, u.telegram_id, u.user_name
 ),
 progress AS (
@@ -89,19 +90,20 @@ ORDER BY stage_reached DESC, ts_01_bot_start DESC;
 WITH flags AS (
   SELECT
     u.id AS user_id,
-    MIN(e.created_at) FILTER (WHERE e.event_code = 'bot_start') AS s1,
-    MIN(e.created_at) FILTER (WHERE e.event_code = 'name_confirmed') AS s2,
-    MIN(e.created_at) FILTER (WHERE e.event_code = 'phone_confirmed') AS s3,
-    MIN(e.created_at) FILTER (WHERE e.event_code = 'goal_selected') AS s4,
-    MIN(e.created_at) FILTER (WHERE e.event_code IN ('start_quiz','quiz_started','discover_scenario','start_quiz_clicked')) AS s5,
-    MIN(e.created_at) FILTER (WHERE e.event_code IN ('show_quiz_results','quiz_completed')) AS s6,
-    MIN(e.created_at) FILTER (WHERE e.event_code IN ('scenario_cost_started','non_psych_quiz_started')) AS s7,
-    MIN(e.created_at) FILTER (WHERE e.event_code IN ('scenario_cost_completed','non_psych_quiz_completed')) AS s8,
-    MIN(e.created_at) FILTER (WHERE e.event_code = 'book_consultation_clicked') AS s9,
-    MIN(e.created_at) FILTER (WHERE e.event_code = 'book_call_requested') AS s10,
-    MIN(e.created_at) FILTER (WHERE e.event_code IN ('go_to_channel_clicked','gift_sent_success')) AS s11
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code = 'bot_start'), MIN(p.ts_01)) AS s1,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code = 'name_confirmed'), MIN(p.ts_02)) AS s2,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code = 'phone_confirmed'), MIN(p.ts_03)) AS s3,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code = 'goal_selected'), MIN(p.ts_04)) AS s4,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code IN ('start_quiz','quiz_started','discover_scenario','start_quiz_clicked')), MIN(p.ts_05)) AS s5,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code IN ('show_quiz_results','quiz_completed')), MIN(p.ts_06)) AS s6,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code IN ('scenario_cost_started','non_psych_quiz_started')), MIN(p.ts_07)) AS s7,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code IN ('scenario_cost_completed','non_psych_quiz_completed')), MIN(p.ts_08)) AS s8,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code = 'book_consultation_clicked'), MIN(p.ts_09)) AS s9,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code = 'book_call_requested'), MIN(p.ts_10)) AS s10,
+    LEAST(MIN(e.created_at) FILTER (WHERE e.event_code IN ('go_to_channel_clicked','gift_sent_success')), MIN(p.ts_11)) AS s11
   FROM users u
   LEFT JOIN user_events e ON e.user_id = u.id
+  LEFT JOIN user_progress p ON p.user_id = u.id AND p.compacted_at IS NOT NULL
   GROUP BY u.id
 )
 SELECT
@@ -129,16 +131,17 @@ WITH base AS (
   WITH flags AS (
     SELECT
       u.id AS user_id,
-      MIN(e.created_at) FILTER (WHERE e.event_code = 'bot_start') AS ts1,
-      MIN(e.created_at) FILTER (WHERE e.event_code = 'name_confirmed') AS ts2,
-      MIN(e.created_at) FILTER (WHERE e.event_code = 'phone_confirmed') AS ts3,
-      MIN(e.created_at) FILTER (WHERE e.event_code = 'goal_selected') AS ts4,
-      MIN(e.created_at) FILTER (WHERE e.event_code IN ('start_quiz','quiz_started','discover_scenario','start_quiz_clicked')) AS ts5,
-      MIN(e.created_at) FILTER (WHERE e.event_code IN ('show_quiz_results','quiz_completed')) AS ts6,
-      MIN(e.created_at) FILTER (WHERE e.event_code IN ('scenario_cost_completed','non_psych_quiz_completed')) AS ts8,
-      MIN(e.created_at) FILTER (WHERE e.event_code = 'book_call_requested') AS ts10
+      LEAST(MIN(e.created_at) FILTER (WHERE e.event_code = 'bot_start'), MIN(p.ts_01)) AS ts1,
+      LEAST(MIN(e.created_at) FILTER (WHERE e.event_code = 'name_confirmed'), MIN(p.ts_02)) AS ts2,
+      LEAST(MIN(e.created_at) FILTER (WHERE e.event_code = 'phone_confirmed'), MIN(p.ts_03)) AS ts3,
+      LEAST(MIN(e.created_at) FILTER (WHERE e.event_code = 'goal_selected'), MIN(p.ts_04)) AS ts4,
+      LEAST(MIN(e.created_at) FILTER (WHERE e.event_code IN ('start_quiz','quiz_started','discover_scenario','start_quiz_clicked')), MIN(p.ts_05)) AS ts5,
+      LEAST(MIN(e.created_at) FILTER (WHERE e.event_code IN ('show_quiz_results','quiz_completed')), MIN(p.ts_06)) AS ts6,
+      LEAST(MIN(e.created_at) FILTER (WHERE e.event_code IN ('scenario_cost_completed','non_psych_quiz_completed')), MIN(p.ts_08)) AS ts8,
+      LEAST(MIN(e.created_at) FILTER (WHERE e.event_code = 'book_call_requested'), MIN(p.ts_10)) AS ts10
     FROM users u
     LEFT JOIN user_events e ON e.user_id = u.id
+    LEFT JOIN user_progress p ON p.user_id = u.id AND p.compacted_at IS NOT NULL
     GROUP BY u.id
   )
   SELECT
@@ -166,13 +169,33 @@ UNION ALL
 SELECT '08->10', percentile_cont(0.5) WITHIN GROUP (ORDER BY s08_to_10), percentile_cont(0.9) WITHIN GROUP (ORDER BY s08_to_10) FROM base;
 
 
--- Optional: create a view to reuse progress elsewhere
--- CREATE OR REPLACE VIEW user_progress AS
--- <paste the SELECT from the `progress` CTE above>;
+-- user_progress is a real table maintained on every logged event (progress.py),
+-- rebuild it from user_events with: python -m progress --backfill
+-- Current stage distribution:
+-- SELECT stage, COUNT(*) FROM user_progress GROUP BY stage ORDER BY stage;
+-- Users stuck at step 6 for more than a day (index ix_user_progress_stage_stage_at):
+-- SELECT p.user_id, u.telegram_id, p.stage_at
+-- FROM user_progress p JOIN users u ON u.id = p.user_id
+-- WHERE p.stage = 6 AND p.stage_at < NOW() - INTERVAL '1 day'
+-- ORDER BY p.stage_at;
+
+
+-- Events older than COMPACT_AFTER_DAYS are rolled up by: python -m compaction
+-- First touches of compacted users live in user_progress (compacted_at IS NOT NULL),
+-- which is why the queries above take LEAST() with p.ts_XX.
+-- Daily event counts, aggregates + recent raw events:
+-- SELECT day, event_code, SUM(events) AS events FROM (
+--   SELECT day, event_code, events FROM event_daily_aggregates
+--   UNION ALL
+--   SELECT created_at::date, event_code, COUNT(*) FROM user_events GROUP BY 1, 2
+-- ) t GROUP BY day, event_code ORDER BY day, event_code;
 
 
 -- Recommended indexes (run once):
 -- CREATE INDEX IF NOT EXISTS idx_user_events_user_code_time ON user_events(user_id, event_code, created_at);
 -- CREATE INDEX IF NOT EXISTS idx_user_events_code_time ON user_events(event_code, created_at);
--- For payload filtering (if needed):
+-- quiz_result_id, dominant_scenario, goal, is_psychologist and path are typed indexed
+-- columns of user_events (event_fields.py), e.g.
+-- SELECT dominant_scenario, COUNT(*) FROM user_events WHERE event_code = 'quiz_completed' GROUP BY 1;
+-- payload keeps only free-form keys. For filtering on those (if needed):
 -- CREATE INDEX IF NOT EXISTS idx_user_events_payload_gin ON user_events USING GIN (payload);
@@ -0,0 +1,327 @@
+"""
+Восстановление после падения: сохранённый offset, дедупликация и политика
+бэклога апдейтов, накопившихся, пока бот лежал.
+
+Telegram сам помнит только подтверждённый offset, а aiogram подтверждает
+пачку апдейтов следующим getUpdates. При падении процесса последняя пачка
+приходит снова — в том числе уже обработанные апдейты. Поэтому последний
+полностью обработанный update_id (граница из InflightTracker) раз в
+POLLING_OFFSET_FLUSH_INTERVAL секунд пишется в app_meta, и при старте
+апдейты бэклога, не новее него, отбрасываются как дубль.
+
+Дубли бывают только в бэклоге. update_id не новее сохранённого после
+бэклога — это сброс счётчика Telegram (после недели без апдейтов
+update_id снова случайный; то же при смене токена или бота): такой апдейт
+обрабатывается, а сохранённая граница забывается.
+
+Бэклог — pending_update_count из getWebhookInfo на момент старта. К нему
+применяется BACKLOG_POLICY:
+- all   — обрабатывать всё (по умолчанию);
+- skip  — отбрасывать апдейты бэклога старше BACKLOG_MAX_AGE_MINUTES;
+- drain — устаревшие нажатия кнопок сразу получают callback.answer() с
+  BACKLOG_STALE_CALLBACK_TEXT, не доходя до обработчиков и БД; сообщения
+  обрабатываются как обычно.
+
+У callback_query нет даты нажатия. Его возраст оценивается сверху: нажатие
+было не раньше отправки сообщения с кнопкой и не раньше последней записи
+offset перед падением.
+
+Когда бэклог разобран, в лог пишется время разбора и сколько апдейтов
+обработано, отброшено и отвечено заглушкой; то же отдаёт stats().
+"""
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import Update
+from loguru import logger
+from sqlalchemy import delete, select
+
+from database import engine
+from lifecycle import inflight_tracker
+from models import AppMeta
+
+BACKLOG_POLICY = os.getenv("BACKLOG_POLICY", "all").lower()
+BACKLOG_MAX_AGE_MINUTES = float(os.getenv("BACKLOG_MAX_AGE_MINUTES", "10"))
+BACKLOG_STALE_CALLBACK_TEXT = os.getenv(
+    "BACKLOG_STALE_CALLBACK_TEXT",
+    "Бот был недоступен, эта кнопка устарела. Нажмите /start, чтобы продолжить.",
+)
+# Как часто сохранять последний обработанный update_id в app_meta
+POLLING_OFFSET_FLUSH_INTERVAL = float(os.getenv("POLLING_OFFSET_FLUSH_INTERVAL", "5"))
+
+POLLING_OFFSET_KEY = "polling_last_update_id"
+
+PROCESS = "process"
+DUPLICATE = "duplicate"
+SKIP = "skip"
+DRAIN = "drain"
+
+_POLICIES = ("all", "skip", "drain")
+
+
+def _event_date(update: Update) -> Optional[datetime]:
+    """Дата события апдейта; для callback_query — дата сообщения с кнопкой."""
+    event = update.event
+    date = getattr(event, "date", None)
+    if date is None and update.callback_query is not None:
+        message = update.callback_query.message
+        # У InaccessibleMessage date == 0
+        date = getattr(message, "date", None) if message else None
+    if not isinstance(date, datetime) or date.timestamp() <= 0:
+        return None
+    return date
+
+
+async def answer_stale(update: Update) -> None:
+    """Заглушка на устаревшее нажатие кнопки."""
+    try:
+        await update.callback_query.answer(BACKLOG_STALE_CALLBACK_TEXT)
+    except Exception as e:
+        # Нажатия старше ~15 минут Telegram уже не даёт ответить
+        logger.debug("Заглушка на устаревшее нажатие не отправлена: {}", e)
+
+
+class BacklogGuard(BaseMiddleware):
+    """
+    Outer-middleware уровня Update (подключается после InflightTracker,
+    чтобы отброшенные апдейты тоже считались обработанными).
+    До start() пропускает всё: в воркерах кластера дедупликацию и политику
+    применяет инжестер.
+    """
+
+    def __init__(
+        self,
+        policy: str = BACKLOG_POLICY,
+        max_age_minutes: float = BACKLOG_MAX_AGE_MINUTES,
+        flush_interval: float = POLLING_OFFSET_FLUSH_INTERVAL,
+    ) -> None:
+        if policy not in _POLICIES:
+            logger.warning("Неизвестная BACKLOG_POLICY={}, используется all", policy)
+            policy = "all"
+        self.policy = policy
+        self.max_age = max_age_minutes * 60
+        self.flush_interval = flush_interval
+
+        self.active = False
+        # Апдейты не новее этого id уже обработаны до рестарта
+        self.restored_update_id: Optional[int] = None
+        # Время последней записи offset перед рестартом (unix time)
+        self.restored_at: Optional[float] = None
+        self._watermark_source: Callable[[], Optional[int]] = self._tracker_watermark
+        self._manual_watermark: Optional[int] = None
+        self._persisted: Optional[int] = None
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self.backlog_size = 0
+        self._backlog_left = 0
+        self._started_at: Optional[float] = None
+        self.drain_seconds: Optional[float] = None
+        self.counters: Dict[str, int] = {PROCESS: 0, DUPLICATE: 0, SKIP: 0, DRAIN: 0}
+        self.backlog_counters: Dict[str, int] = {PROCESS: 0, DUPLICATE: 0, SKIP: 0, DRAIN: 0}
+
+    # --- Граница обработанных апдейтов ---
+
+    @staticmethod
+    def _tracker_watermark() -> Optional[int]:
+        # confirmable_offset уже не дальше апдейтов, отменённых по дедлайну
+        offset = inflight_tracker.confirmable_offset()
+        return offset - 1 if offset is not None else None
+
+    def _external_watermark(self) -> Optional[int]:
+        return self._manual_watermark
+
+    def mark_done(self, update_id: int) -> None:
+        """Для инжестера кластера: апдейт разложен по очередям или отброшен."""
+        if self._manual_watermark is None or update_id > self._manual_watermark:
+            self._manual_watermark = update_id
+
+    async def _load(self) -> None:
+        async with engine.connect() as conn:
+            value = (await conn.execute(
+                select(AppMeta.value).where(AppMeta.key == POLLING_OFFSET_KEY)
+            )).scalar_one_or_none()
+        if not value:
+            return
+        try:
+            stored = json.loads(value)
+            self.restored_update_id = int(stored["update_id"])
+            self.restored_at = float(stored["at"])
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Некорректное значение {} в app_meta: {}", POLLING_OFFSET_KEY, value)
+        self._persisted = self.restored_update_id
+
+    async def flush(self) -> Optional[int]:
+        """Сохраняет границу обработанных апдейтов, если она сдвинулась."""
+        watermark = self._watermark_source()
+        if watermark is None or (self._persisted is not None and watermark <= self._persisted):
+            return None
+        value = json.dumps({"update_id": watermark, "at": time.time()})
+        async with engine.begin() as conn:
+            await conn.execute(delete(AppMeta).where(AppMeta.key == POLLING_OFFSET_KEY))
+            await conn.execute(AppMeta.__table__.insert().values(key=POLLING_OFFSET_KEY, value=value))
+        self._persisted = watermark
+        return watermark
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("Не удалось сохранить offset: {}", e)
+
+    # --- Запуск и остановка ---
+
+    async def start(self, bot: Bot, external_watermark: bool = False) -> None:
+        """
+        Загружает сохранённый offset и размер бэклога, запускает периодическое
+        сохранение. external_watermark=True — граница задаётся mark_done()
+        (инжестер кластера), иначе берётся из InflightTracker.
+        """
+        if external_watermark:
+            self._watermark_source = self._external_watermark
+        try:
+            await self._load()
+        except Exception as e:
+            logger.warning("Не удалось прочитать сохранённый offset: {}", e)
+        try:
+            self.backlog_size = (await bot.get_webhook_info()).pending_update_count
+        except Exception as e:
+            logger.warning("Не удалось получить размер бэклога: {}", e)
+        self._backlog_left = self.backlog_size
+        self._started_at = time.monotonic()
+        self.active = True
+
+        if self.backlog_size:
+            logger.info(
+                "Бэклог при старте: {} апдейтов, политика {}, последний обработанный update_id {}",
+                self.backlog_size, self.policy, self.restored_update_id,
+            )
+        else:
+            self.drain_seconds = 0.0
+        self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if not self.active:
+            return
+        try:
+            offset = await self.flush()
+            if offset is not None:
+                logger.info("Сохранён последний обработанный update_id {}", offset)
+        except Exception as e:
+            logger.warning("Не удалось сохранить offset при остановке: {}", e)
+        self.active = False
+
+    async def on_shutdown(self) -> None:
+        """
+        Хук dp.shutdown, выполняется после lifecycle.drain: пул БД уже
+        закрыт, поэтому соединение для записи offset закрываем сразу.
+        """
+        if not self.active:
+            return
+        await self.stop()
+        await engine.dispose()
+
+    # --- Политика ---
+
+    def _is_stale(self, update: Update, now: float) -> bool:
+        date = _event_date(update)
+        if update.callback_query is not None and self.restored_at is not None:
+            restored = datetime.fromtimestamp(self.restored_at, timezone.utc)
+            date = max(date, restored) if date is not None else restored
+        if date is None:
+            return False
+        return now - date.timestamp() > self.max_age
+
+    def classify(self, update: Update) -> str:
+        """Что делать с апдейтом: PROCESS, DUPLICATE, SKIP или DRAIN."""
+        if not self.active:
+            return PROCESS
+
+        in_backlog = self._backlog_left > 0
+        if self.restored_update_id is not None and update.update_id <= self.restored_update_id:
+            if in_backlog:
+                action = DUPLICATE
+            else:
+                self._counter_reset(update.update_id)
+                action = PROCESS
+        elif in_backlog and self.policy != "all" and self._is_stale(update, time.time()):
+            if self.policy == "skip":
+                action = SKIP
+            elif update.callback_query is not None:
+                action = DRAIN
+            else:
+                action = PROCESS
+        else:
+            action = PROCESS
+
+        self.counters[action] += 1
+        if in_backlog:
+            self.backlog_counters[action] += 1
+            self._backlog_left -= 1
+            if self._backlog_left == 0:
+                self._backlog_drained()
+        return action
+
+    def _counter_reset(self, update_id: int) -> None:
+        logger.warning(
+            "update_id {} после бэклога не новее сохранённого {}: счётчик Telegram сброшен, "
+            "сохранённая граница забыта",
+            update_id, self.restored_update_id,
+        )
+        self.restored_update_id = None
+        # Новая граница меньше сохранённой — flush() должен её записать
+        self._persisted = None
+        self._manual_watermark = None
+
+    def _backlog_drained(self) -> None:
+        self.drain_seconds = time.monotonic() - self._started_at
+        counters = self.backlog_counters
+        logger.info(
+            "Бэклог из {} апдейтов разобран за {:.2f} с: обработано {}, дублей {}, "
+            "отброшено {}, отвечено заглушкой {}",
+            self.backlog_size, self.drain_seconds,
+            counters[PROCESS], counters[DUPLICATE], counters[SKIP], counters[DRAIN],
+        )
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        action = self.classify(event)
+        if action == PROCESS:
+            return await handler(event, data)
+        if action == DRAIN:
+            await answer_stale(event)
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "restored_update_id": self.restored_update_id,
+            "persisted_update_id": self._persisted,
+            "backlog_size": self.backlog_size,
+            "backlog_left": self._backlog_left,
+            "drain_seconds": self.drain_seconds,
+            **{f"backlog_{name}": count for name, count in self.backlog_counters.items()},
+            **{f"total_{name}": count for name, count in self.counters.items()},
+        }
+
+
+backlog_guard = BacklogGuard()
+
+
+def setup_backlog(dp) -> None:
+    """Подключает к диспетчеру после setup_lifecycle."""
+    dp.update.outer_middleware(backlog_guard)
+    dp.shutdown.register(backlog_guard.on_shutdown)
@@ -0,0 +1,171 @@
+"""
+Разбор бэклога после простоя (backlog.py) при разных BACKLOG_POLICY.
+
+Моделируется падение: бот лежал --outage минут, за это время пользователи
+прошли воронку (даты апдейтов равномерно по окну простоя), а первые
+--redelivered апдейтов уже были обработаны до падения — Telegram присылает
+их снова, граница сохранена в app_meta. Для каждой политики печатается
+время разбора бэклога, счётчики BacklogGuard и число вызовов Bot API.
+
+Затем проверяется рестарт после сброса счётчика update_id: граница в
+app_meta выше пришедших id. В бэклоге не новее границы — дубли, после
+бэклога такие апдейты обрабатываются и граница перезаписывается; при
+расхождении код выхода 1.
+
+    python -m benchmarks.bench_backlog --users 100 --outage 30 --max-age 10
+    DATABASE_URL=sqlite+aiosqlite:////tmp/bench.db python -m benchmarks.bench_backlog
+
+Telegram — FakeTelegramAPI, БД — из DATABASE_URL (по умолчанию in-memory SQLite).
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+from benchmarks.fake_telegram_api import FakeTelegramAPI
+
+POLICIES = ("all", "skip", "drain")
+
+
+def backdate(updates: List[Dict[str, Any]], outage: float) -> None:
+    """Равномерно раскладывает даты апдейтов по окну простоя."""
+    now = time.time()
+    for index, raw in enumerate(updates):
+        date = int(now - outage * (1 - index / len(updates)))
+        event = raw.get("message") or raw["callback_query"]["message"]
+        event["date"] = date
+
+
+async def store_watermark(update_id: int, at: float) -> None:
+    from sqlalchemy import delete
+
+    import backlog
+    from database import engine
+    from models import AppMeta
+
+    async with engine.begin() as conn:
+        await conn.execute(delete(AppMeta).where(AppMeta.key == backlog.POLLING_OFFSET_KEY))
+        await conn.execute(AppMeta.__table__.insert().values(
+            key=backlog.POLLING_OFFSET_KEY,
+            value=json.dumps({"update_id": update_id, "at": at}),
+        ))
+
+
+async def run_policy(fake: FakeTelegramAPI, bot, policy: str, args: argparse.Namespace) -> None:
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from aiogram.types import Update
+
+    import backlog
+    import cluster
+    import lifecycle
+    from benchmarks.funnel_load import cleanup_users, generate_updates
+    from main import dp
+
+    await cleanup_users(args.users)
+    dp.fsm.storage = MemoryStorage()
+    raw_updates = generate_updates(args.users)
+    backdate(raw_updates, args.outage * 60)
+    await store_watermark(args.redelivered, time.time() - args.outage * 60)
+
+    fake.calls.clear()
+    fake.pending_update_count = len(raw_updates)
+    guard = backlog.BacklogGuard(policy=policy, max_age_minutes=args.max_age, flush_interval=3600)
+    await guard.start(bot)
+
+    async def feed(update: Update, data: Dict[str, Any]) -> Any:
+        return await dp.feed_update(bot, update)
+
+    updates = [Update.model_validate(raw, context={"bot": bot}) for raw in raw_updates]
+    serializer = cluster._PerUserSerializer()
+    started = time.perf_counter()
+    for update in updates:
+        serializer.submit(cluster.shard_key(update), guard(feed, update, {}))
+    while serializer.tasks:
+        await asyncio.wait(set(serializer.tasks))
+    await lifecycle.flush_background(60)
+    elapsed = time.perf_counter() - started
+    await guard.stop()
+
+    stats = guard.stats()
+    api_calls = sum(count for method, count in fake.calls.items() if method not in ("getwebhookinfo", "n8n"))
+    print(
+        f"{policy:<6} бэклог {stats['backlog_size']} за {elapsed:.2f} с: "
+        f"обработано {stats['backlog_process']}, дублей {stats['backlog_duplicate']}, "
+        f"отброшено {stats['backlog_skip']}, заглушек {stats['backlog_drain']}; "
+        f"вызовов Bot API {api_calls}, сохранён update_id {stats['persisted_update_id']}"
+    )
+
+
+async def check_counter_reset(fake: FakeTelegramAPI, bot) -> bool:
+    """Рестарт с сохранённой границей выше пришедших update_id."""
+    from aiogram.types import Update
+
+    import backlog
+    from benchmarks.funnel_load import LOAD_TG_ID_BASE, build_update
+
+    def update(update_id: int) -> Update:
+        return Update.model_validate(build_update(update_id, LOAD_TG_ID_BASE, "text", "/start"), context={"bot": bot})
+
+    await store_watermark(1000, time.time())
+    fake.pending_update_count = 3
+    guard = backlog.BacklogGuard(policy="all", flush_interval=3600)
+    await guard.start(bot, external_watermark=True)
+    actions = []
+    # Бэклог: 999 и 1000 уже обработаны до рестарта, 1001 — нет; затем счётчик сброшен
+    for update_id in (999, 1000, 1001, 5, 6):
+        actions.append(guard.classify(update(update_id)))
+        guard.mark_done(update_id)
+    persisted = await guard.flush()
+    await guard.stop()
+
+    expected = [backlog.DUPLICATE, backlog.DUPLICATE, backlog.PROCESS, backlog.PROCESS, backlog.PROCESS]
+    ok = actions == expected and persisted == 6
+    print(f"\nсброс счётчика update_id: {actions}, сохранён update_id {persisted} — {'OK' if ok else 'ОШИБКА'}")
+    return ok
+
+
+async def run(args: argparse.Namespace) -> bool:
+    fake = FakeTelegramAPI(latency=args.api_latency)
+    base_url = await fake.start()
+    os.environ["TELEGRAM_API_BASE_URL"] = base_url
+    os.environ["N8N_WEBHOOK_URL"] = f"{base_url}/n8n"
+    os.environ.setdefault("BOT_TOKEN", "42:FAKE")
+    os.environ.pop("PROXY_URL", None)
+    os.environ.pop("PROXY_URLS", None)
+
+    from benchmarks.funnel_load import cleanup_users, ensure_quizzes
+    from database import engine, init_db
+    from main import create_bot, dp, setup_routers
+
+    await init_db()
+    await ensure_quizzes()
+    setup_routers(dp)
+    bot = await create_bot()
+    try:
+        for policy in args.policies:
+            await run_policy(fake, bot, policy, args)
+        return await check_counter_reset(fake, bot)
+    finally:
+        await cleanup_users(args.users)
+        await bot.session.close()
+        await engine.dispose()
+        await fake.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--outage", type=float, default=30, help="длительность простоя, мин")
+    parser.add_argument("--max-age", type=float, default=10, help="BACKLOG_MAX_AGE_MINUTES")
+    parser.add_argument("--redelivered", type=int, default=100, help="апдейтов, обработанных до падения")
+    parser.add_argument("--policies", nargs="+", choices=POLICIES, default=list(POLICIES))
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа фейкового API, с")
+    args = parser.parse_args()
+    os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+    raise SystemExit(0 if asyncio.run(run(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
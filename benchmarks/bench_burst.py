@@ -0,0 +1,124 @@
+"""
+Всплеск /start: все апдейты приходят одновременно, пул БД маленький.
+Без ограничения каждый апдейт сразу встаёт в очередь пула и часть падает
+по pool timeout; с ConcurrencyLimiterMiddleware лишние апдейты ждут до
+обработчиков, а переполнение очереди отклоняется ответом о перегрузке.
+
+    python -m benchmarks.bench_burst --users 2000 --limits 0 4 --pool-size 4 --pool-timeout 2
+
+--limits 0 — без ограничения. Telegram — FakeTelegramAPI, БД — из
+DATABASE_URL (по умолчанию in-memory SQLite).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import Any, Dict, List
+
+from benchmarks.fake_telegram_api import FakeTelegramAPI
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_once(bot, users: int, limit: int, max_queued: int) -> None:
+    from aiogram.types import Update
+
+    import lifecycle
+    from benchmarks.funnel_load import LOAD_TG_ID_BASE, build_update, cleanup_users
+    from main import dp
+    from middlewares.concurrency_limiter_middleware import ConcurrencyLimiterMiddleware
+
+    await cleanup_users(users)
+    limiter = ConcurrencyLimiterMiddleware(max_concurrent=limit, max_queued=max_queued, policy="shed") if limit else None
+    updates = [
+        Update.model_validate(build_update(index + 1, LOAD_TG_ID_BASE + index, "text", "/start"), context={"bot": bot})
+        for index in range(users)
+    ]
+    latencies: List[float] = []
+    errors = 0
+
+    async def feed(update: Update, data: Dict[str, Any]) -> Any:
+        return await dp.feed_update(bot, update)
+
+    async def one(update: Update) -> None:
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            if limiter:
+                await limiter(feed, update, {})
+            else:
+                await feed(update, {})
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(update) for update in updates))
+    elapsed = time.perf_counter() - started
+    # Фоновые записи событий должны закончиться до cleanup_users
+    await lifecycle.flush_background(60)
+
+    name = f"limit={limit}" if limit else "без ограничения"
+    shed = ""
+    if limiter:
+        stats = limiter.stats()
+        shed = f", отклонено {stats['shed_full'] + stats['shed_timeout']}, пик очереди {stats['peak_queued']}"
+    print(
+        f"{name:<16} {users} /start за {elapsed:.2f} с: ошибок {errors}{shed}; "
+        f"задержка p50 {statistics.median(latencies) * 1000:.0f} мс, "
+        f"p95 {percentile(latencies, 0.95) * 1000:.0f} мс, max {max(latencies) * 1000:.0f} мс"
+    )
+
+
+async def run(args: argparse.Namespace) -> None:
+    fake = FakeTelegramAPI(latency=args.api_latency)
+    base_url = await fake.start()
+    os.environ["TELEGRAM_API_BASE_URL"] = base_url
+    os.environ["N8N_WEBHOOK_URL"] = f"{base_url}/n8n"
+    os.environ.setdefault("BOT_TOKEN", "42:FAKE")
+    os.environ.pop("PROXY_URL", None)
+    os.environ.pop("PROXY_URLS", None)
+
+    from benchmarks.funnel_load import cleanup_users
+    from database import engine, init_db
+    from main import create_bot, dp, setup_routers
+
+    await init_db()
+    setup_routers(dp)
+    bot = await create_bot()
+    try:
+        for limit in args.limits:
+            await run_once(bot, args.users, limit, args.max_queued)
+    finally:
+        await cleanup_users(args.users)
+        await bot.session.close()
+        await engine.dispose()
+        await fake.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--limits", type=int, nargs="+", default=[0, 4], help="MAX_CONCURRENT_UPDATES; 0 — без ограничения")
+    parser.add_argument("--max-queued", type=int, default=1000)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--pool-timeout", type=float, default=2)
+    parser.add_argument("--api-latency", type=float, default=0.02, help="задержка ответа фейкового API, с")
+    args = parser.parse_args()
+    os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+    os.environ["DB_POOL_SIZE"] = str(args.pool_size)
+    os.environ["DB_MAX_OVERFLOW"] = "0"
+    os.environ["DB_POOL_TIMEOUT"] = str(args.pool_timeout)
+    # Ограничитель диспетчера не должен мешать сравнению: лимит задаётся здесь
+    os.environ["MAX_CONCURRENT_UPDATES"] = "1000000"
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
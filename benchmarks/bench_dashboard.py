@@ -0,0 +1,141 @@
+"""
+Служебная панель (admin_dashboard.py) под частым опросом.
+
+Сначала --users пользователей проходят воронку (как bench_funnel_offline),
+затем сравнивается:
+- пересчёт воронки по user_events (funnel.py, как analytics_funnel.sql)
+  и по user_progress (то, что раз в ADMIN_FUNNEL_REFRESH делает панель);
+- --polls запросов к /api/funnel, /api/health и / от --pollers клиентов:
+  первый запрос каждого клиента — полный ответ, дальше с If-None-Match.
+  Считаются ответы 304 и SQL-запросы к БД за время опроса (должно быть 0).
+
+    python -m benchmarks.bench_dashboard --users 200 --polls 3000
+
+Telegram — FakeTelegramAPI, БД — из DATABASE_URL (по умолчанию in-memory SQLite).
+"""
+import argparse
+import asyncio
+import os
+import socket
+import time
+from collections import Counter
+from typing import Dict
+
+import aiohttp
+
+from benchmarks.fake_telegram_api import FakeTelegramAPI
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def poll(base_url: str, polls: int, pollers: int) -> Counter:
+    statuses: Counter = Counter()
+    paths = ("/api/funnel", "/api/health", "/")
+
+    async def client(count: int) -> None:
+        etags: Dict[str, str] = {}
+        async with aiohttp.ClientSession() as session:
+            for index in range(count):
+                path = paths[index % len(paths)]
+                headers = {"If-None-Match": etags[path]} if path in etags else {}
+                async with session.get(base_url + path, headers=headers) as response:
+                    await response.read()
+                    statuses[response.status] += 1
+                    if "ETag" in response.headers:
+                        etags[path] = response.headers["ETag"]
+
+    await asyncio.gather(*(client(polls // pollers) for _ in range(pollers)))
+    return statuses
+
+
+async def run(args: argparse.Namespace) -> None:
+    fake = FakeTelegramAPI()
+    base_url = await fake.start()
+    os.environ["TELEGRAM_API_BASE_URL"] = base_url
+    os.environ["N8N_WEBHOOK_URL"] = f"{base_url}/n8n"
+    os.environ.setdefault("BOT_TOKEN", "42:FAKE")
+    os.environ.pop("PROXY_URL", None)
+    os.environ.pop("PROXY_URLS", None)
+
+    from aiogram.types import Update
+    from sqlalchemy import event
+
+    import cluster
+    import funnel
+    import lifecycle
+    from admin_dashboard import AdminDashboard, funnel_snapshot
+    from benchmarks.funnel_load import cleanup_users, ensure_quizzes, generate_updates
+    from database import engine, init_db, read_session
+    from main import create_bot, dp, setup_routers
+
+    await init_db()
+    await ensure_quizzes()
+    await cleanup_users(args.users)
+    setup_routers(dp)
+    bot = await create_bot()
+
+    serializer = cluster._PerUserSerializer()
+    for raw in generate_updates(args.users):
+        update = Update.model_validate(raw, context={"bot": bot})
+        serializer.submit(cluster.shard_key(update), dp.feed_update(bot, update))
+    while serializer.tasks:
+        await asyncio.wait(set(serializer.tasks))
+    await lifecycle.flush_background(60)
+
+    started = time.perf_counter()
+    async with read_session() as db:
+        await funnel.funnel_counts(db)
+        await funnel.duration_percentiles(db)
+    by_events = time.perf_counter() - started
+    started = time.perf_counter()
+    await funnel_snapshot()
+    by_progress = time.perf_counter() - started
+    print(f"пересчёт воронки: по user_events {by_events * 1000:.0f} мс, по user_progress {by_progress * 1000:.0f} мс")
+
+    queries = 0
+
+    def count_query(*_args) -> None:
+        nonlocal queries
+        queries += 1
+
+    port = free_port()
+    dashboard = AdminDashboard(host="127.0.0.1", port=port, token="", funnel_refresh=3600, health_refresh=args.health_refresh)
+    await dashboard.start(bot)
+    await dashboard.refresh_funnel()
+
+    event.listen(engine.sync_engine, "before_cursor_execute", count_query)
+    started = time.perf_counter()
+    statuses = await poll(f"http://127.0.0.1:{port}", args.polls, args.pollers)
+    elapsed = time.perf_counter() - started
+    event.remove(engine.sync_engine, "before_cursor_execute", count_query)
+
+    total = sum(statuses.values())
+    print(
+        f"опрос: {total} запросов от {args.pollers} клиентов за {elapsed:.2f} с ({total / elapsed:.0f} req/s), "
+        f"ответы {dict(statuses)}, 304 — {100.0 * statuses[304] / total:.0f}%, SQL-запросов к БД: {queries}"
+    )
+
+    await dashboard.stop()
+    await cleanup_users(args.users)
+    await bot.session.close()
+    await engine.dispose()
+    await fake.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--polls", type=int, default=3000)
+    parser.add_argument("--pollers", type=int, default=10)
+    parser.add_argument("--health-refresh", type=float, default=5, help="ADMIN_HEALTH_REFRESH, с")
+    args = parser.parse_args()
+    os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
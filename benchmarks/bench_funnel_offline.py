@@ -0,0 +1,143 @@
+"""
+Полный проход воронки всеми обработчиками в одном процессе без внешних
+сервисов: Telegram — FakeTelegramAPI, БД — SQLite (по умолчанию in-memory).
+Годится как регрессионный тест производительности на любой машине.
+
+    python -m benchmarks.bench_funnel_offline --users 200
+    DATABASE_URL=sqlite+aiosqlite:////tmp/bench.db python -m benchmarks.bench_funnel_offline
+    python -m benchmarks.bench_funnel_offline --trace file   # + python -m tracing
+
+Апдейты одного пользователя обрабатываются строго по порядку, разных —
+параллельно (как у воркера кластера). В конце печатается воронка (funnel.py),
+посчитанная по записанным событиям.
+"""
+import argparse
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.fake_telegram_api import FakeTelegramAPI
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def report_callback_latency(updates: List[Any], timings: Dict[int, Tuple[float, float]], answered_at: Dict[str, float]) -> None:
+    """
+    Нажатия кнопок: через сколько гаснут «часики» (ответ answerCallbackQuery
+    дошёл до API) и сколько работает обработчик целиком — столько они
+    крутились, пока обработчики отвечали в конце.
+    """
+    spinner: List[float] = []
+    handler: List[float] = []
+    for update in updates:
+        if update.callback_query is None or update.update_id not in timings:
+            continue
+        update_started, finished = timings[update.update_id]
+        handler.append(finished - update_started)
+        answered = answered_at.get(update.callback_query.id)
+        if answered is not None:
+            spinner.append(answered - update_started)
+    if not handler:
+        return
+    print(
+        f"нажатия ({len(handler)}): ответ на нажатие p50 {percentile(spinner, 0.5) * 1000:.0f} мс, "
+        f"p95 {percentile(spinner, 0.95) * 1000:.0f} мс; обработчик целиком p50 "
+        f"{percentile(handler, 0.5) * 1000:.0f} мс, p95 {percentile(handler, 0.95) * 1000:.0f} мс"
+    )
+
+
+async def run(users: int, api_latency: float, trace: str) -> None:
+    fake = FakeTelegramAPI(latency=api_latency)
+    base_url = await fake.start()
+    os.environ["TELEGRAM_API_BASE_URL"] = base_url
+    os.environ["N8N_WEBHOOK_URL"] = f"{base_url}/n8n"
+    if trace:
+        # Все трассы, коллектор OTLP — сам FakeTelegramAPI
+        os.environ["TRACE_EXPORTER"] = trace
+        os.environ.setdefault("TRACE_SAMPLE_RATE", "1")
+        os.environ["TRACE_OTLP_ENDPOINT"] = f"{base_url}/v1/traces"
+    os.environ.setdefault("BOT_TOKEN", "42:FAKE")
+    os.environ.pop("PROXY_URL", None)
+    os.environ.pop("PROXY_URLS", None)
+
+    from aiogram.types import Update
+
+    import cluster
+    import funnel
+    import lifecycle
+    import messaging
+    import tracing
+    import user_profile
+    from benchmarks.funnel_load import cleanup_users, ensure_quizzes, generate_updates
+    from database import engine, init_db, read_session
+    from main import create_bot, dp, setup_routers
+
+    await init_db()
+    await ensure_quizzes()
+    await cleanup_users(users)
+    setup_routers(dp)
+    bot = await create_bot()
+    await tracing.start_tracing()
+
+    updates = [Update.model_validate(raw, context={"bot": bot}) for raw in generate_updates(users)]
+    serializer = cluster._PerUserSerializer()
+
+    # update_id -> (начало, конец обработки) по time.monotonic(), как answered_at у FakeTelegramAPI
+    timings: Dict[int, Tuple[float, float]] = {}
+
+    async def feed(update: Update) -> None:
+        update_started = time.monotonic()
+        try:
+            await dp.feed_update(bot, update)
+        finally:
+            timings[update.update_id] = (update_started, time.monotonic())
+
+    started = time.perf_counter()
+    for update in updates:
+        serializer.submit(cluster.shard_key(update), feed(update))
+    while serializer.tasks:
+        await asyncio.wait(set(serializer.tasks))
+    # Записи событий идут в фоне (analytics.log_event_nowait)
+    await lifecycle.flush_background(60)
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"{engine.dialect.name}: {len(updates)} апдейтов ({users} пользователей) за {elapsed:.2f} с — "
+        f"{len(updates) / elapsed:.0f} upd/s, вызовов API: {sum(fake.calls.values())}"
+    )
+    print(f"снимок профиля: {user_profile.stats()}")
+    print(f"фото с текстом: {messaging.stats()}")
+    report_callback_latency(updates, timings, fake.answered_at)
+    if trace:
+        await tracing.exporter.stop()
+        print(f"трассировка: {tracing.exporter.stats()}, span'ов в OTLP-коллекторе: {fake.otlp_spans}")
+
+    async with read_session() as db:
+        counts = await funnel.funnel_counts(db)
+    for name, value in counts.items():
+        print(f"  {name:<30} {value}")
+
+    await cleanup_users(users)
+    await bot.session.close()
+    await engine.dispose()
+    await fake.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа фейкового API, с")
+    parser.add_argument("--trace", choices=("file", "otlp"), default="", help="включить трассировку (tracing.py)")
+    args = parser.parse_args()
+    os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+    asyncio.run(run(args.users, args.api_latency, args.trace))
+
+
+if __name__ == "__main__":
+    main()
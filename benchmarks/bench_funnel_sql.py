@@ -0,0 +1,197 @@
+"""
+Запросы analytics_funnel.sql под EXPLAIN (ANALYZE, BUFFERS) на Postgres.
+
+Файл разбивается на блоки: комментарий-заголовок и следующий за ним запрос
+до «;» (закомментированные запросы не выполняются). Каждый блок
+выполняется --runs раз после --warmup прогревочных; в результат идут
+время выполнения и планирования (медиана и минимум), буферы (shared
+hit/read, temp) и план медианного прогона.
+
+С --output результат дописывается JSON-строкой (вместе с числом строк
+users/user_events, версией сервера и work_mem), с --baseline —
+сравнивается с последней записью такого файла: медиана блока выросла
+больше чем на --threshold — регрессия, код выхода 1.
+
+    python -m benchmarks.synthetic_events --events 10000000 --seed 1
+    python -m benchmarks.bench_funnel_sql --output funnel_sql.jsonl
+    # ... индексы / правки запросов ...
+    python -m benchmarks.bench_funnel_sql --baseline funnel_sql.jsonl --output funnel_sql.jsonl
+
+DATABASE_URL должен указывать на Postgres.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import asyncpg
+
+from migrate_sqlite_to_pg import pg_dsn
+
+SQL_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "analytics_funnel.sql")
+
+BUFFER_KEYS = ("Shared Hit Blocks", "Shared Read Blocks", "Temp Read Blocks", "Temp Written Blocks")
+
+
+def query_blocks(text: str) -> List[Tuple[str, str]]:
+    """(заголовок, запрос) для каждого незакомментированного запроса файла."""
+    blocks: List[Tuple[str, str]] = []
+    title = ""
+    lines: List[str] = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("--"):
+            if not lines:
+                title = stripped.lstrip("- ").strip()
+            continue
+        if not stripped and not lines:
+            continue
+        lines.append(line)
+        if stripped.endswith(";"):
+            blocks.append((title or f"block_{len(blocks) + 1}", "\n".join(lines).rstrip().rstrip(";")))
+            title = ""
+            lines = []
+    return blocks
+
+
+def summarize(plans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    execution = [plan["Execution Time"] for plan in plans]
+    planning = [plan["Planning Time"] for plan in plans]
+    median_index = execution.index(sorted(execution)[len(execution) // 2])
+    plan = plans[median_index]
+    # Буферы корневого узла уже включают буферы дочерних
+    buffers = {key: plan["Plan"].get(key, 0) for key in BUFFER_KEYS}
+    return {
+        "execution_ms_median": round(statistics.median(execution), 3),
+        "execution_ms_min": round(min(execution), 3),
+        "planning_ms_median": round(statistics.median(planning), 3),
+        "rows": plan["Plan"].get("Actual Rows"),
+        "buffers": buffers,
+        "root_node": plan["Plan"]["Node Type"],
+        "plan": plan,
+    }
+
+
+async def explain(pg: asyncpg.Connection, sql: str) -> Dict[str, Any]:
+    raw = await pg.fetchval(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")
+    return (json.loads(raw) if isinstance(raw, str) else raw)[0]
+
+
+async def run_blocks(pg: asyncpg.Connection, blocks: List[Tuple[str, str]], runs: int, warmup: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    for title, sql in blocks:
+        for _ in range(warmup):
+            await explain(pg, sql)
+        plans = [await explain(pg, sql) for _ in range(runs)]
+        results[title] = summarize(plans)
+        item = results[title]
+        print(
+            f"{title[:60]:<60} медиана {item['execution_ms_median']:10.1f} мс  мин {item['execution_ms_min']:10.1f} мс  "
+            f"план {item['planning_ms_median']:6.1f} мс  hit {item['buffers']['Shared Hit Blocks']:>9}  "
+            f"read {item['buffers']['Shared Read Blocks']:>9}  temp {item['buffers']['Temp Written Blocks']:>8}",
+            flush=True,
+        )
+    return results
+
+
+async def environment(pg: asyncpg.Connection) -> Dict[str, Any]:
+    return {
+        "server_version": await pg.fetchval("SHOW server_version"),
+        "work_mem": await pg.fetchval("SHOW work_mem"),
+        "shared_buffers": await pg.fetchval("SHOW shared_buffers"),
+        "users": await pg.fetchval("SELECT COUNT(*) FROM users"),
+        "user_events": await pg.fetchval("SELECT COUNT(*) FROM user_events"),
+    }
+
+
+def last_record(path: str) -> Optional[Dict[str, Any]]:
+    record = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+    return record
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Блоки, медиана которых выросла больше чем на threshold (доля) относительно baseline."""
+    print(
+        f"\nСравнение с {baseline.get('label') or baseline['started_at']} "
+        f"(user_events {baseline['environment']['user_events']} -> {current['environment']['user_events']}):"
+    )
+    regressions = []
+    for title, item in current["blocks"].items():
+        before = baseline["blocks"].get(title)
+        if before is None:
+            print(f"  {title[:60]:<60} нет в baseline")
+            continue
+        old, new = before["execution_ms_median"], item["execution_ms_median"]
+        change = (new - old) / old if old else 0.0
+        plan_changed = before["root_node"] != item["root_node"]
+        mark = "РЕГРЕССИЯ" if change > threshold else ""
+        print(
+            f"  {title[:60]:<60} {old:10.1f} -> {new:10.1f} мс ({change:+.0%})"
+            f"{'  план изменился' if plan_changed else ''}  {mark}"
+        )
+        if change > threshold:
+            regressions.append(title)
+    return regressions
+
+
+async def run(args: argparse.Namespace, database_url: str) -> int:
+    with open(args.sql, encoding="utf-8") as f:
+        blocks = query_blocks(f.read())
+    if args.only:
+        blocks = [block for block in blocks if any(part.lower() in block[0].lower() for part in args.only)]
+
+    pg = await asyncpg.connect(pg_dsn(database_url))
+    try:
+        env = await environment(pg)
+        print(
+            f"Postgres {env['server_version']}, work_mem {env['work_mem']}, "
+            f"users {env['users']}, user_events {env['user_events']}, блоков {len(blocks)}\n"
+        )
+        record = {
+            "label": args.label,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "environment": env,
+            "runs": args.runs,
+            "blocks": await run_blocks(pg, blocks, args.runs, args.warmup),
+        }
+    finally:
+        await pg.close()
+
+    regressions: List[str] = []
+    if args.baseline and os.path.exists(args.baseline):
+        baseline = last_record(args.baseline)
+        if baseline:
+            regressions = compare(record, baseline, args.threshold)
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return 1 if regressions else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sql", default=SQL_FILE, help="файл с запросами")
+    parser.add_argument("--only", nargs="+", help="только блоки, в заголовке которых есть эти слова")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1, help="прогонов до замеров (прогрев кэша)")
+    parser.add_argument("--label", help="метка прогона в --output, например 'idx_user_code_time'")
+    parser.add_argument("--output", help="файл для дописывания результатов (JSON lines)")
+    parser.add_argument("--baseline", help="JSON lines прошлых прогонов, сравнение с последним")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимый рост медианы, доля")
+    args = parser.parse_args()
+
+    database_url = os.getenv("DATABASE_URL", "")
+    if not database_url.startswith("postgresql"):
+        raise SystemExit("DATABASE_URL должен указывать на Postgres (postgresql+asyncpg://...)")
+    raise SystemExit(asyncio.run(run(args, database_url)))
+
+
+if __name__ == "__main__":
+    main()
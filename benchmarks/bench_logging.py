@@ -0,0 +1,125 @@
+"""
+Стоимость логирования на апдейт: прежняя схема (синхронный текстовый sink,
+f-строки) против logging_setup (фоновый поток, JSON в файл, sampled()).
+
+На апдейт пишутся три сообщения, как на горячем пути воронки: ответ на
+вопрос квиза, "Записано событие…" и "Пользователь … запустил бота".
+Между апдейтами --idle секунд простоя (обработчик ждёт БД и Telegram) —
+в это время пишет фоновый поток. Замеряется только время самих вызовов
+логгера (то, что платит обработчик) и полное время до записи очереди.
+
+Второй прогон — медленный sink (--slow-write секунд на запись, как stderr
+в забитый pipe сборщика логов): синхронная запись ждёт его в обработчике.
+
+    python -m benchmarks.bench_logging --updates 20000 --idle 0.0002
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from typing import Callable
+
+from loguru import logger
+
+import logging_setup
+
+
+def legacy_update(update_id: int) -> None:
+    weights = (1, 0, 0)
+    logger.info(f"Quiz {update_id}: вопрос 3, ответ q3_impostor, веса {weights}")
+    logger.info(f"Записано событие quiz_answer для пользователя {1_900_000_000 + update_id}")
+    logger.info(f"Пользователь {1_900_000_000 + update_id} запустил бота")
+
+
+def make_sampled_update(rate: float) -> Callable[[int], None]:
+    answer_log = logging_setup.SampledLog("bench.answer", rate=rate)
+    event_log = logging_setup.SampledLog("bench.event", rate=rate)
+    start_log = logging_setup.SampledLog("bench.start", rate=rate)
+
+    def sampled_update(update_id: int) -> None:
+        weights = (1, 0, 0)
+        answer_log.info("Quiz {}: вопрос {}, ответ {}, веса {}", update_id, 3, "q3_impostor", weights)
+        event_log.info("Записано событие {} для пользователя {}", "quiz_answer", 1_900_000_000 + update_id)
+        start_log.info("Пользователь {} запустил бота", 1_900_000_000 + update_id)
+
+    sampled_update.logs = (answer_log, event_log, start_log)
+    return sampled_update
+
+
+class SlowStream(io.StringIO):
+    """Поток, каждая запись в который занимает delay секунд."""
+
+    def __init__(self, delay: float) -> None:
+        super().__init__()
+        self.delay = delay
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay)
+        return len(text)
+
+
+def measure(name: str, fn: Callable[[int], None], updates: int, idle: float, path: str = "") -> float:
+    started = time.perf_counter()
+    in_logger = 0.0
+    for update_id in range(updates):
+        call_started = time.perf_counter()
+        fn(update_id)
+        in_logger += time.perf_counter() - call_started
+        if idle:
+            time.sleep(idle)
+    logging_setup.flush_logging()
+    total = time.perf_counter() - started
+    size = f", файл {os.path.getsize(path) / 1024:.0f} КБ" if path and os.path.exists(path) else ""
+    per_update = in_logger / updates * 1e6
+    print(f"  {name:<44} {per_update:8.1f} мкс/апдейт в обработчике, всего {total:.2f} с{size}")
+    return per_update
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--idle", type=float, default=0.0002, help="простой обработчика между апдейтами, с")
+    parser.add_argument("--slow-write", type=float, default=0.0005, help="время записи в медленный sink, с")
+    parser.add_argument("--slow-updates", type=int, default=1000)
+    args = parser.parse_args()
+
+    rate = logging_setup.LOG_HOT_RATE
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Файл на диске, простой {args.idle * 1e6:.0f} мкс между апдейтами:")
+        path = os.path.join(tmp, "legacy.log")
+        logger.remove()
+        logger.add(path, level="INFO")
+        legacy = measure("синхронный sink, f-строки", legacy_update, args.updates, args.idle, path)
+
+        path = os.path.join(tmp, "background.log")
+        logging_setup.setup_logging(log_file=path, console=False)
+        background = measure("фоновый поток + JSON, без сэмплирования", make_sampled_update(0), args.updates, args.idle, path)
+
+        path = os.path.join(tmp, "sampled.log")
+        logging_setup.setup_logging(log_file=path, console=False)
+        sampled_update = make_sampled_update(rate)
+        sampled = measure(f"фоновый поток + JSON, sampled ({rate:g}/с на ключ)", sampled_update, args.updates, args.idle, path)
+        dropped = sum(log.dropped for log in sampled_update.logs)
+        print(f"  отброшено сэмплированием: {dropped} из {3 * args.updates}")
+        print(f"  в обработчике: фоновый поток x{legacy / background:.1f}, с сэмплированием x{legacy / sampled:.1f}")
+
+    print(f"Медленный sink ({args.slow_write * 1e6:.0f} мкс на запись), {args.slow_updates} апдейтов:")
+    stream = SlowStream(args.slow_write)
+    logger.remove()
+    logger.add(stream, level="INFO")
+    slow_legacy = measure("синхронный sink, f-строки", legacy_update, args.slow_updates, args.idle)
+
+    logging_setup.setup_logging(console=True, log_file="")
+    original_stderr, sys.stderr = sys.stderr, stream
+    try:
+        slow_background = measure("фоновый поток, без сэмплирования", make_sampled_update(0), args.slow_updates, args.idle)
+    finally:
+        sys.stderr = original_stderr
+        logger.remove()
+    print(f"  в обработчике: фоновый поток x{slow_legacy / slow_background:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Микробенчмарк квиза: маршрутизация ответа и подсчёт баллов.
+БД и Telegram не нужны.
+
+    python -m benchmarks.bench_quiz_engine --iterations 200000
+
+Маршрутизация: прежняя схема — пять обработчиков q1_..q5_, у каждого
+фильтр F.data.startswith("qN_") и свой State, aiogram проверяет их по
+очереди до совпадения; quiz_engine — один фильтр F.data.func(is_answer)
+и поиск маршрута в dict.
+Подсчёт: прежняя цепочка if/elif с +1 и max(scores, key=scores.get)
+против суммы векторов весов и QuizDefinition.dominant.
+Перед замером проверяется, что для всех 3^5 наборов ответов доминирующий
+сценарий совпадает с прежним.
+"""
+import argparse
+import itertools
+import time
+from typing import Callable, Dict, List, Sequence
+
+from aiogram import F
+
+from quiz_definitions import MAIN_PSYCH_QUIZ
+from quiz_engine import is_answer
+
+QUIZ = MAIN_PSYCH_QUIZ
+OLD_STATES = [f"QuizStates:question_{n}" for n in range(1, len(QUIZ.questions) + 1)]
+OLD_FILTERS = [(F.data.startswith(f"q{n}_"), OLD_STATES[n - 1]) for n in range(1, len(QUIZ.questions) + 1)]
+NEW_FILTER = F.data.func(is_answer)
+
+
+class _Callback:
+    def __init__(self, data: str) -> None:
+        self.data = data
+
+
+def old_route(callback: _Callback, state: str):
+    for magic, required_state in OLD_FILTERS:
+        if magic.resolve(callback) and state == required_state:
+            return callback.data.split("_", 1)[1]
+    return None
+
+
+def new_route(callback: _Callback, state: str):
+    if NEW_FILTER.resolve(callback) and state == "QuizStates:answering":
+        return QUIZ.route(callback.data)
+    return None
+
+
+def old_dominant(answers: Sequence[str]) -> str:
+    scores = {"impostor": 0, "seeker": 0, "eternal_student": 0}
+    for data in answers:
+        answer = data.split("_", 1)[1]
+        if answer == "impostor":
+            scores["impostor"] += 1
+        elif answer == "seeker":
+            scores["seeker"] += 1
+        elif answer == "eternal_student":
+            scores["eternal_student"] += 1
+    return max(scores, key=scores.get)
+
+
+def new_dominant(answers: Sequence[str]) -> str:
+    return QUIZ.dominant(QUIZ.totals(answers))
+
+
+def all_answer_sets() -> List[List[str]]:
+    per_question = [[QUIZ.callback_data(i, a) for a in q.answers] for i, q in enumerate(QUIZ.questions)]
+    return [list(combo) for combo in itertools.product(*per_question)]
+
+
+def bench(name: str, fn: Callable[[], object], iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    per_call = (time.perf_counter() - started) / iterations * 1e9
+    print(f"  {name:<32} {per_call:8.0f} нс/вызов")
+    return per_call
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200_000)
+    args = parser.parse_args()
+
+    answer_sets = all_answer_sets()
+    mismatches = [s for s in answer_sets if old_dominant(s) != new_dominant(s)]
+    print(f"Проверено наборов ответов: {len(answer_sets)}, расхождений с прежним подсчётом: {len(mismatches)}")
+    if mismatches:
+        raise SystemExit(f"Пример расхождения: {mismatches[0]}")
+
+    # Худший случай прежней схемы — ответ на последний вопрос
+    last = _Callback(QUIZ.callback_data(len(QUIZ.questions) - 1, QUIZ.questions[-1].answers[0]))
+    results: Dict[str, float] = {}
+    print("Маршрутизация ответа на последний вопрос:")
+    results["old_route"] = bench("пять фильтров startswith + State", lambda: old_route(last, OLD_STATES[-1]), args.iterations)
+    results["new_route"] = bench("is_answer + dict", lambda: new_route(last, "QuizStates:answering"), args.iterations)
+
+    sample = answer_sets[len(answer_sets) // 2]
+    print("Подсчёт доминирующего сценария (5 ответов):")
+    results["old_score"] = bench("if/elif + max", lambda: old_dominant(sample), args.iterations)
+    results["new_score"] = bench("матрица весов + dominant", lambda: new_dominant(sample), args.iterations)
+
+    print(
+        f"Ускорение: маршрутизация x{results['old_route'] / results['new_route']:.1f}, "
+        f"подсчёт x{results['old_score'] / results['new_score']:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
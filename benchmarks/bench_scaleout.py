@@ -0,0 +1,92 @@
+"""
+Масштабирование кластера (cluster.py): время прохождения воронки
+синтетическими пользователями при 1, 2, 4 и 8 воркерах.
+
+Telegram подменяется локальным FakeTelegramAPI, БД — из DATABASE_URL.
+Для честной картины нужен общий FSM (FSM_STORAGE_URL) и Postgres.
+
+    python -m benchmarks.bench_scaleout --users 500 --workers 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.fake_telegram_api import FakeTelegramAPI
+from benchmarks.funnel_load import cleanup_users, ensure_quizzes, generate_updates
+
+
+async def run_once(fake: FakeTelegramAPI, users: int, workers: int, warmup: float) -> float:
+    import cluster
+    from database import engine
+    from main import create_bot, dp
+
+    await cleanup_users(users)
+    queues, processes = cluster.start_workers(workers)
+    # Даём воркерам импортировать код и поднять сессии до начала замера
+    await asyncio.sleep(warmup)
+
+    updates = generate_updates(users)
+    fake.add_updates(updates)
+    bot = await create_bot()
+    stop = asyncio.Event()
+
+    async def stop_when_empty() -> None:
+        while fake.updates:
+            await asyncio.sleep(0.01)
+        stop.set()
+
+    started = time.perf_counter()
+    watcher = asyncio.create_task(stop_when_empty())
+    await cluster.run_ingester(bot, queues, stop, dp.resolve_used_update_types())
+    await watcher
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, cluster.stop_workers, queues, processes, 300)
+    elapsed = time.perf_counter() - started
+
+    await bot.session.close()
+    await engine.dispose()
+    print(
+        f"workers={workers}: {len(updates)} апдейтов за {elapsed:.2f} с — "
+        f"{len(updates) / elapsed:.0f} upd/s"
+    )
+    return elapsed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--api-latency", type=float, default=0.02, help="задержка ответа фейкового API, с")
+    parser.add_argument("--warmup", type=float, default=3.0)
+    args = parser.parse_args()
+
+    fake = FakeTelegramAPI(latency=args.api_latency)
+    base_url = await fake.start()
+    # Воркеры (spawn) наследуют окружение родителя
+    os.environ["TELEGRAM_API_BASE_URL"] = base_url
+    os.environ["N8N_WEBHOOK_URL"] = f"{base_url}/n8n"
+    os.environ.setdefault("BOT_TOKEN", "42:FAKE")
+    os.environ.pop("PROXY_URL", None)
+    os.environ.pop("PROXY_URLS", None)
+
+    from database import init_db
+    from main import setup_routers, dp
+
+    await init_db()
+    await ensure_quizzes()
+    setup_routers(dp)
+
+    baseline = None
+    try:
+        for workers in args.workers:
+            elapsed = await run_once(fake, args.users, workers, args.warmup)
+            baseline = baseline or elapsed
+            print(f"  ускорение x{baseline / elapsed:.2f} к первому прогону")
+    finally:
+        await cleanup_users(args.users)
+        await fake.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
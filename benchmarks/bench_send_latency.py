@@ -0,0 +1,96 @@
+"""
+Задержка sendMessage через штатную AiohttpSession и через настроенную
+сессию (telegram_session.py) на локальном FakeTelegramAPI. БД не нужна.
+
+    python -m benchmarks.bench_send_latency --requests 5000 --concurrency 100 --host localhost
+
+--host localhost заставляет резолвить имя: фейк слушает только 127.0.0.1,
+поэтому без FORCE_IPV4 каждое новое соединение сначала пробует ::1.
+--api-latency добавляет задержку ответа сервера, чтобы пул соединений
+заполнялся так же, как на настоящем Bot API.
+"""
+import argparse
+import asyncio
+import socket
+import statistics
+import time
+from typing import Callable, List
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.base import BaseSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from benchmarks.fake_telegram_api import FakeTelegramAPI
+from telegram_session import TunedAiohttpSession, connector_settings
+
+
+async def measure(session: BaseSession, requests: int, concurrency: int) -> tuple[List[float], float]:
+    bot = Bot(token="42:FAKE", session=session)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def send(i: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await bot.send_message(chat_id=1_000 + i % 100, text=f"message {i}")
+            latencies.append(time.perf_counter() - started)
+
+    # Прогрев: DNS и первые соединения пула не должны попадать в замер
+    await asyncio.gather(*(send(i) for i in range(min(concurrency, requests))))
+    latencies.clear()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    await bot.session.close()
+    return latencies, elapsed
+
+
+def _percentile(ordered: List[float], p: float) -> float:
+    return ordered[min(int(len(ordered) * p), len(ordered) - 1)] * 1000
+
+
+def report(label: str, latencies: List[float], elapsed: float) -> None:
+    ordered = sorted(latencies)
+    print(
+        f"{label:<10} {len(ordered) / elapsed:9.0f} req/s  "
+        f"mean {statistics.mean(ordered) * 1000:6.2f} ms  p50 {_percentile(ordered, 0.50):6.2f}  "
+        f"p95 {_percentile(ordered, 0.95):6.2f}  p99 {_percentile(ordered, 0.99):6.2f}  max {ordered[-1] * 1000:6.2f}"
+    )
+
+
+async def run(requests: int, concurrency: int, host: str, api_latency: float, ipv4: bool) -> None:
+    fake = FakeTelegramAPI(latency=api_latency)
+    base_url = await fake.start()
+    api = TelegramAPIServer.from_base(base_url.replace("127.0.0.1", host))
+
+    tuning = connector_settings()
+    if ipv4:
+        tuning["family"] = socket.AF_INET
+    print(f"Коннектор: {tuning}")
+
+    factories: List[tuple[str, Callable[[], BaseSession]]] = [
+        ("default", lambda: AiohttpSession(api=api)),
+        ("tuned", lambda: TunedAiohttpSession(api=api, connector=tuning)),
+    ]
+    for label, factory in factories:
+        latencies, elapsed = await measure(factory(), requests, concurrency)
+        report(label, latencies, elapsed)
+
+    await fake.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--host", default="127.0.0.1", help="имя хоста фейкового API в URL")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа фейка, с")
+    parser.add_argument("--ipv4", action="store_true", help="как FORCE_IPV4=1 для настроенной сессии")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency, args.host, args.api_latency, args.ipv4))
+
+
+if __name__ == "__main__":
+    main()
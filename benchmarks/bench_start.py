@@ -0,0 +1,111 @@
+"""
+Бенчмарк пропускной способности /start: старый путь (SELECT + INSERT + commit
+в cmd_start и ещё SELECT + INSERT + commit в log_event) против
+register_bot_start (один INSERT ... ON CONFLICT с событием в том же statement).
+
+Запуск (нужен DATABASE_URL):
+    python -m benchmarks.bench_start --users 2000 --concurrency 100 --repeat 2
+
+--repeat 2 имитирует двойное нажатие /start: оба запроса одного пользователя
+идут параллельно, что на старом пути ловит нарушение уникальности.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime
+
+from sqlalchemy import select, delete
+
+from analytics import register_bot_start
+from database import AsyncSessionLocal, init_db
+from models import User, UserEvent, UserProgress
+
+# Диапазон telegram_id, который не пересекается с реальными пользователями
+BENCH_TG_ID_BASE = 2_000_000_000
+
+
+async def legacy_start(telegram_id: int, telegram_username: str) -> None:
+    """Воспроизведение прежнего cmd_start + log_event("bot_start")."""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User).where(User.telegram_id == telegram_id))
+        if not result.scalar_one_or_none():
+            db.add(User(
+                telegram_id=telegram_id,
+                telegram_username=telegram_username,
+                bot_start_datetime=datetime.utcnow(),
+            ))
+            await db.commit()
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User).where(User.telegram_id == telegram_id))
+        user = result.scalar_one_or_none()
+        if not user:
+            return
+        db.add(UserEvent(user_id=user.id, event_code="bot_start", payload={}))
+        await db.commit()
+
+
+async def upsert_start(telegram_id: int, telegram_username: str) -> None:
+    await register_bot_start(telegram_id=telegram_id, telegram_username=telegram_username)
+
+
+async def cleanup(users: int) -> None:
+    ids = range(BENCH_TG_ID_BASE, BENCH_TG_ID_BASE + users)
+    async with AsyncSessionLocal() as db:
+        user_ids = select(User.id).where(User.telegram_id.in_(ids)).scalar_subquery()
+        await db.execute(delete(UserEvent).where(UserEvent.user_id.in_(user_ids)))
+        await db.execute(delete(UserProgress).where(UserProgress.user_id.in_(user_ids)))
+        await db.execute(delete(User).where(User.telegram_id.in_(ids)))
+        await db.commit()
+
+
+async def run(name: str, start_fn, users: int, concurrency: int, repeat: int) -> None:
+    await cleanup(users)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(telegram_id: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await start_fn(telegram_id, f"bench_{telegram_id}")
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    calls = [
+        one(BENCH_TG_ID_BASE + i)
+        for i in range(users)
+        for _ in range(repeat)
+    ]
+    started = time.perf_counter()
+    await asyncio.gather(*calls)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:>8}: {len(calls)} /start за {elapsed:.2f} с — "
+        f"{len(calls) / elapsed:.0f} /s, p50={statistics.median(latencies) * 1000:.1f} мс, "
+        f"p95={p95 * 1000:.1f} мс, ошибок={errors}"
+    )
+    await cleanup(users)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=1, help="сколько /start на пользователя (параллельно)")
+    args = parser.parse_args()
+
+    await init_db()
+    await run("legacy", legacy_start, args.users, args.concurrency, args.repeat)
+    await run("upsert", upsert_start, args.users, args.concurrency, args.repeat)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
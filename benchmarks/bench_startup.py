@@ -0,0 +1,118 @@
+"""
+Бенчмарк старта бота: время импорта main и время до первого ответа
+на апдейт (time-to-first-update) против локального FakeTelegramAPI.
+
+    python -m benchmarks.bench_startup --runs 3 --output startup.jsonl
+
+Каждый прогон — отдельный процесс `python main.py`; в очереди фейкового API
+лежит один /start со своим update_id, сохранённый offset (app_meta) перед
+прогоном стирается — иначе прогон мерил бы отбрасывание дубля, а не старт.
+Время считается до первого sendPhoto/sendMessage.
+
+Импорт main почти целиком — импорт самого aiogram (aiogram.types):
+он печатается отдельно (aiogram=...), собственные импорты main — разница.
+С --output результаты дописываются JSON-строками для отслеживания динамики.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.fake_telegram_api import FakeTelegramAPI
+from benchmarks.funnel_load import build_update
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def measure_import_time(module: str = "main") -> float:
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=ROOT, env=os.environ.copy())
+    return float(output.decode().strip().splitlines()[-1])
+
+
+async def reset_polling_offset() -> None:
+    """Стирает сохранённый offset: /start прогона не должен попасть в дубли."""
+    from sqlalchemy import delete
+    from sqlalchemy.exc import DBAPIError
+
+    from backlog import POLLING_OFFSET_KEY
+    from database import engine
+    from models import AppMeta
+
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(delete(AppMeta).where(AppMeta.key == POLLING_OFFSET_KEY))
+    except DBAPIError:
+        # Схемы ещё нет — offset тоже
+        pass
+    finally:
+        await engine.dispose()
+
+
+async def measure_first_update(fake: FakeTelegramAPI, timeout: float, update_id: int) -> float:
+    await reset_polling_offset()
+    fake.calls.clear()
+    fake.add_updates([build_update(update_id, 1_990_000_000, "text", "/start")])
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "main.py",
+        cwd=ROOT,
+        env=os.environ.copy(),
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        while not (fake.calls["sendphoto"] or fake.calls["sendmessage"]):
+            if time.perf_counter() - started > timeout:
+                raise TimeoutError("бот не ответил на /start")
+            await asyncio.sleep(0.01)
+        return time.perf_counter() - started
+    finally:
+        process.send_signal(signal.SIGTERM)
+        await process.wait()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", help="файл для дописывания результатов (JSON lines)")
+    args = parser.parse_args()
+
+    fake = FakeTelegramAPI()
+    base_url = await fake.start()
+    os.environ["TELEGRAM_API_BASE_URL"] = base_url
+    os.environ.setdefault("BOT_TOKEN", "42:FAKE")
+    os.environ.pop("PROXY_URL", None)
+    os.environ.pop("WORKERS", None)
+
+    try:
+        for run in range(args.runs):
+            aiogram_s = measure_import_time("aiogram.types")
+            import_s = measure_import_time()
+            first_update_s = await measure_first_update(fake, args.timeout, update_id=run + 1)
+            result = {
+                "ts": time.time(),
+                "run": run,
+                "aiogram_import_s": round(aiogram_s, 3),
+                "import_s": round(import_s, 3),
+                "first_update_s": round(first_update_s, 3),
+            }
+            print(
+                f"import={import_s:.2f} с (aiogram={aiogram_s:.2f} с), "
+                f"до первого ответа={first_update_s:.2f} с"
+            )
+            if args.output:
+                with open(args.output, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(result) + "\n")
+    finally:
+        await fake.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
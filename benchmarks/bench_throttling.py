@@ -0,0 +1,136 @@
+"""
+Флуд сообщениями и ThrottlingMiddleware.
+
+--users обычных пользователей проходят воронку (как bench_funnel_offline),
+одновременно --spammers клиентов шлют по --flood апдейтов: /start
+подряд, а после кнопки «Узнать сценарий» — имя и «Неверно» по кругу
+(каждое второе имя длиннее лимита free_text). Прогон выполняется без
+ограничения (правила с бесконечной скоростью) и с правилами THROTTLE_RULES;
+сравниваются SQL-запросы к БД, запросы к Bot API и прохождение воронки
+обычными пользователями.
+
+    python -m benchmarks.bench_throttling --users 50 --spammers 20 --flood 200
+
+Telegram — FakeTelegramAPI, БД — из DATABASE_URL (по умолчанию in-memory SQLite).
+"""
+import argparse
+import asyncio
+import os
+import time
+from typing import Any, Dict, List
+
+from benchmarks.fake_telegram_api import FakeTelegramAPI
+
+
+def spam_updates(spammers: int, flood: int, first_telegram_id: int, first_update_id: int) -> List[Dict[str, Any]]:
+    from benchmarks.funnel_load import build_update
+
+    updates = []
+    update_id = first_update_id
+    for index in range(spammers):
+        telegram_id = first_telegram_id + index
+        script = [("text", "/start")] * (flood // 2) + [("data", "learn_scenario")]
+        # «Неверно» возвращает в ввод имени: каждый текст снова доходит до name_received
+        for n in range((flood - flood // 2) // 2):
+            script += [("text", "Спам" * (100 if n % 2 else 1)), ("data", "name_confirm_incorrect")]
+        for kind, value in script:
+            updates.append(build_update(update_id, telegram_id, kind, value))
+            update_id += 1
+    return updates
+
+
+async def run_once(bot, fake: FakeTelegramAPI, args: argparse.Namespace, throttled: bool) -> None:
+    from aiogram.types import Update
+    from sqlalchemy import event
+
+    import cluster
+    import funnel
+    import lifecycle
+    from benchmarks.funnel_load import LOAD_TG_ID_BASE, cleanup_users, generate_updates
+    from database import engine, read_session
+    from main import dp
+    from middlewares.throttling_middleware import THROTTLE_RULES, ThrottleRule, throttling
+
+    total_users = args.users + args.spammers
+    await cleanup_users(total_users)
+    if throttled:
+        throttling.rules = dict(THROTTLE_RULES)
+    else:
+        throttling.rules = {name: ThrottleRule(rate=1e9, burst=10**9, policy="drop") for name in THROTTLE_RULES}
+    throttling._buckets.clear()
+    before = throttling.stats()
+
+    raw = generate_updates(args.users)
+    raw += spam_updates(args.spammers, args.flood, LOAD_TG_ID_BASE + args.users, len(raw) + 1)
+
+    queries = 0
+
+    def count_query(*_args) -> None:
+        nonlocal queries
+        queries += 1
+
+    calls_before = sum(fake.calls.values())
+    event.listen(engine.sync_engine, "before_cursor_execute", count_query)
+    started = time.perf_counter()
+    serializer = cluster._PerUserSerializer()
+    for item in raw:
+        update = Update.model_validate(item, context={"bot": bot})
+        serializer.submit(cluster.shard_key(update), dp.feed_update(bot, update))
+    while serializer.tasks:
+        await asyncio.wait(set(serializer.tasks))
+    await lifecycle.flush_background(60)
+    elapsed = time.perf_counter() - started
+    event.remove(engine.sync_engine, "before_cursor_execute", count_query)
+
+    async with read_session() as db:
+        counts = await funnel.funnel_counts(db)
+    stats = throttling.stats()
+    blocked = {key: stats[key] - before[key] for key in ("dropped", "warned", "too_long", "delayed")}
+    name = "с ограничением" if throttled else "без ограничения"
+    print(
+        f"{name:<16} {len(raw)} апдейтов за {elapsed:.2f} с: SQL-запросов {queries}, "
+        f"запросов к Bot API {sum(fake.calls.values()) - calls_before}, "
+        f"дошли до конца воронки {counts['11_channel_or_gift']} (из {total_users} пользователей); {blocked}"
+    )
+
+
+async def run(args: argparse.Namespace) -> None:
+    fake = FakeTelegramAPI(latency=args.api_latency)
+    base_url = await fake.start()
+    os.environ["TELEGRAM_API_BASE_URL"] = base_url
+    os.environ["N8N_WEBHOOK_URL"] = f"{base_url}/n8n"
+    os.environ.setdefault("BOT_TOKEN", "42:FAKE")
+    os.environ.pop("PROXY_URL", None)
+    os.environ.pop("PROXY_URLS", None)
+
+    from benchmarks.funnel_load import cleanup_users, ensure_quizzes
+    from database import engine, init_db
+    from main import create_bot, dp, setup_routers
+
+    await init_db()
+    await ensure_quizzes()
+    setup_routers(dp)
+    bot = await create_bot()
+    try:
+        for throttled in (False, True):
+            await run_once(bot, fake, args, throttled)
+    finally:
+        await cleanup_users(args.users + args.spammers)
+        await bot.session.close()
+        await engine.dispose()
+        await fake.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--spammers", type=int, default=20)
+    parser.add_argument("--flood", type=int, default=200, help="сообщений от каждого спамера")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа фейкового API, с")
+    args = parser.parse_args()
+    os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite://")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
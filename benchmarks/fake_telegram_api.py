@@ -0,0 +1,104 @@
+"""
+Локальная подмена Telegram Bot API для бенчмарков.
+
+Отвечает на /bot<token>/<method> правдоподобными результатами, отдаёт
+заранее подготовленные апдейты через getUpdates, принимает вебхук n8n
+на /n8n и трассы OTLP/HTTP JSON на /v1/traces (вместо коллектора).
+Бот направляется сюда через TELEGRAM_API_BASE_URL.
+"""
+import asyncio
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from aiohttp import web
+
+FAKE_BOT_USER = {"id": 42, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+
+
+class FakeTelegramAPI:
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.updates: Deque[Dict[str, Any]] = deque()
+        self.calls: Counter = Counter()
+        self.otlp_spans = 0
+        # callback_query_id -> time.monotonic() ответа answerCallbackQuery
+        self.answered_at: Dict[str, float] = {}
+        # pending_update_count для getWebhookInfo; None — длина очереди updates
+        self.pending_update_count: Optional[int] = None
+        self._message_id = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url: Optional[str] = None
+
+    def add_updates(self, updates: List[Dict[str, Any]]) -> None:
+        self.updates.extend(updates)
+
+    def _message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        self._message_id += 1
+        chat_id = int(params.get("chat_id") or 0)
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": FAKE_BOT_USER,
+            "text": params.get("text") or params.get("caption") or "",
+        }
+
+    async def _result(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == "getme":
+            return FAKE_BOT_USER
+        if method == "getupdates":
+            limit = int(params.get("limit") or 100)
+            batch = [self.updates.popleft() for _ in range(min(limit, len(self.updates)))]
+            if not batch and int(params.get("timeout") or 0) > 0:
+                await asyncio.sleep(0.05)
+            return batch
+        if method == "getwebhookinfo":
+            pending = self.pending_update_count
+            return {
+                "url": "",
+                "has_custom_certificate": False,
+                "pending_update_count": len(self.updates) if pending is None else pending,
+            }
+        if method.startswith("send"):
+            return self._message(params)
+        if method == "answercallbackquery":
+            self.answered_at[str(params.get("callback_query_id"))] = time.monotonic()
+        return True
+
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = dict(await request.post())
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({"ok": True, "result": await self._result(method, params)})
+
+    async def _handle_n8n(self, request: web.Request) -> web.Response:
+        self.calls["n8n"] += 1
+        await request.read()
+        return web.json_response({"ok": True})
+
+    async def _handle_otlp(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        self.otlp_spans += sum(
+            len(scope["spans"]) for resource in body["resourceSpans"] for scope in resource["scopeSpans"]
+        )
+        return web.json_response({})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle_method)
+        app.router.add_post("/n8n", self._handle_n8n)
+        app.router.add_post("/v1/traces", self._handle_otlp)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{bound_port}"
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
@@ -0,0 +1,162 @@
+"""
+Синтетическая нагрузка: полный проход воронки для пачки пользователей
+в виде сырых апдейтов Telegram (dict), как их вернул бы getUpdates.
+
+Чётные пользователи идут веткой психолога, нечётные — веткой не-психолога.
+Апдейты разных пользователей перемешаны по шагам (round-robin), апдейты
+одного пользователя идут строго по порядку.
+"""
+import time
+from typing import Any, Dict, List
+
+from sqlalchemy import delete, select
+
+from database import AsyncSessionLocal
+from models import (
+    NonPsychQuizResult,
+    Quiz,
+    QuizResult,
+    ScenarioCostResult,
+    User,
+    UserEvent,
+    UserProgress,
+)
+
+# Диапазон telegram_id синтетических пользователей
+LOAD_TG_ID_BASE = 1_900_000_000
+
+_COMMON_HEAD = [
+    ("text", "/start"),
+    ("data", "learn_scenario"),
+    ("text", "Тест"),
+    ("data", "name_confirm_correct"),
+    ("text", "+70000000000"),
+    ("data", "phone_confirm_correct"),
+]
+
+_QUIZ = [
+    ("data", "discover_scenario"),
+    ("data", "start_quiz"),
+    ("data", "q1_impostor"),
+    ("data", "q2_seeker"),
+    ("data", "q3_impostor"),
+    ("data", "q4_eternal_student"),
+    ("data", "q5_impostor"),
+    ("data", "show_quiz_results"),
+    ("data", "learn_scenario_cost"),
+]
+
+_COMMON_TAIL = [
+    ("data", "get_video"),
+    ("data", "learn_how_to_change"),
+    ("data", "ready_for_next_step"),
+    ("data", "book_consultation"),
+    ("data", "view_participant_results"),
+    ("data", "learn_more_supervision"),
+    ("data", "book_call"),
+    ("data", "go_to_channel"),
+]
+
+PSYCH_STEPS = _COMMON_HEAD + [("data", "goal_career")] + _QUIZ + [
+    ("data", "calc_scenario_cost"),
+    ("data", "price_q1_100k"),
+    ("data", "price_q2_5_30"),
+    ("data", "price_q3_6"),
+    ("data", "no_more_scenario"),
+] + _COMMON_TAIL
+
+NON_PSYCH_STEPS = _COMMON_HEAD + [("data", "goal_personal")] + _QUIZ + [
+    ("data", "calc_scenario_cost_non_psych"),
+    ("data", "q1_1y"),
+    ("data", "q2_weekly"),
+    ("data", "q3_books"),
+    ("data", "q3_stuck"),
+    ("data", "q3_done"),
+    ("data", "no_more_scenario"),
+] + _COMMON_TAIL
+
+
+def _user(telegram_id: int) -> Dict[str, Any]:
+    return {"id": telegram_id, "is_bot": False, "first_name": "Load", "username": f"load_{telegram_id}"}
+
+
+def _chat(telegram_id: int) -> Dict[str, Any]:
+    return {"id": telegram_id, "type": "private"}
+
+
+def build_update(update_id: int, telegram_id: int, kind: str, value: str) -> Dict[str, Any]:
+    now = int(time.time())
+    if kind == "text":
+        message: Dict[str, Any] = {
+            "message_id": update_id,
+            "date": now,
+            "chat": _chat(telegram_id),
+            "from": _user(telegram_id),
+            "text": value,
+        }
+        if value.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(value)}]
+        return {"update_id": update_id, "message": message}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(telegram_id),
+            "chat_instance": str(telegram_id),
+            "data": value,
+            "message": {
+                "message_id": update_id,
+                "date": now,
+                "chat": _chat(telegram_id),
+                "text": "",
+            },
+        },
+    }
+
+
+def steps_for(index: int) -> List[tuple]:
+    return PSYCH_STEPS if index % 2 == 0 else NON_PSYCH_STEPS
+
+
+def generate_updates(users: int, first_update_id: int = 1) -> List[Dict[str, Any]]:
+    """Апдейты воронки для users пользователей, перемешанные по шагам."""
+    updates = []
+    update_id = first_update_id
+    longest = max(len(PSYCH_STEPS), len(NON_PSYCH_STEPS))
+    for step in range(longest):
+        for index in range(users):
+            steps = steps_for(index)
+            if step >= len(steps):
+                continue
+            kind, value = steps[step]
+            updates.append(build_update(update_id, LOAD_TG_ID_BASE + index, kind, value))
+            update_id += 1
+    return updates
+
+
+QUIZZES = {
+    "main_psych_quiz": "Основной квиз",
+    # Иначе его одновременно создают первые не-психологи прогона
+    "non_psych_quiz_1": "Квиз упущенного потенциала (не-психолог)",
+}
+
+
+async def ensure_quizzes() -> None:
+    """Квизы, которые обработчики ожидают найти в БД."""
+    async with AsyncSessionLocal() as db:
+        for code, title in QUIZZES.items():
+            result = await db.execute(select(Quiz).where(Quiz.code == code))
+            if not result.scalar_one_or_none():
+                db.add(Quiz(code=code, title=title, is_active=True))
+        await db.commit()
+
+
+async def cleanup_users(users: int) -> None:
+    """Удаляет синтетических пользователей и всё, что они создали."""
+    in_range = User.telegram_id.between(LOAD_TG_ID_BASE, LOAD_TG_ID_BASE + users - 1)
+    async with AsyncSessionLocal() as db:
+        user_ids = select(User.id).where(in_range).scalar_subquery()
+        for model in (UserEvent, UserProgress, QuizResult, ScenarioCostResult, NonPsychQuizResult):
+            await db.execute(delete(model).where(model.user_id.in_(user_ids)))
+        await db.execute(delete(User).where(in_range))
+        await db.commit()
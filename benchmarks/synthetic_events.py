@@ -0,0 +1,299 @@
+"""
+Синтетические пользователи и события воронки для нагрузочной проверки
+analytics_funnel.sql на Postgres (1M, 10M, 50M строк user_events).
+
+Каждый пользователь проходит шаги funnel.FUNNEL_STEPS по порядку и после
+каждого шага с вероятностью отсева (--drop) уходит. Время между шагами —
+логнормальное: медиана и разброс по умолчанию в STEP_DELAYS, общий
+множитель --delay-scale. Старты пользователей равномерно распределены по
+последним --days дням. С вероятностью --repeat событие шага пишется ещё
+раз (повторное нажатие кнопки) — как в живой user_events.
+
+Психологи (доля --psychologists) идут через scenario_cost_*, остальные —
+через non_psych_quiz_*; goal, is_psychologist и dominant_scenario
+заполняются в колонках так же, как их пишет log_event.
+
+Строки грузятся пачками через COPY (asyncpg copy_records_to_table), id
+выдаются подряд после MAX(id), sequence'ы потом выставляются на MAX(id).
+telegram_id синтетических пользователей — от SYNTH_TG_ID_BASE (выше
+диапазонов funnel_load и bench_start), telegram_username — synth_<telegram_id>.
+--cleanup удаляет только такие строки users (диапазон и префикс вместе)
+с их событиями и строками user_progress.
+
+    python -m benchmarks.synthetic_events --events 10000000 --seed 1
+    python -m benchmarks.synthetic_events --users 200000 --drop 5=0.4 --drop 9=0.7
+    python -m benchmarks.synthetic_events --cleanup
+
+user_progress для синтетики: python -m progress --backfill
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import asyncpg
+
+from funnel import FUNNEL_STEPS
+from migrate_sqlite_to_pg import pg_dsn
+from models import QuizScenario
+
+# Диапазон telegram_id синтетических пользователей: выше funnel_load (1.9e9) и
+# bench_start (2.0e9), до конца int4 колонки users.telegram_id
+SYNTH_TG_ID_BASE = 2_050_000_000
+SYNTH_TG_ID_MAX = 2_147_483_647
+SYNTH_USERNAME_PREFIX = "synth_"
+
+# Доля пользователей, уходящих после шага (ключ — номер пройденного шага)
+DEFAULT_DROP: Dict[int, float] = {
+    1: 0.25, 2: 0.10, 3: 0.20, 4: 0.10, 5: 0.30,
+    6: 0.15, 7: 0.25, 8: 0.50, 9: 0.40, 10: 0.30,
+}
+
+# Задержка перед шагом: (медиана, сигма логнормального распределения), с
+STEP_DELAYS: Dict[int, Tuple[float, float]] = {
+    2: (15, 0.8), 3: (25, 0.9), 4: (10, 0.7), 5: (20, 1.0), 6: (120, 0.6),
+    7: (40, 1.2), 8: (90, 0.7), 9: (60, 1.5), 10: (30, 1.0), 11: (300, 2.0),
+}
+
+# События шага так, как их пишут обработчики: (психолог, остальные)
+STEP_EVENTS: Dict[int, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {
+    step: ((codes[0],), (codes[0],)) for step, _, codes in FUNNEL_STEPS
+}
+STEP_EVENTS.update({
+    5: (("quiz_started",), ("quiz_started",)),
+    6: (("quiz_completed",), ("quiz_completed",)),
+    7: (("scenario_cost_started",), ("non_psych_quiz_started",)),
+    8: (("scenario_cost_completed",), ("non_psych_quiz_completed",)),
+    11: (("go_to_channel_clicked", "gift_sent_success"),) * 2,
+})
+
+GOALS = ("goal_career", "goal_skills", "goal_personal")
+SCENARIOS = [scenario.value for scenario in QuizScenario]
+
+USER_COLUMNS = [
+    "id", "telegram_id", "telegram_username", "user_name", "phone",
+    "bot_start_datetime", "is_psychologist", "is_not_psychologist", "main_quiz_scenario",
+]
+EVENT_COLUMNS = [
+    "id", "user_id", "event_code", "goal", "is_psychologist",
+    "dominant_scenario", "reminder_24h_sent", "created_at",
+]
+
+
+class FunnelModel:
+    """Параметры синтетической воронки: отсев, задержки, повторы."""
+
+    def __init__(
+        self,
+        drop: Dict[int, float],
+        delay_scale: float = 1.0,
+        repeat: float = 0.05,
+        psychologists: float = 0.6,
+        days: float = 90,
+    ) -> None:
+        self.drop = drop
+        self.delay_scale = delay_scale
+        self.repeat = repeat
+        self.psychologists = psychologists
+        self.days = days
+
+    def expected_events(self) -> float:
+        """Среднее число событий на пользователя — для подбора --users по --events."""
+        alive, total = 1.0, 0.0
+        for step, _, _ in FUNNEL_STEPS:
+            total += alive * len(STEP_EVENTS[step][0])
+            alive *= 1 - self.drop.get(step, 0.0)
+        return total * (1 + self.repeat)
+
+    def delay(self, rng: random.Random, step: int) -> float:
+        median, sigma = STEP_DELAYS.get(step, (30, 1.0))
+        return rng.lognormvariate(math.log(median * self.delay_scale), sigma)
+
+
+def generate(
+    model: FunnelModel,
+    users: int,
+    first_user_id: int,
+    first_event_id: int,
+    first_telegram_id: int,
+    now: datetime,
+    seed: Optional[int] = None,
+) -> Iterator[Tuple[Tuple, List[Tuple]]]:
+    """(строка users, строки user_events) для каждого синтетического пользователя."""
+    rng = random.Random(seed)
+    event_id = first_event_id
+    window = model.days * 86400
+    for index in range(users):
+        user_id = first_user_id + index
+        telegram_id = first_telegram_id + index
+        is_psychologist = rng.random() < model.psychologists
+        goal = rng.choice(GOALS)
+        scenario = rng.choice(SCENARIOS)
+        started = now - timedelta(seconds=rng.uniform(0, window))
+
+        events: List[Tuple] = []
+        at = started
+        reached = 0
+        for step, _, _ in FUNNEL_STEPS:
+            if step > 1:
+                at += timedelta(seconds=model.delay(rng, step))
+                if at > now:
+                    break
+            for code in STEP_EVENTS[step][0 if is_psychologist else 1]:
+                row = [
+                    None, user_id, code,
+                    goal if step == 4 else None,
+                    is_psychologist if step == 7 else None,
+                    scenario if step == 6 else None,
+                    False, at,
+                ]
+                for _ in range(2 if rng.random() < model.repeat else 1):
+                    row[0] = event_id
+                    event_id += 1
+                    events.append(tuple(row))
+                    row[-1] = at + timedelta(seconds=rng.uniform(1, 30))
+            reached = step
+            if rng.random() < model.drop.get(step, 0.0):
+                break
+
+        user = (
+            user_id, telegram_id, f"{SYNTH_USERNAME_PREFIX}{telegram_id}", "Synthetic",
+            "+70000000000" if reached >= 3 else None, started,
+            is_psychologist, not is_psychologist, scenario if reached >= 6 else None,
+        )
+        yield user, events
+
+
+async def _set_sequences(pg: asyncpg.Connection) -> None:
+    for table in ("users", "user_events"):
+        await pg.execute(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"
+        )
+
+
+async def load(pg: asyncpg.Connection, model: FunnelModel, users: int, batch: int, seed: Optional[int]) -> None:
+    first_user_id = await pg.fetchval("SELECT COALESCE(MAX(id), 0) + 1 FROM users")
+    first_event_id = await pg.fetchval("SELECT COALESCE(MAX(id), 0) + 1 FROM user_events")
+    first_telegram_id = await pg.fetchval(
+        "SELECT GREATEST(COALESCE(MAX(telegram_id), 0) + 1, $1) FROM users WHERE telegram_id BETWEEN $1 AND $2",
+        SYNTH_TG_ID_BASE, SYNTH_TG_ID_MAX,
+    )
+    if first_telegram_id + users - 1 > SYNTH_TG_ID_MAX:
+        raise SystemExit(
+            f"Не хватает диапазона telegram_id: свободно {SYNTH_TG_ID_MAX - first_telegram_id + 1}, "
+            f"нужно {users} (сначала --cleanup)"
+        )
+
+    started = time.perf_counter()
+    user_rows: List[Tuple] = []
+    event_rows: List[Tuple] = []
+    loaded_users = loaded_events = 0
+
+    async def flush() -> None:
+        nonlocal loaded_users, loaded_events
+        # users раньше событий: внешний ключ user_events.user_id
+        await pg.copy_records_to_table("users", records=user_rows, columns=USER_COLUMNS)
+        await pg.copy_records_to_table("user_events", records=event_rows, columns=EVENT_COLUMNS)
+        loaded_users += len(user_rows)
+        loaded_events += len(event_rows)
+        user_rows.clear()
+        event_rows.clear()
+        elapsed = time.perf_counter() - started
+        print(f"  пользователей {loaded_users:>10}  событий {loaded_events:>11}  {loaded_events / elapsed:9.0f} строк/с", flush=True)
+
+    now = datetime.now().replace(microsecond=0)
+    for user, events in generate(model, users, first_user_id, first_event_id, first_telegram_id, now, seed):
+        user_rows.append(user)
+        event_rows.extend(events)
+        if len(event_rows) >= batch:
+            await flush()
+    if user_rows:
+        await flush()
+
+    await _set_sequences(pg)
+    # Статистика планировщика по свежим данным — иначе EXPLAIN врёт
+    await pg.execute("ANALYZE users")
+    await pg.execute("ANALYZE user_events")
+    elapsed = time.perf_counter() - started
+    print(f"\nИтого: {loaded_users} пользователей, {loaded_events} событий за {elapsed:.1f} с")
+
+
+async def cleanup(pg: asyncpg.Connection) -> None:
+    # Только строки, которые создал load(): и диапазон telegram_id, и префикс username
+    synthetic = "telegram_id BETWEEN $1 AND $2 AND telegram_username LIKE $3"
+    args = (SYNTH_TG_ID_BASE, SYNTH_TG_ID_MAX, SYNTH_USERNAME_PREFIX.replace("_", "\\_") + "%")
+    async with pg.transaction():
+        for table in ("user_events", "user_progress"):
+            status = await pg.execute(
+                f"DELETE FROM {table} WHERE user_id IN (SELECT id FROM users WHERE {synthetic})", *args
+            )
+            print(f"{table}: {status}")
+        status = await pg.execute(f"DELETE FROM users WHERE {synthetic}", *args)
+        print(f"users: {status}")
+
+
+def parse_drop(values: List[str]) -> Dict[int, float]:
+    drop = dict(DEFAULT_DROP)
+    for value in values:
+        step, _, probability = value.partition("=")
+        drop[int(step)] = float(probability)
+    return drop
+
+
+async def run(args: argparse.Namespace, database_url: str) -> None:
+    from database import engine, init_db
+
+    # Схема создаётся так же, как при старте бота
+    await init_db()
+    await engine.dispose()
+
+    pg = await asyncpg.connect(pg_dsn(database_url))
+    try:
+        if args.cleanup:
+            await cleanup(pg)
+            return
+        model = FunnelModel(
+            drop=parse_drop(args.drop),
+            delay_scale=args.delay_scale,
+            repeat=args.repeat,
+            psychologists=args.psychologists,
+            days=args.days,
+        )
+        users = args.users or math.ceil(args.events / model.expected_events())
+        print(f"{users} пользователей, ~{model.expected_events():.2f} событий на пользователя")
+        await load(pg, model, users, args.batch, args.seed)
+    finally:
+        await pg.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument("--users", type=int, help="число синтетических пользователей")
+    size.add_argument("--events", type=int, default=1_000_000, help="примерное число событий (по умолчанию)")
+    parser.add_argument(
+        "--drop", action="append", default=[], metavar="STEP=P",
+        help="доля ушедших после шага STEP, можно несколько раз",
+    )
+    parser.add_argument("--delay-scale", type=float, default=1.0, help="множитель медиан задержек STEP_DELAYS")
+    parser.add_argument("--repeat", type=float, default=0.05, help="вероятность повторного события шага")
+    parser.add_argument("--psychologists", type=float, default=0.6, help="доля психологов")
+    parser.add_argument("--days", type=float, default=90, help="за сколько дней распределены старты")
+    parser.add_argument("--seed", type=int, help="seed для воспроизводимого набора")
+    parser.add_argument("--batch", type=int, default=50000, help="строк user_events в одном COPY")
+    parser.add_argument("--cleanup", action="store_true", help="удалить синтетических пользователей и их события")
+    args = parser.parse_args()
+
+    database_url = os.getenv("DATABASE_URL", "")
+    if not database_url.startswith("postgresql"):
+        raise SystemExit("DATABASE_URL должен указывать на Postgres (postgresql+asyncpg://...)")
+    asyncio.run(run(args, database_url))
+
+
+if __name__ == "__main__":
+    main()
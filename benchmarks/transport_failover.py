@@ -0,0 +1,183 @@
+"""
+Проверка переключения транспортов на локальных подставных прокси.
+
+Поднимает фейковый Bot API и два HTTP-прокси (быстрый и медленный), запускает
+polling через SwitchingSession и непрерывно подаёт апдейты. Посреди прогона
+быстрый прокси выключается, затем включается снова. Печатает, когда менеджер
+переключился, сколько запросов потеряно и как polling пережил смену транспорта.
+
+БД не нужна.
+
+    python -m benchmarks.transport_failover --duration 12 --kill-at 4 --revive-at 8
+"""
+import argparse
+import asyncio
+import time
+from typing import Optional, Set
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Message
+
+from benchmarks.fake_telegram_api import FakeTelegramAPI
+from transport import SwitchingSession, TransportManager
+
+
+def _ping(update_id: int, telegram_id: int) -> dict:
+    user = {"id": telegram_id, "is_bot": False, "first_name": "Load"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": telegram_id, "type": "private"},
+            "from": user,
+            "text": "ping",
+        },
+    }
+
+
+class StandInProxy:
+    """
+    HTTP-прокси с методом CONNECT (так ходит aiohttp-socks) и задержкой
+    на каждом куске данных от клиента. stop() закрывает порт и рвёт
+    открытые туннели — как при падении настоящего прокси.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.port: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: Set[asyncio.StreamWriter] = set()
+
+    async def _pipe(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, delay: float) -> None:
+        try:
+            while chunk := await reader.read(65536):
+                if delay:
+                    await asyncio.sleep(delay)
+                writer.write(chunk)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter) -> None:
+        self._writers.add(client_writer)
+        try:
+            head = await client_reader.readuntil(b"\r\n\r\n")
+            method, target, _ = head.split(b"\r\n", 1)[0].decode().split(" ", 2)
+            if method != "CONNECT":
+                client_writer.write(b"HTTP/1.1 405 Method Not Allowed\r\n\r\n")
+                return
+            host, port = target.rsplit(":", 1)
+            upstream_reader, upstream_writer = await asyncio.open_connection(host, int(port))
+            self._writers.add(upstream_writer)
+            client_writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+            await client_writer.drain()
+            await asyncio.gather(
+                self._pipe(client_reader, upstream_writer, self.latency),
+                self._pipe(upstream_reader, client_writer, 0),
+            )
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            client_writer.close()
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", self.port or 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{self.port}"
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            self._server = None
+        for writer in list(self._writers):
+            writer.close()
+        self._writers.clear()
+
+
+async def run(duration: float, kill_at: float, revive_at: float, rate: float) -> None:
+    fake = FakeTelegramAPI()
+    base_url = await fake.start()
+    fast, slow = StandInProxy(latency=0.005), StandInProxy(latency=0.05)
+    fast_url, slow_url = await fast.start(), await slow.start()
+
+    session_kwargs = {"timeout": 10.0, "api": TelegramAPIServer.from_base(base_url)}
+    manager = TransportManager(
+        [fast_url, slow_url],
+        include_direct=False,
+        session_kwargs=session_kwargs,
+        probe_interval=0.5,
+        probe_timeout=1.0,
+    )
+    bot = Bot(token="42:FAKE", session=SwitchingSession(manager, **session_kwargs))
+    await manager.start(bot)
+    print(f"Транспорты: fast={fast_url} slow={slow_url}; активный: {manager.active.name}")
+
+    dp = Dispatcher()
+    delivered = 0
+    failed = 0
+
+    @dp.message()
+    async def echo(message: Message) -> None:
+        nonlocal delivered, failed
+        try:
+            await message.answer("pong")
+            delivered += 1
+        except Exception:
+            failed += 1
+
+    polling = asyncio.create_task(dp.start_polling(bot, polling_timeout=1, handle_signals=False, close_bot_session=False))
+
+    started = time.monotonic()
+    sent = 0
+    killed = revived = False
+    last_active = manager.active.name
+    while (elapsed := time.monotonic() - started) < duration:
+        if not killed and elapsed >= kill_at:
+            await fast.stop()
+            killed = True
+            print(f"[{elapsed:5.2f} с] быстрый прокси выключен")
+        if not revived and elapsed >= revive_at:
+            await fast.start()
+            revived = True
+            print(f"[{elapsed:5.2f} с] быстрый прокси включён")
+        if manager.active.name != last_active:
+            last_active = manager.active.name
+            print(f"[{elapsed:5.2f} с] активный транспорт: {last_active}")
+        sent += 1
+        fake.add_updates([_ping(sent, 1_000 + sent % 50)])
+        await asyncio.sleep(1 / rate)
+
+    await asyncio.sleep(1.5)
+    await dp.stop_polling()
+    await polling
+
+    print(f"\nАпдейтов подано: {sent}, ответов доставлено: {delivered}, ошибок отправки: {failed}")
+    print(f"getUpdates: {fake.calls['getupdates']}, переключений: {manager.switches}")
+    for stats in manager.stats()["transports"]:
+        print(
+            f"  {stats['name']}: healthy={stats['healthy']} latency={stats['latency_ms']} мс "
+            f"errors={stats['error_rate']:.0%} last_error={stats['last_error']}"
+        )
+
+    await bot.session.close()
+    await fast.stop()
+    await slow.stop()
+    await fake.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=12.0)
+    parser.add_argument("--kill-at", type=float, default=4.0)
+    parser.add_argument("--revive-at", type=float, default=8.0)
+    parser.add_argument("--rate", type=float, default=50.0, help="апдейтов в секунду")
+    args = parser.parse_args()
+    asyncio.run(run(args.duration, args.kill_at, args.revive_at, args.rate))
+
+
+if __name__ == "__main__":
+    main()
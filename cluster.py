@@ -0,0 +1,251 @@
+"""
+Горизонтальное масштабирование: один процесс-инжестер читает getUpdates
+и раскладывает апдейты по N процессам-воркерам через локальные очереди.
+
+Шардирование по telegram_id: все апдейты одного пользователя попадают
+в один воркер и обрабатываются там строго по порядку, разные пользователи —
+параллельно на разных ядрах. FSM-состояние должно быть общим
+(FSM_STORAGE_URL=redis://...), иначе оно теряется при смене числа воркеров.
+
+Запуск: WORKERS=4 python main.py
+
+Offset подтверждается инжестером после раскладки по очередям, поэтому
+апдейты, которые воркер не успел обработать при падении процесса, теряются.
+Дедупликацию после рестарта и BACKLOG_POLICY (backlog.py) тоже применяет
+инжестер: он сохраняет границу разложенных апдейтов, воркеры получают
+только то, что нужно обработать.
+"""
+import asyncio
+import multiprocessing as mp
+import os
+import signal
+import time
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.types import Update
+from loguru import logger
+
+# Long-polling таймаут getUpdates у инжестера
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", "30"))
+
+
+def shard_key(update: Update) -> int:
+    """Ключ шардирования: id пользователя, иначе id чата, иначе update_id."""
+    try:
+        event = update.event
+    except Exception:
+        return update.update_id
+    user = getattr(event, "from_user", None)
+    if user:
+        return user.id
+    chat = getattr(event, "chat", None)
+    if chat:
+        return chat.id
+    return update.update_id
+
+
+class _PerUserSerializer:
+    """Выполняет задачи одного ключа последовательно, разных ключей — параллельно."""
+
+    def __init__(self) -> None:
+        self._tails: Dict[int, asyncio.Task] = {}
+        self.tasks: set = set()
+
+    def submit(self, key: int, coro) -> None:
+        previous = self._tails.get(key)
+
+        async def run() -> None:
+            if previous is not None:
+                await asyncio.wait([previous])
+            try:
+                await coro
+            except Exception:
+                logger.exception("Ошибка обработки апдейта пользователя {}", key)
+
+        task = asyncio.create_task(run())
+        self._tails[key] = task
+        self.tasks.add(task)
+        task.add_done_callback(lambda t: self._done(key, t))
+
+    def _done(self, key: int, task: asyncio.Task) -> None:
+        self.tasks.discard(task)
+        if self._tails.get(key) is task:
+            del self._tails[key]
+
+
+# --- Воркер ---
+
+def _worker_main(index: int, queue: mp.Queue) -> None:
+    # Сигналы получает инжестер; воркер останавливается по маркеру None в очереди
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    from logging_setup import setup_logging
+
+    setup_logging(f"worker-{index}")
+    asyncio.run(_worker_loop(index, queue))
+
+
+async def _worker_loop(index: int, queue: mp.Queue) -> None:
+    # Импорт внутри процесса воркера: диспетчер и роутеры собираются здесь
+    import lifecycle
+    import tracing
+    from main import dp, create_bot, setup_routers
+    from middlewares.concurrency_limiter_middleware import concurrency_limiter
+
+    setup_routers(dp)
+    bot = await create_bot()
+    await tracing.start_tracing(f"worker-{index}")
+    loop = asyncio.get_running_loop()
+    serializer = _PerUserSerializer()
+    # Как tasks_concurrency_limit в polling: при полной очереди не читаем новые апдейты
+    tasks_limit = concurrency_limiter.polling_tasks_limit()
+    processed = 0
+    logger.info("Воркер {} запущен (pid={})", index, os.getpid())
+
+    while True:
+        if tasks_limit is not None and len(serializer.tasks) >= tasks_limit:
+            await asyncio.wait(set(serializer.tasks), return_when=asyncio.FIRST_COMPLETED)
+            continue
+        item = await loop.run_in_executor(None, queue.get)
+        if item is None:
+            break
+        key, raw = item
+        update = Update.model_validate(raw, context={"bot": bot})
+        serializer.submit(key, dp.feed_update(bot, update))
+        processed += 1
+
+    if serializer.tasks:
+        await asyncio.wait(set(serializer.tasks), timeout=lifecycle.SHUTDOWN_DRAIN_TIMEOUT)
+    await lifecycle.drain(bot, commit_offset=False)
+    await tracing.exporter.stop()
+    await bot.session.close()
+    logger.info("Воркер {} остановлен, обработано апдейтов: {}", index, processed)
+
+
+def start_workers(workers: int) -> tuple[List[mp.Queue], List[mp.Process]]:
+    ctx = mp.get_context("spawn")
+    queues = [ctx.Queue() for _ in range(workers)]
+    processes = [
+        ctx.Process(target=_worker_main, args=(i, queues[i]), name=f"bot-worker-{i}", daemon=False)
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    return queues, processes
+
+
+def stop_workers(queues: List[mp.Queue], processes: List[mp.Process], timeout: float) -> None:
+    """Отправляет маркер остановки и ждёт, пока воркеры доработают очередь."""
+    for queue in queues:
+        queue.put(None)
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(deadline - time.monotonic(), 0))
+        if process.is_alive():
+            logger.warning("Воркер {} не остановился вовремя, завершаем принудительно", process.name)
+            process.terminate()
+
+
+# --- Инжестер ---
+
+async def run_ingester(
+    bot: Bot,
+    queues: List[mp.Queue],
+    stop: asyncio.Event,
+    allowed_updates: Optional[List[str]] = None,
+) -> Optional[int]:
+    """
+    Читает getUpdates до события stop и раскладывает апдейты по очередям.
+    Возвращает offset, который осталось подтвердить.
+    """
+    from backlog import DRAIN, PROCESS, answer_stale, backlog_guard
+
+    offset: Optional[int] = None
+    distributed = 0
+    stop_wait = asyncio.create_task(stop.wait())
+    try:
+        while not stop.is_set():
+            fetch = asyncio.create_task(bot.get_updates(
+                offset=offset,
+                timeout=POLLING_TIMEOUT,
+                allowed_updates=allowed_updates,
+            ))
+            await asyncio.wait({fetch, stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+            if not fetch.done():
+                fetch.cancel()
+                break
+            try:
+                updates = fetch.result()
+            except Exception as e:
+                logger.error("Инжестер: ошибка getUpdates: {}", e)
+                await asyncio.sleep(1)
+                continue
+
+            stale = []
+            for update in updates:
+                offset = update.update_id + 1
+                action = backlog_guard.classify(update)
+                backlog_guard.mark_done(update.update_id)
+                if action == DRAIN:
+                    stale.append(answer_stale(update))
+                if action != PROCESS:
+                    continue
+                key = shard_key(update)
+                raw: Dict[str, Any] = update.model_dump(mode="json", exclude_unset=True)
+                queues[key % len(queues)].put((key, raw))
+                distributed += 1
+            if stale:
+                await asyncio.gather(*stale)
+    finally:
+        stop_wait.cancel()
+        logger.info("Инжестер остановлен, распределено апдейтов: {}", distributed)
+    return offset
+
+
+async def _ingest(queues: List[mp.Queue]) -> None:
+    from admin_dashboard import admin_dashboard
+    from backlog import backlog_guard
+    from database import engine
+    from main import dp, create_bot, setup_routers
+
+    setup_routers(dp)
+    bot = await create_bot()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    await backlog_guard.start(bot, external_watermark=True)
+    # Панель в инжестере: воронка общая, здоровье — этого процесса
+    await admin_dashboard.start(bot)
+    try:
+        offset = await run_ingester(bot, queues, stop, dp.resolve_used_update_types())
+        if offset is not None:
+            await bot.get_updates(offset=offset, limit=1, timeout=0)
+    finally:
+        await admin_dashboard.stop()
+        await backlog_guard.stop()
+        await engine.dispose()
+        await bot.session.close()
+
+
+def run_cluster(workers: int) -> None:
+    """Точка входа режима WORKERS>1."""
+    import lifecycle
+    from database import init_db, engine
+
+    async def prepare() -> None:
+        await init_db()
+        await engine.dispose()
+
+    asyncio.run(prepare())
+    if not os.getenv("FSM_STORAGE_URL"):
+        logger.warning("FSM_STORAGE_URL не задан: у каждого воркера своё MemoryStorage")
+
+    queues, processes = start_workers(workers)
+    logger.info("Кластер запущен: {} воркеров", workers)
+    try:
+        asyncio.run(_ingest(queues))
+    finally:
+        stop_workers(queues, processes, lifecycle.SHUTDOWN_DRAIN_TIMEOUT + 5)
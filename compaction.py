@@ -0,0 +1,215 @@
+"""
+Свёртка старых событий user_events.
+
+Через несколько недель сырые события нужны только для счётчиков. Джоб
+сворачивает события старше COMPACT_AFTER_DAYS дней (--days):
+    event_daily_aggregates — число событий и пользователей за день по
+        event_code, quiz_id и сегменту пользователя (psych / non_psych / unknown);
+    user_progress          — первые касания шагов воронки (ts_XX) сливаются
+        с событиями, compacted_at отмечает, что часть событий свёрнута;
+после чего сырые строки удаляются.
+
+Идёт диапазонами id пользователей: агрегаты, слияние user_progress и DELETE
+одного диапазона — одна короткая транзакция (lock_timeout и повторы, как в
+recompute.py). Прерванный джоб можно просто перезапустить — ничего не
+посчитается дважды. Граница — начало суток, дни сворачиваются целиком,
+поэтому уникальные пользователи дня складываются из диапазонов без повторов.
+
+Отчёты funnel.py и analytics_funnel.sql берут первые касания свёрнутых
+пользователей из user_progress, daily_event_counts() объединяет агрегаты
+со свежими событиями — после свёртки цифры не меняются.
+
+    python -m compaction --dry-run
+    python -m compaction --days 30 --chunk 2000 --pause 0.05
+    python -m compaction --counts 14      # события по дням за 14 дней
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List
+
+from loguru import logger
+from sqlalchemy import Date, and_, case, delete, func, or_, select, text, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import IS_SQLITE, db_now, engine
+from models import EventDailyAggregate, User, UserEvent, UserProgress
+from progress import backfill_statement
+
+# События старше стольких дней сворачиваются
+COMPACT_AFTER_DAYS = int(os.getenv("COMPACT_AFTER_DAYS", "30"))
+
+LOCK_TIMEOUT = "2s"
+MAX_CHUNK_RETRIES = 5
+
+
+def cutoff_for(days: int, now: datetime) -> datetime:
+    """Начало суток days дней назад от now (времени БД): сворачиваются только целые дни."""
+    return datetime.combine((now - timedelta(days=days)).date(), datetime.min.time())
+
+
+def _day(column: Any) -> Any:
+    # date() есть и в Postgres, и в SQLite (там — строка 'YYYY-MM-DD', её и хранит Date)
+    return func.date(column, type_=Date)
+
+
+def _segment() -> Any:
+    return case(
+        (User.is_psychologist.is_(True), "psych"),
+        (User.is_not_psychologist.is_(True), "non_psych"),
+        else_="unknown",
+    )
+
+
+def _aggregate_statement(old: Any):
+    """INSERT ... SELECT агрегатов по событиям old; уже свёрнутые части дня суммируются."""
+    day = _day(UserEvent.created_at)
+    quiz_id = func.coalesce(UserEvent.quiz_id, 0)
+    segment = _segment()
+    source = (
+        select(
+            day, UserEvent.event_code, quiz_id, segment,
+            func.count(), func.count(func.distinct(UserEvent.user_id)),
+        )
+        .join(User, User.id == UserEvent.user_id)
+        .where(old)
+        .group_by(day, UserEvent.event_code, quiz_id, segment)
+    )
+    insert = sqlite_insert if IS_SQLITE else pg_insert
+    stmt = insert(EventDailyAggregate).from_select(
+        ["day", "event_code", "quiz_id", "segment", "events", "users"], source
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=["day", "event_code", "quiz_id", "segment"],
+        set_={
+            "events": EventDailyAggregate.events + stmt.excluded.events,
+            "users": EventDailyAggregate.users + stmt.excluded.users,
+        },
+    )
+
+
+async def _compact_chunk(low: int, high: int, cutoff: datetime) -> int:
+    """Свёртка событий до cutoff пользователей с id в [low, high) в одной транзакции."""
+    old = and_(UserEvent.user_id >= low, UserEvent.user_id < high, UserEvent.created_at < cutoff)
+    for attempt in range(1, MAX_CHUNK_RETRIES + 1):
+        try:
+            async with engine.begin() as conn:
+                if conn.dialect.name == "postgresql":
+                    await conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+                await conn.execute(_aggregate_statement(old))
+                # Первые касания — в user_progress до удаления событий, на которых они основаны
+                await conn.execute(backfill_statement(low, high))
+                await conn.execute(
+                    update(UserProgress)
+                    .where(
+                        UserProgress.user_id.in_(select(UserEvent.user_id).where(old)),
+                        or_(UserProgress.compacted_at.is_(None), UserProgress.compacted_at < cutoff),
+                    )
+                    .values(compacted_at=cutoff)
+                )
+                result = await conn.execute(delete(UserEvent).where(old))
+                return result.rowcount
+        except DBAPIError as e:
+            if attempt == MAX_CHUNK_RETRIES:
+                raise
+            logger.warning("Диапазон пользователей [{}, {}): {}; повтор {}", low, high, e.orig, attempt)
+            await asyncio.sleep(attempt)
+    return 0
+
+
+async def compact(days: int = COMPACT_AFTER_DAYS, chunk: int = 2000, pause: float = 0.05) -> int:
+    """Сворачивает события старше days дней. Возвращает число удалённых строк user_events."""
+    async with engine.connect() as conn:
+        cutoff = cutoff_for(days, await db_now(conn))
+        low, high = (await conn.execute(
+            select(func.min(UserEvent.user_id), func.max(UserEvent.user_id)).where(UserEvent.created_at < cutoff)
+        )).one()
+    if low is None:
+        logger.info("user_events: событий до {} нет, сворачивать нечего", cutoff)
+        return 0
+
+    started = time.monotonic()
+    deleted = 0
+    for chunk_low in range(low, high + 1, chunk):
+        deleted += await _compact_chunk(chunk_low, chunk_low + chunk, cutoff)
+        if pause:
+            await asyncio.sleep(pause)
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        "user_events: свёрнуто и удалено {} строк до {} за {:.1f} с ({:.0f} строк/с)",
+        deleted, cutoff, elapsed, deleted / elapsed if elapsed else 0,
+    )
+    return deleted
+
+
+async def daily_event_counts(db: AsyncSession, since: date) -> List[Dict[str, Any]]:
+    """
+    События и пользователи по дням и кодам начиная с since: агрегаты
+    свёрнутых дней вместе со свежими сырыми событиями. Пользователи агрегатов
+    суммируются по квизам и сегментам.
+    """
+    aggregated = select(
+        EventDailyAggregate.day.label("day"),
+        EventDailyAggregate.event_code.label("event_code"),
+        EventDailyAggregate.events.label("events"),
+        EventDailyAggregate.users.label("users"),
+    ).where(EventDailyAggregate.day >= since)
+    day = _day(UserEvent.created_at)
+    raw = (
+        select(day, UserEvent.event_code, func.count(), func.count(func.distinct(UserEvent.user_id)))
+        .where(UserEvent.created_at >= datetime.combine(since, datetime.min.time()))
+        .group_by(day, UserEvent.event_code)
+    )
+    combined = union_all(aggregated, raw).subquery()
+    rows = await db.execute(
+        select(combined.c.day, combined.c.event_code, func.sum(combined.c.events), func.sum(combined.c.users))
+        .group_by(combined.c.day, combined.c.event_code)
+        .order_by(combined.c.day, combined.c.event_code)
+    )
+    return [
+        {"day": row[0], "event_code": row[1], "events": int(row[2]), "users": int(row[3])}
+        for row in rows.all()
+    ]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=COMPACT_AFTER_DAYS, help="сворачивать события старше стольких дней")
+    parser.add_argument("--chunk", type=int, default=2000, help="пользователей на транзакцию")
+    parser.add_argument("--pause", type=float, default=0.05, help="пауза между транзакциями, с")
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать, что будет свёрнуто")
+    parser.add_argument("--counts", type=int, default=None, metavar="DAYS", help="показать события по дням")
+    args = parser.parse_args()
+
+    from database import init_db, read_session
+
+    try:
+        await init_db()
+        if args.counts is not None:
+            async with read_session() as db:
+                since = (await db_now(db) - timedelta(days=args.counts)).date()
+                for item in await daily_event_counts(db, since):
+                    print(f"{item['day']}  {item['event_code']:<30} {item['events']:>9}  users={item['users']}")
+        elif args.dry_run:
+            async with engine.connect() as conn:
+                cutoff = cutoff_for(args.days, await db_now(conn))
+                rows, users = (await conn.execute(
+                    select(func.count(), func.count(func.distinct(UserEvent.user_id)))
+                    .where(UserEvent.created_at < cutoff)
+                )).one()
+                total = (await conn.execute(select(func.count()).select_from(UserEvent))).scalar_one()
+            print(f"До {cutoff}: {rows} из {total} строк user_events, пользователей {users}")
+        else:
+            await compact(args.days, args.chunk, args.pause)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,16 @@
+from sqlalchemy import event, func, select, delete, inspect, make_url, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from models import Base
+from sqlalchemy.schema import CreateColumn, CreateTable, CreateIndex
+from models import Base, AppMeta
+import asyncio
+import atexit
+import hashlib
 import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
 from loguru import logger
 from dotenv import load_dotenv
 
@@ -10,11 +20,98 @@ load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 if not DATABASE_URL:
-    logger.error("DATABASE_URL environment variable is not set. Please set it to your PostgreSQL connection string.")
+    logger.error(
+        "DATABASE_URL environment variable is not set. Please set it to your PostgreSQL connection string "
+        "(or sqlite+aiosqlite:///bot.db, sqlite+aiosqlite:// for an in-memory database)."
+    )
     raise ValueError("DATABASE_URL environment variable is required")
 
+# Сколько соединений пула открыть заранее при старте
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", "5"))
+
+# FORCE_CREATE_ALL=1 — всегда выполнять create_all, даже если схема не менялась
+FORCE_CREATE_ALL = os.getenv("FORCE_CREATE_ALL", "0") == "1"
+
+SCHEMA_FINGERPRINT_KEY = "schema_fingerprint"
+
+# Сколько секунд SQLite-соединение ждёт блокировку записи
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "30"))
+
+# Размер пула соединений; без переменных — умолчания SQLAlchemy (5 + 10),
+# для SQLite больше: соединение там — просто открытый файл, а обработчик
+# с открытой сессией может занимать второе через log_event
+_is_sqlite_url = DATABASE_URL.startswith("sqlite")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20" if _is_sqlite_url else "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "100" if _is_sqlite_url else "10"))
+# Сколько секунд ждать свободного соединения пула до ошибки
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+
+# Реплика для чтения (необязательно): экраны только для чтения и аналитика
+# идут на неё, пока отставание не больше REPLICA_MAX_LAG секунд
+REPLICA_DATABASE_URL = os.getenv("REPLICA_DATABASE_URL")
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))
+# Как часто перепроверять отставание реплики, с
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "2"))
+REPLICA_LAG_CHECK_TIMEOUT = 2.0
+
+
+def _sqlite_memory_to_file(url):
+    """
+    aiosqlite gives every pooled connection its own :memory: database, and one
+    shared connection cannot run concurrent sessions. An in-memory URL is served
+    by a temporary file on tmpfs (/dev/shm) instead, removed on exit.
+    """
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    fd, path = tempfile.mkstemp(prefix="bot-", suffix=".db", dir=directory)
+    os.close(fd)
+
+    def _cleanup():
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    atexit.register(_cleanup)
+    return url.set(database=path)
+
+
+def _setup_sqlite(sync_engine) -> None:
+    """
+    Foreign keys like on Postgres and WAL, so readers do not block the writer.
+    Transactions are left to the driver (BEGIN right before the first write):
+    handlers call log_event with their own session still open, and BEGIN
+    IMMEDIATE on every session would deadlock them.
+    """
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+
 # Create the async SQLAlchemy engine
-engine = create_async_engine(DATABASE_URL, echo=False)
+_url = make_url(DATABASE_URL)
+if _url.get_backend_name() == "sqlite":
+    if _url.database in (None, "", ":memory:"):
+        _url = _sqlite_memory_to_file(_url)
+    engine = create_async_engine(
+        _url,
+        echo=False,
+        connect_args={"timeout": SQLITE_BUSY_TIMEOUT},
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    _setup_sqlite(engine.sync_engine)
+else:
+    engine = create_async_engine(
+        DATABASE_URL, echo=False, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT
+    )
+
+IS_SQLITE = engine.dialect.name == "sqlite"
 
 # Create a configured "AsyncSession" class
 AsyncSessionLocal = async_sessionmaker(
@@ -23,18 +120,243 @@ AsyncSessionLocal = async_sessionmaker(
     expire_on_commit=False
 )
 
+# Read-only replica engine; without REPLICA_DATABASE_URL (or on SQLite) reads stay on the primary
+replica_engine = None
+ReadOnlySessionLocal = None
+if REPLICA_DATABASE_URL and not IS_SQLITE:
+    replica_engine = create_async_engine(
+        REPLICA_DATABASE_URL, echo=False, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW
+    )
+    ReadOnlySessionLocal = async_sessionmaker(replica_engine, class_=AsyncSession, expire_on_commit=False)
+
+# Replay lag in seconds; 0 when everything received is already replayed
+# (an idle primary leaves pg_last_xact_replay_timestamp old without any real lag)
+# and NULL-safe when the URL points at a server that is not in recovery
+_REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class _ReplicaHealth:
+    """Cached replica lag check shared by all read sessions."""
+
+    def __init__(self) -> None:
+        self.usable = False
+        self.lag: Optional[float] = None
+        self.checked_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def _measure(self) -> float:
+        async with replica_engine.connect() as conn:
+            return float((await conn.execute(_REPLICA_LAG_SQL)).scalar_one())
+
+    async def check(self) -> bool:
+        if time.monotonic() - self.checked_at < REPLICA_LAG_CHECK_INTERVAL:
+            return self.usable
+        async with self.lock:
+            if time.monotonic() - self.checked_at < REPLICA_LAG_CHECK_INTERVAL:
+                return self.usable
+            first_check = self.checked_at == 0.0
+            was_usable = self.usable
+            try:
+                self.lag = await asyncio.wait_for(self._measure(), REPLICA_LAG_CHECK_TIMEOUT)
+                self.usable = self.lag <= REPLICA_MAX_LAG
+                reason = f"lag {self.lag:.1f}s"
+            except Exception as e:
+                self.lag = None
+                self.usable = False
+                reason = f"{type(e).__name__}: {e}"
+            self.checked_at = time.monotonic()
+            if first_check or self.usable != was_usable:
+                if self.usable:
+                    logger.info(f"Reads go to the replica ({reason})")
+                else:
+                    logger.warning(f"Replica bypassed, reads go to the primary ({reason})")
+            return self.usable
+
+    def stats(self) -> dict:
+        return {
+            "configured": replica_engine is not None,
+            "usable": self.usable,
+            "lag": self.lag,
+            "max_lag": REPLICA_MAX_LAG,
+        }
+
+
+replica_health = _ReplicaHealth()
+
+
+@asynccontextmanager
+async def read_session() -> AsyncIterator[AsyncSession]:
+    """
+    Session for read-only screens and analytics. Goes to the replica while its
+    lag is within REPLICA_MAX_LAG, otherwise (and without a replica) to the primary.
+    Data written by the user a moment ago may be missing: use AsyncSessionLocal
+    where a handler reads its own fresh writes.
+    """
+    factory = AsyncSessionLocal
+    if ReadOnlySessionLocal is not None and await replica_health.check():
+        factory = ReadOnlySessionLocal
+    async with factory() as session:
+        yield session
+
+
+def schema_fingerprint() -> str:
+    """SHA-256 от DDL всех таблиц и индексов моделей для текущего диалекта."""
+    ddl = []
+    for table in Base.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=engine.dialect)))
+        for index in sorted(table.indexes, key=lambda i: i.name or ""):
+            ddl.append(str(CreateIndex(index).compile(dialect=engine.dialect)))
+    return hashlib.sha256("\n".join(ddl).encode()).hexdigest()
+
+
+def _missing_indexes(sync_conn) -> List:
+    """Model indexes of existing tables that are absent (or left invalid by a failed build)."""
+    inspector = inspect(sync_conn)
+    existing_tables = set(inspector.get_table_names())
+    invalid = set()
+    if sync_conn.dialect.name == "postgresql":
+        invalid = set(sync_conn.execute(text(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE NOT i.indisvalid"
+        )).scalars())
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        indexes = {i["name"] for i in inspector.get_indexes(table.name)} - invalid
+        missing.extend(index for index in table.indexes if index.name not in indexes)
+    return missing
+
+
+def _add_missing_columns_and_indexes(sync_conn) -> List[str]:
+    """
+    create_all only creates missing tables. Columns and indexes added to models
+    of existing tables are created here: nullable columns via ALTER TABLE ADD
+    COLUMN (no table rewrite), indexes via CREATE INDEX only while the table
+    is empty. On a table with rows a plain CREATE INDEX blocks writes for the
+    whole build, so such indexes are left to create_missing_indexes()
+    (python -m event_fields --backfill); their names are returned.
+    """
+    inspector = inspect(sync_conn)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        columns = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            if not column.nullable and column.server_default is None:
+                logger.warning(
+                    f"Column {table.name}.{column.name} is NOT NULL without server default, add it manually"
+                )
+                continue
+            ddl = CreateColumn(column).compile(dialect=sync_conn.dialect)
+            table_name = sync_conn.dialect.identifier_preparer.format_table(table)
+            sync_conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {ddl}"))
+            logger.info(f"Added column {table.name}.{column.name}")
+
+    pending = []
+    for index in _missing_indexes(sync_conn):
+        if sync_conn.execute(select(text("1")).select_from(index.table).limit(1)).first() is None:
+            index.create(sync_conn)
+            logger.info(f"Created index {index.name}")
+        else:
+            pending.append(index.name)
+            logger.warning(
+                f"Index {index.name} on non-empty {index.table.name} is not built at startup, "
+                f"run: python -m event_fields --backfill"
+            )
+    return pending
+
+
+async def create_missing_indexes() -> List[str]:
+    """
+    Builds model indexes missing on existing tables without blocking writes:
+    CREATE INDEX CONCURRENTLY in autocommit mode on Postgres (an invalid index
+    left by an interrupted build is dropped and rebuilt), plain CREATE INDEX on SQLite.
+    """
+    created = []
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for index in await conn.run_sync(_missing_indexes):
+            started = time.monotonic()
+            if conn.dialect.name == "postgresql":
+                name = conn.dialect.identifier_preparer.quote(index.name)
+                await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                ddl = str(CreateIndex(index).compile(dialect=conn.dialect))
+                await conn.execute(text(ddl.replace("INDEX ", "INDEX CONCURRENTLY ", 1)))
+            else:
+                await conn.run_sync(index.create)
+            created.append(index.name)
+            logger.info(f"Created index {index.name} in {time.monotonic() - started:.1f}s")
+    return created
+
+
+async def _stored_fingerprint() -> Optional[str]:
+    """Отпечаток схемы из app_meta; None, если таблицы ещё нет."""
+    try:
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                select(AppMeta.value).where(AppMeta.key == SCHEMA_FINGERPRINT_KEY)
+            )
+            return result.scalar_one_or_none()
+    except Exception:
+        return None
+
 
 async def init_db():
-    """Initializes the database by creating all tables defined in Base."""
+    """
+    Initializes the database by creating all tables defined in Base.
+    create_all is skipped when the stored schema fingerprint matches the models.
+    """
+    fingerprint = schema_fingerprint()
+    if not FORCE_CREATE_ALL and await _stored_fingerprint() == fingerprint:
+        logger.info("Database schema unchanged (fingerprint {}), create_all skipped.", fingerprint[:12])
+        return
+
     logger.info(f"Initializing database at {DATABASE_URL}")
     try:
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            pending = await conn.run_sync(_add_missing_columns_and_indexes)
+            await conn.execute(delete(AppMeta).where(AppMeta.key == SCHEMA_FINGERPRINT_KEY))
+            # Пока индексы не построены, схема не совпадает с моделями: проверка повторится при старте
+            if not pending:
+                await conn.execute(
+                    AppMeta.__table__.insert().values(key=SCHEMA_FINGERPRINT_KEY, value=fingerprint)
+                )
         logger.info("Database tables created successfully or already exist.")
     except Exception as e:
         logger.error(f"Error creating database tables: {e}")
 
 
+async def db_now(db) -> datetime:
+    """
+    Текущее время по часам БД — тех же, что пишут created_at (default=func.now()).
+    На Postgres это LOCALTIMESTAMP: now() в часовом поясе сессии без пояса,
+    как её сохраняет колонка DateTime; CURRENT_TIMESTAMP SQLite — UTC.
+    db — соединение или сессия.
+    """
+    now = func.current_timestamp() if IS_SQLITE else func.localtimestamp()
+    return (await db.execute(select(now))).scalar_one()
+
+
+async def warmup_pool(size: int = DB_POOL_WARMUP) -> None:
+    """Открывает соединения пула заранее, чтобы первые апдейты не ждали коннекта."""
+
+    async def ping():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    try:
+        await asyncio.gather(*(ping() for _ in range(size)))
+    except Exception as e:
+        logger.warning(f"DB pool warmup failed: {e}")
+
+
 async def get_db():
     """Dependency to get an async database session."""
     async with AsyncSessionLocal() as session:
@@ -0,0 +1,145 @@
+"""
+Часто фильтруемые ключи payload событий хранятся отдельными колонками
+user_events (quiz_result_id, dominant_scenario, goal, is_psychologist, path):
+фильтр по сценарию или цели — обычный btree-индекс вместо JSONB-операторов.
+
+log_event раскладывает payload через split_payload(): эти ключи уходят
+в колонки, в payload остаётся только произвольное. Старые строки
+переносятся бэкфиллом — диапазонами id, каждый в своей короткой
+транзакции, как в recompute.py:
+
+    python -m event_fields --backfill
+    python -m event_fields --backfill --chunk 10000 --pause 0.05
+
+После бэкфилла тот же шаг строит индексы моделей, которых ещё нет на
+непустых таблицах (init_db при старте их не создаёт): CREATE INDEX
+CONCURRENTLY вне транзакции, запись в user_events не блокируется.
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import Text, cast, func, or_, select, text, update
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.exc import DBAPIError
+
+from database import create_missing_indexes, engine
+from models import UserEvent
+
+# Ключ payload -> колонка user_events с тем же именем
+PROMOTED_FIELDS: Tuple[str, ...] = ("quiz_result_id", "dominant_scenario", "goal", "is_psychologist", "path")
+
+LOCK_TIMEOUT = "2s"
+MAX_CHUNK_RETRIES = 5
+
+
+def split_payload(payload: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(значения колонок, остаток payload) для записи события."""
+    fields: Dict[str, Any] = {}
+    rest: Dict[str, Any] = {}
+    for key, value in (payload or {}).items():
+        if key in PROMOTED_FIELDS:
+            fields[key] = value
+        else:
+            rest[key] = value
+    return fields, rest
+
+
+def _extract(key: str) -> Any:
+    """Значение ключа payload, приведённое к типу колонки (->> на Postgres, json_extract на SQLite)."""
+    element = UserEvent.payload[key]
+    column = getattr(UserEvent, key)
+    if key == "quiz_result_id":
+        return element.as_integer()
+    if key == "is_psychologist":
+        return element.as_boolean()
+    if key == "dominant_scenario":
+        return cast(element.as_string(), column.type)
+    return element.as_string()
+
+
+def _stripped_payload(dialect_name: str) -> Any:
+    if dialect_name == "postgresql":
+        return UserEvent.payload.op("-")(array(PROMOTED_FIELDS, type_=Text))
+    return func.json_remove(UserEvent.payload, *[f"$.{key}" for key in PROMOTED_FIELDS])
+
+
+def _has_promoted_keys() -> Any:
+    return or_(*[UserEvent.payload[key].as_string().isnot(None) for key in PROMOTED_FIELDS])
+
+
+async def _backfill_chunk(low: int, high: int) -> int:
+    """Перенос ключей в колонки для событий с id в [low, high) в отдельной транзакции."""
+    for attempt in range(1, MAX_CHUNK_RETRIES + 1):
+        try:
+            async with engine.begin() as conn:
+                dialect_name = conn.dialect.name
+                if dialect_name == "postgresql":
+                    await conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+                # Ключи без значения не должны затирать колонку, уже заполненную при записи
+                values = {key: func.coalesce(getattr(UserEvent, key), _extract(key)) for key in PROMOTED_FIELDS}
+                stmt = (
+                    update(UserEvent)
+                    .where(UserEvent.id >= low, UserEvent.id < high, _has_promoted_keys())
+                    .values(payload=_stripped_payload(dialect_name), **values)
+                )
+                result = await conn.execute(stmt)
+                return result.rowcount
+        except DBAPIError as e:
+            if attempt == MAX_CHUNK_RETRIES:
+                raise
+            logger.warning("Диапазон id [{}, {}): {}; повтор {}", low, high, e.orig, attempt)
+            await asyncio.sleep(attempt)
+    return 0
+
+
+async def backfill(chunk: int = 10000, pause: float = 0.05) -> int:
+    """Переносит ключи PROMOTED_FIELDS из payload старых событий в колонки."""
+    async with engine.connect() as conn:
+        low, high = (await conn.execute(select(func.min(UserEvent.id), func.max(UserEvent.id)))).one()
+    if low is None:
+        return 0
+
+    started = time.monotonic()
+    updated = 0
+    for chunk_low in range(low, high + 1, chunk):
+        updated += await _backfill_chunk(chunk_low, chunk_low + chunk)
+        if pause:
+            await asyncio.sleep(pause)
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        "user_events: перенесено {} строк за {:.1f} с ({:.0f} строк/с)",
+        updated, elapsed, updated / elapsed if elapsed else 0,
+    )
+    return updated
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backfill", action="store_true", help="перенести ключи старых событий в колонки")
+    parser.add_argument("--chunk", type=int, default=10000, help="строк id-диапазона на транзакцию")
+    parser.add_argument("--pause", type=float, default=0.05, help="пауза между диапазонами, с")
+    args = parser.parse_args()
+
+    from database import init_db
+
+    try:
+        await init_db()
+        if args.backfill:
+            await backfill(args.chunk, args.pause)
+            # Индексы — после бэкфилла: строятся по уже заполненным колонкам
+            await create_missing_indexes()
+        async with engine.connect() as conn:
+            remaining = (await conn.execute(
+                select(func.count()).select_from(UserEvent).where(_has_promoted_keys())
+            )).scalar_one()
+        print(f"Событий с ключами {', '.join(PROMOTED_FIELDS)} в payload: {remaining}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
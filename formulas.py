@@ -0,0 +1,119 @@
+"""
+Версионированные формулы расчётных полей результатов.
+
+Каждая версия формулы задаётся дважды: на Python — для расчёта в обработчике
+при записи результата, и SQL-выражением над колонками таблицы — для массового
+пересчёта уже сохранённых строк (recompute.py). Оба варианта обязаны давать
+одинаковые числа; SQL собран из переносимых конструкций (CASE, целочисленное
+деление), чтобы работать и на Postgres, и на SQLite.
+
+Как поменять формулу:
+    1. добавить новую версию в SCENARIO_COST_FORMULAS / NON_PSYCH_FORMULAS;
+    2. поднять *_FORMULA_VERSION — новые строки пишутся уже по ней;
+    3. после деплоя пересчитать старые строки: python -m recompute --table all
+"""
+from typing import Any, Callable, Dict
+
+from sqlalchemy import Table, case
+
+
+class Formula:
+    """Одна версия формулы: расчёт на Python и эквивалентные SQL-выражения."""
+
+    def __init__(
+        self,
+        version: int,
+        description: str,
+        compute: Callable[..., Dict[str, int]],
+        sql: Callable[[Table], Dict[str, Any]],
+    ) -> None:
+        self.version = version
+        self.description = description
+        self.compute = compute
+        self.sql = sql
+
+    def __repr__(self) -> str:
+        return f"<Formula(v{self.version}: {self.description})>"
+
+
+def _round_half_even_div(numerator: Any, denominator: int) -> Any:
+    """
+    SQL-аналог Python round(numerator / denominator) для неотрицательных целых:
+    банковское округление, как у round(), а не половина вверх, как у SQL ROUND.
+    """
+    quotient = numerator // denominator
+    remainder = numerator % denominator
+    return quotient + case(
+        (remainder * 2 > denominator, 1),
+        ((remainder * 2 == denominator) & (quotient % 2 == 1), 1),
+        else_=0,
+    )
+
+
+# --- Стоимость сценария (психологи), таблица scenario_cost_results ---
+
+def _scenario_cost_v1(expected_income: int, current_income: int, months_delay: int) -> Dict[str, int]:
+    lost_per_month = max(expected_income - current_income, 0)
+    return {
+        "lost_per_month": lost_per_month,
+        "lost_total": lost_per_month * months_delay,
+        "lost_3_years": lost_per_month * 36,
+    }
+
+
+def _scenario_cost_v1_sql(t: Table) -> Dict[str, Any]:
+    lost_per_month = case(
+        (t.c.expected_income > t.c.current_income, t.c.expected_income - t.c.current_income),
+        else_=0,
+    )
+    return {
+        "lost_per_month": lost_per_month,
+        "lost_total": lost_per_month * t.c.months_delay,
+        "lost_3_years": lost_per_month * 36,
+    }
+
+
+SCENARIO_COST_FORMULAS: Dict[int, Formula] = {
+    1: Formula(1, "упущено в месяц = max(желаемый - текущий, 0), прогноз на 36 мес.",
+               _scenario_cost_v1, _scenario_cost_v1_sql),
+}
+
+SCENARIO_COST_FORMULA_VERSION = 1
+
+
+# --- Результат квиза не-психолога, таблица non_psych_quiz_results ---
+
+def _non_psych_v1(months_in_psychology: int, frequency_coef: int, sabotage_items_count: int) -> Dict[str, int]:
+    return {
+        "days_in_psychology": round(months_in_psychology * 365 / 12),
+        "thoughts_count": months_in_psychology * frequency_coef,
+        "sabotage_forms_total": 4 + sabotage_items_count,
+    }
+
+
+def _non_psych_v1_sql(t: Table) -> Dict[str, Any]:
+    return {
+        "days_in_psychology": _round_half_even_div(t.c.months_in_psychology * 365, 12),
+        "thoughts_count": t.c.months_in_psychology * t.c.frequency_coef,
+        "sabotage_forms_total": 4 + t.c.sabotage_items_count,
+    }
+
+
+NON_PSYCH_FORMULAS: Dict[int, Formula] = {
+    1: Formula(1, "дни = месяцы * 365 / 12, мысли = месяцы * частота, формы = 4 + пункты",
+               _non_psych_v1, _non_psych_v1_sql),
+}
+
+NON_PSYCH_FORMULA_VERSION = 1
+
+
+def scenario_cost(expected_income: int, current_income: int, months_delay: int) -> Dict[str, int]:
+    """Расчётные поля ScenarioCostResult по текущей версии формулы."""
+    formula = SCENARIO_COST_FORMULAS[SCENARIO_COST_FORMULA_VERSION]
+    return formula.compute(expected_income, current_income, months_delay)
+
+
+def non_psych(months_in_psychology: int, frequency_coef: int, sabotage_items_count: int) -> Dict[str, int]:
+    """Расчётные поля NonPsychQuizResult по текущей версии формулы."""
+    formula = NON_PSYCH_FORMULAS[NON_PSYCH_FORMULA_VERSION]
+    return formula.compute(months_in_psychology, frequency_coef, sabotage_items_count)
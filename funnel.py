@@ -0,0 +1,180 @@
+"""
+Воронка пользователей на SQLAlchemy Core — переносимый аналог запросов
+из analytics_funnel.sql (там синтаксис Postgres: FILTER, AGE, percentile_cont).
+
+Работает на Postgres и SQLite: MIN(CASE ...) вместо FILTER, перцентили
+длительностей считаются на Python по выбранным меткам времени. Запросы идут
+через read_session — на реплику, если она задана (REPLICA_DATABASE_URL).
+Первые касания свёрнутых старых событий (compaction.py) берутся из
+user_progress, так что отчёты не зависят от свёртки.
+
+    python -m funnel            # воронка и перцентили переходов
+"""
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import User, UserEvent, UserProgress
+
+# (номер шага, метка, коды событий) — как в analytics_funnel.sql
+FUNNEL_STEPS: List[Tuple[int, str, Tuple[str, ...]]] = [
+    (1, "1_bot_start", ("bot_start",)),
+    (2, "2_name_confirmed", ("name_confirmed",)),
+    (3, "3_phone_confirmed", ("phone_confirmed",)),
+    (4, "4_goal_selected", ("goal_selected",)),
+    (5, "5_main_quiz_started", ("start_quiz", "quiz_started", "discover_scenario", "start_quiz_clicked")),
+    (6, "6_main_quiz_completed", ("show_quiz_results", "quiz_completed")),
+    (7, "7_cost_quiz_started", ("scenario_cost_started", "non_psych_quiz_started")),
+    (8, "8_cost_quiz_completed", ("scenario_cost_completed", "non_psych_quiz_completed")),
+    (9, "9_book_consultation_clicked", ("book_consultation_clicked",)),
+    (10, "10_book_call_requested", ("book_call_requested",)),
+    (11, "11_channel_or_gift", ("go_to_channel_clicked", "gift_sent_success")),
+]
+
+# Переходы, для которых считаются перцентили длительности
+DURATION_PAIRS: List[Tuple[int, int]] = [(1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 8), (8, 10)]
+
+# (шаг, имя) конверсий от всех пользователей, как в analytics_funnel.sql
+CONVERSIONS: List[Tuple[int, str]] = [
+    (6, "conv_quiz_done_pct"),
+    (8, "conv_cost_done_pct"),
+    (10, "conv_call_request_pct"),
+    (11, "conv_channel_pct"),
+]
+
+
+def _ts_column(step: int) -> str:
+    return f"ts_{step:02d}"
+
+
+def _earlier(first: Any, second: Any) -> Any:
+    """Меньшая из двух меток времени, NULL — только если обе NULL."""
+    return case((first.is_(None), second), (second.is_(None), first), (second < first, second), else_=first)
+
+
+def step_timestamps_query(compacted: bool = True):
+    """
+    Первое время каждого шага воронки по пользователю (NULL — шаг не пройден).
+
+    compacted — учитывать первые касания из user_progress у пользователей,
+    чьи старые события свёрнуты и удалены (compaction.py). Без этого их
+    шаги до свёртки пропали бы из отчётов.
+    """
+    query = (
+        select(User.id.label("user_id"), User.telegram_id, User.user_name)
+        .select_from(User)
+        .outerjoin(UserEvent, UserEvent.user_id == User.id)
+    )
+    if compacted:
+        query = query.outerjoin(
+            UserProgress, and_(UserProgress.user_id == User.id, UserProgress.compacted_at.isnot(None))
+        )
+    columns = []
+    for step, _, codes in FUNNEL_STEPS:
+        first = func.min(case((UserEvent.event_code.in_(codes), UserEvent.created_at)))
+        if compacted:
+            first = _earlier(first, func.min(getattr(UserProgress, _ts_column(step))))
+        columns.append(first.label(_ts_column(step)))
+    return query.add_columns(*columns).group_by(User.id, User.telegram_id, User.user_name)
+
+
+def stage_reached(row: Any) -> Tuple[int, str]:
+    """Последний (по номеру) пройденный шаг, как stage_reached / stage_label в SQL."""
+    for step, label, _ in reversed(FUNNEL_STEPS):
+        if getattr(row, _ts_column(step)) is not None:
+            return step, label
+    return 0, "0_no_activity"
+
+
+async def user_progress(db: AsyncSession) -> List[Dict[str, Any]]:
+    """Прогресс каждого пользователя: метки времени шагов и достигнутый этап."""
+    rows = (await db.execute(step_timestamps_query())).all()
+    progress = []
+    for row in rows:
+        item = dict(row._mapping)
+        item["stage_reached"], item["stage_label"] = stage_reached(row)
+        progress.append(item)
+    progress.sort(key=lambda p: (p["stage_reached"], p[_ts_column(1)] or datetime.min), reverse=True)
+    return progress
+
+
+async def funnel_counts(db: AsyncSession) -> Dict[str, Any]:
+    """Число пользователей на каждом шаге и конверсии, как блок "Funnel" в SQL."""
+    flags = step_timestamps_query().subquery()
+    stmt = select(
+        func.count().label("users_total"),
+        *[func.count(flags.c[_ts_column(step)]).label(label) for step, label, _ in FUNNEL_STEPS],
+    )
+    row = (await db.execute(stmt)).one()
+    return add_conversions(dict(row._mapping))
+
+
+def add_conversions(counts: Dict[str, Any]) -> Dict[str, Any]:
+    """Дописывает в counts (users_total и метки шагов) конверсии CONVERSIONS."""
+    total = counts["users_total"]
+    for step, name in CONVERSIONS:
+        label = FUNNEL_STEPS[step - 1][1]
+        counts[name] = round(100.0 * counts[label] / total, 1) if total else None
+    return counts
+
+
+def _percentile_cont(values: Sequence[float], fraction: float) -> Optional[float]:
+    """Линейная интерполяция, как percentile_cont в Postgres."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+async def duration_percentiles(
+    db: AsyncSession,
+    pairs: Sequence[Tuple[int, int]] = DURATION_PAIRS,
+) -> List[Dict[str, Any]]:
+    """p50/p90 длительности переходов между шагами, в секундах."""
+    rows = (await db.execute(step_timestamps_query())).all()
+    return transition_percentiles(rows, pairs)
+
+
+def transition_percentiles(rows: Sequence[Any], pairs: Sequence[Tuple[int, int]] = DURATION_PAIRS) -> List[Dict[str, Any]]:
+    """p50/p90 переходов по строкам с метками времени шагов (атрибуты ts_XX)."""
+    result = []
+    for start, end in pairs:
+        durations = [
+            (getattr(row, _ts_column(end)) - getattr(row, _ts_column(start))).total_seconds()
+            for row in rows
+            if getattr(row, _ts_column(start)) is not None and getattr(row, _ts_column(end)) is not None
+        ]
+        result.append({
+            "step": f"{start:02d}->{end:02d}",
+            "users": len(durations),
+            "p50_sec": _percentile_cont(durations, 0.5),
+            "p90_sec": _percentile_cont(durations, 0.9),
+        })
+    return result
+
+
+async def main() -> None:
+    from database import engine, read_session, replica_engine
+
+    async with read_session() as db:
+        counts = await funnel_counts(db)
+        percentiles = await duration_percentiles(db)
+    await engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
+
+    for name, value in counts.items():
+        print(f"{name:<30} {value}")
+    print()
+    for item in percentiles:
+        print(f"{item['step']}  users={item['users']:<6} p50={item['p50_sec']}  p90={item['p90_sec']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,8 +1,9 @@
 from aiogram import Router, F
+from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from sqlalchemy import select
-from database import AsyncSessionLocal
-from models import User, QuizScenario
+from models import QuizScenario
+from messaging import answer_photo_with_text
+from user_profile import load_profile
 
 common_cta_router = Router()
 
@@ -14,28 +15,18 @@ SCENARIO_RU_NAMES = {
 
 
 @common_cta_router.callback_query(F.data == "no_more_scenario")
-async def handle_no_more_scenario(callback: CallbackQuery):
-    async with AsyncSessionLocal() as db:
-        result = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+async def handle_no_more_scenario(callback: CallbackQuery, state: FSMContext):
+    profile = await load_profile(state, callback.from_user.id)
 
     scenario = None
     is_psychologist = False
-    if user:
-        scenario = user.main_quiz_scenario
-        is_psychologist = bool(user.is_psychologist)
-        if isinstance(scenario, str):
-            try:
-                scenario = QuizScenario(scenario)
-            except Exception:
-                scenario = None
+    if profile:
+        scenario = profile.scenario
+        is_psychologist = profile.is_psychologist
 
     scenario_ru = SCENARIO_RU_NAMES.get(scenario, "ваш сценарий")
 
     if is_psychologist:
-        await callback.message.answer_photo(photo="https://iimg.su/i/vJhw5A")
         text = (
             "<b>Сегодня вечером — важное видео для вас</b> 🎥\n\n"
             "Вы узнаете:\n"
@@ -44,7 +35,6 @@ async def handle_no_more_scenario(callback: CallbackQuery):
             "→ Что делать прямо сейчас, чтобы сдвинуться с мёртвой точки"
         )
     else:
-        await callback.message.answer_photo(photo="https://iimg.su/i/vJhw5A")
         text = (
             "<b>Сегодня вечером — важное видео для вас</b> 🎥\n\n"
             "В нём мы покажем:\n"
@@ -59,21 +49,16 @@ async def handle_no_more_scenario(callback: CallbackQuery):
         ]
     )
 
-    await callback.message.answer(text, parse_mode="HTML", reply_markup=keyboard)
-    await callback.answer()
+    await answer_photo_with_text(callback.message, "https://iimg.su/i/vJhw5A", text, keyboard)
 
 
 @common_cta_router.callback_query(F.data == "get_video")
-async def handle_get_video(callback: CallbackQuery):
-    async with AsyncSessionLocal() as db:
-        result = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+async def handle_get_video(callback: CallbackQuery, state: FSMContext):
+    profile = await load_profile(state, callback.from_user.id)
 
     user_name = None
-    if user:
-        user_name = user.user_name
+    if profile:
+        user_name = profile.user_name
 
     display_name = user_name or "Коллега"
 
@@ -95,7 +80,6 @@ async def handle_get_video(callback: CallbackQuery):
     )
 
     await callback.message.answer(text, parse_mode="HTML", reply_markup=keyboard)
-    await callback.answer()
 
 
 @common_cta_router.callback_query(F.data == "learn_how_to_change")
@@ -119,5 +103,4 @@ async def handle_learn_how_to_change(callback: CallbackQuery):
             ]
         ]
     )
-    await callback.message.answer(text, parse_mode="HTML", reply_markup=keyboard)
-    await callback.answer()
\ No newline at end of file
+    await callback.message.answer(text, parse_mode="HTML", reply_markup=keyboard)
\ No newline at end of file
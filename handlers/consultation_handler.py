@@ -1,38 +1,28 @@
 from aiogram import Router, F
+from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from sqlalchemy import select
 from loguru import logger
-from database import AsyncSessionLocal
-from models import User, QuizScenario
-from analytics import log_event
+from models import QuizScenario
+from analytics import log_event_nowait
+from messaging import answer_photo_with_text
+from user_profile import load_profile
 
 consultation_router = Router()
 
 
 @consultation_router.callback_query(F.data == "ready_for_next_step")
-async def handle_ready_for_next_step(callback: CallbackQuery):
+async def handle_ready_for_next_step(callback: CallbackQuery, state: FSMContext):
     """
     Обработчик кнопки 'Готов(а) к следующему шагу'.
     Показывает персонализированное сообщение в зависимости от сценария.
     """
-    async with AsyncSessionLocal() as db:
-        result = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+    profile = await load_profile(state, callback.from_user.id)
 
-    if not user:
+    if not profile:
         await callback.message.answer("Ошибка: пользователь не найден.")
-        await callback.answer()
         return
 
-    # Приводим сценарий к Enum если хранится строкой
-    scenario = user.main_quiz_scenario
-    if isinstance(scenario, str):
-        try:
-            scenario = QuizScenario(scenario)
-        except Exception:
-            scenario = None
+    scenario = profile.scenario
 
     logger.info(
         f"Пользователь {callback.from_user.id} готов к следующему шагу. "
@@ -100,9 +90,7 @@ async def handle_ready_for_next_step(callback: CallbackQuery):
         ]
     )
 
-    await callback.message.answer_photo(photo="https://iimg.su/i/qZGxoI")
-    await callback.message.answer(text, parse_mode="HTML", reply_markup=keyboard)
-    await callback.answer()
+    await answer_photo_with_text(callback.message, "https://iimg.su/i/qZGxoI", text, keyboard)
 
 
 @consultation_router.callback_query(F.data == "book_consultation")
@@ -134,11 +122,9 @@ async def handle_book_consultation(callback: CallbackQuery):
         ]
     )
 
-    await callback.message.answer_photo(photo="https://iimg.su/i/QAU3sg")
-    await callback.message.answer(text, parse_mode="HTML", reply_markup=keyboard)
-    await callback.answer()
+    await answer_photo_with_text(callback.message, "https://iimg.su/i/QAU3sg", text, keyboard)
     # Аналитика: пользователь нажал 'Записаться на диагностику'
-    await log_event(
+    log_event_nowait(
         user_telegram_id=callback.from_user.id,
         event_code="book_consultation_clicked",
     )
@@ -6,7 +6,10 @@ from loguru import logger
 from sqlalchemy import select
 from database import AsyncSessionLocal
 from models import User, Quiz, NonPsychQuizResult
-from analytics import log_event
+from quiz_cache import get_quiz_id, remember_quiz
+from analytics import log_event_nowait
+from messaging import answer_photo_with_text
+import formulas
 
 non_psych_cost_router = Router()
 
@@ -69,9 +72,8 @@ async def calc_scenario_cost_non_psych(callback: CallbackQuery, state: FSMContex
         reply_markup=keyboard,
     )
     await state.set_state(NonPsychQuizStates.waiting_q1_months)
-    await callback.answer()
     # Событие: старт квиза не-психолога
-    await log_event(
+    log_event_nowait(
         user_telegram_id=callback.from_user.id,
         event_code="non_psych_quiz_started",
         quiz_code="non_psych_quiz_1",
@@ -122,7 +124,6 @@ async def process_q1_months(callback: CallbackQuery, state: FSMContext):
         reply_markup=keyboard,
     )
     await state.set_state(NonPsychQuizStates.waiting_q2_frequency)
-    await callback.answer()
 
 
 @non_psych_cost_router.callback_query(
@@ -164,33 +165,39 @@ async def process_q2_frequency(callback: CallbackQuery, state: FSMContext):
         reply_markup=keyboard,
     )
     await state.set_state(NonPsychQuizStates.waiting_q3_sabotage)
-    await callback.answer()
 
 
 @non_psych_cost_router.callback_query(
     NonPsychQuizStates.waiting_q3_sabotage,
-    F.data.startswith("q3_")
+    F.data == "q3_done"
+)
+async def process_q3_done(callback: CallbackQuery, state: FSMContext):
+    """
+    Вопрос 3: кнопка «Готово» — завершение выбора, переходим к подсчёту.
+    """
+    data = await state.get_data()
+    logger.info(
+        "Пользователь {} завершил выбор саботажа, выбрано: {}",
+        callback.from_user.id,
+        len(data.get("sabotage_codes", [])),
+    )
+    await show_non_psych_result(callback, state)
+
+
+# Отвечает на нажатие сам — уведомлением с числом выбранных пунктов
+@non_psych_cost_router.callback_query(
+    NonPsychQuizStates.waiting_q3_sabotage,
+    F.data.startswith("q3_"),
+    flags={"callback_answer": False},
 )
 async def process_q3_sabotage(callback: CallbackQuery, state: FSMContext):
     """
     Обработка вопроса 3: чекбоксы саботажа.
-    Можно выбрать несколько. callback_data = 'q3_done' — завершение.
+    Можно выбрать несколько; каждый вариант q3_... добавляется или убирается (тогл).
     """
     data = await state.get_data()
     sabotage_codes = data.get("sabotage_codes", [])
 
-    if callback.data == "q3_done":
-        # Завершение выбора — переходим к подсчёту
-        logger.info(
-            "Пользователь {} завершил выбор саботажа, выбрано: {}",
-            callback.from_user.id,
-            len(sabotage_codes),
-        )
-        await show_non_psych_result(callback, state)
-        return
-
-    # Иначе — это один из вариантов q3_...
-    # Добавляем/убираем из списка (тогл)
     if callback.data in sabotage_codes:
         sabotage_codes.remove(callback.data)
         action = "снят"
@@ -226,10 +233,11 @@ async def show_non_psych_result(callback: CallbackQuery, state: FSMContext):
     sabotage_codes = data.get("sabotage_codes", [])
 
     # Расчёты
-    days_in_psychology = round(months * 365 / 12)
-    thoughts_count = months * coef
     sabotage_items_count = len(sabotage_codes)
-    sabotage_forms_total = 4 + sabotage_items_count
+    derived = formulas.non_psych(months, coef, sabotage_items_count)
+    days_in_psychology = derived["days_in_psychology"]
+    thoughts_count = derived["thoughts_count"]
+    sabotage_forms_total = derived["sabotage_forms_total"]
 
     logger.info(
         "Подсчёт результата: months={}, coef={}, sabotage_count={}, "
@@ -257,11 +265,8 @@ async def show_non_psych_result(callback: CallbackQuery, state: FSMContext):
 
         # Получаем квиз (или создаём)
         quiz_code = "non_psych_quiz_1"
-        result = await db.execute(
-            select(Quiz).where(Quiz.code == quiz_code)
-        )
-        quiz = result.scalar_one_or_none()
-        if not quiz:
+        quiz_id = await get_quiz_id(db, quiz_code)
+        if not quiz_id:
             quiz = Quiz(
                 code=quiz_code,
                 title="Квиз упущенного потенциала (не-психолог)",
@@ -270,19 +275,20 @@ async def show_non_psych_result(callback: CallbackQuery, state: FSMContext):
             db.add(quiz)
             await db.commit()
             await db.refresh(quiz)
+            quiz_id = quiz.id
+            remember_quiz(quiz_code, quiz_id)
 
         # Создаём запись результата
         quiz_result = NonPsychQuizResult(
             user_id=user.id,
-            quiz_id=quiz.id,
+            quiz_id=quiz_id,
             is_psychologist_snapshot=False,
             months_in_psychology=months,
             frequency_coef=coef,
             sabotage_items_count=sabotage_items_count,
             sabotage_items_codes=",".join(sabotage_codes) if sabotage_codes else None,
-            days_in_psychology=days_in_psychology,
-            thoughts_count=thoughts_count,
-            sabotage_forms_total=sabotage_forms_total,
+            formula_version=formulas.NON_PSYCH_FORMULA_VERSION,
+            **derived,
         )
         db.add(quiz_result)
         await db.commit()
@@ -300,7 +306,6 @@ async def show_non_psych_result(callback: CallbackQuery, state: FSMContext):
     user_name = callback.from_user.first_name or "Друг"
 
     # Формируем сообщение с результатом
-    await callback.message.answer_photo(photo="https://iimg.su/i/RHk9mb")
     result_text = (
         f"<b>{user_name}, вот что получилось:</b>\n\n"
         f"✦ Вы прожили <b>{days_in_psychology} дней</b> в поле психологии — "
@@ -328,16 +333,11 @@ async def show_non_psych_result(callback: CallbackQuery, state: FSMContext):
         )]
     ])
 
-    await callback.message.answer(
-        result_text,
-        parse_mode="HTML",
-        reply_markup=keyboard,
-    )
+    await answer_photo_with_text(callback.message, "https://iimg.su/i/RHk9mb", result_text, keyboard)
 
     await state.clear()
-    await callback.answer()
     # Событие: завершение квиза не-психолога
-    await log_event(
+    log_event_nowait(
         user_telegram_id=callback.from_user.id,
         event_code="non_psych_quiz_completed",
         payload={
@@ -1,29 +1,33 @@
 from aiogram import Router, F
-from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.sql import func
 from database import AsyncSessionLocal
-from models import User, Quiz, QuizResult, QuizScenario
+from models import User, QuizResult
+from quiz_cache import get_quiz_id
 from loguru import logger
-from analytics import log_event
+from logging_setup import sampled
+from analytics import log_event_nowait
+from messaging import answer_photo_with_text
+from user_profile import save_profile
+from quiz_engine import START_CALLBACK_PREFIX, QuizDefinition, get_quiz, is_answer
+from quiz_definitions import MAIN_PSYCH_QUIZ
 
 # Создаем роутер для квиза
 quiz_router = Router()
 
-# Определяем состояния FSM для квиза
+# Пишется на каждый ответ — сэмплируется (logging_setup.py)
+_answer_log = sampled("quiz.answer")
+
+# Состояние FSM для квизов на quiz_engine: код квиза и номер вопроса — в данных
 class QuizStates(StatesGroup):
-    question_1 = State()
-    question_2 = State()
-    question_3 = State()
-    question_4 = State()
-    question_5 = State()
+    answering = State()
 
 
-# --- Обработчик кнопки "Начать квиз" ---
-@quiz_router.callback_query(F.data == "start_quiz")
-async def start_quiz(callback: CallbackQuery, state: FSMContext):
+async def begin_quiz(callback: CallbackQuery, state: FSMContext, quiz: QuizDefinition):
+    """Создаёт запись результата квиза и задаёт первый вопрос."""
     async with AsyncSessionLocal() as db:
         # Получаем пользователя
         result = await db.execute(
@@ -33,359 +37,103 @@ async def start_quiz(callback: CallbackQuery, state: FSMContext):
         
         if not user:
             await callback.message.answer("Ошибка: пользователь не найден.")
-            await callback.answer()
             return
         
-        # Получаем квиз
-        quiz_result = await db.execute(
-            select(Quiz).where(Quiz.code == "main_psych_quiz")
-        )
-        quiz = quiz_result.scalar_one_or_none()
+        # Получаем квиз (id из кэша)
+        quiz_id = await get_quiz_id(db, quiz.code)
         
-        if not quiz:
+        if not quiz_id:
             await callback.message.answer("Ошибка: квиз не найден в базе данных.")
-            await callback.answer()
             return
         
         # Создаем запись результата квиза
         new_quiz_result = QuizResult(
             user_id=user.id,
-            quiz_id=quiz.id,
-            impostor_score=0,
-            eternal_student_score=0,
-            seeker_score=0
+            quiz_id=quiz_id,
+            **quiz.initial_scores()
         )
         db.add(new_quiz_result)
         await db.commit()
         await db.refresh(new_quiz_result)
         
-        # Сохраняем ID результата квиза в состоянии
-        await state.update_data(quiz_result_id=new_quiz_result.id)
+        # Сохраняем ID результата, код квиза и номер вопроса в состоянии
+        await state.update_data(quiz_result_id=new_quiz_result.id, quiz_code=quiz.code, quiz_question=0)
         
-        logger.info(f"Квиз начат пользователем {user.telegram_id}, quiz_result_id={new_quiz_result.id}")
+        logger.info("Квиз {} начат пользователем {}, quiz_result_id={}", quiz.code, user.telegram_id, new_quiz_result.id)
         # Логируем начало квиза
-        await log_event(
+        log_event_nowait(
             user_telegram_id=callback.from_user.id,
-            event_code="quiz_started",
+            event_code=quiz.start_event,
             payload={"quiz_result_id": new_quiz_result.id},
-            quiz_code="main_psych_quiz",
+            quiz_code=quiz.code,
         )
     
     # Отправляем первый вопрос
-    question_text = "<b>🧠 Когда вы думаете о том, чтобы двигаться глубже в психологию…</b>"
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(
-            text="«А вдруг я сделаю что-то не так и наврежу?»",
-            callback_data="q1_impostor"
-        )],
-        [InlineKeyboardButton(
-            text="«А вдруг не про меня? Вдруг снова передумаю?»",
-            callback_data="q1_seeker"
-        )],
-        [InlineKeyboardButton(
-            text="«Хочу всё продумать: упаковку, клиентов...»",
-            callback_data="q1_eternal_student"
-        )]
-    ])
-    
-    await callback.message.answer(question_text, parse_mode="HTML", reply_markup=keyboard)
-    await state.set_state(QuizStates.question_1)
-    await callback.answer()
+    await callback.message.answer(quiz.questions[0].text, parse_mode="HTML", reply_markup=quiz.keyboards[0])
+    await state.set_state(QuizStates.answering)
 
 
-# --- Обработчики ответов на первый вопрос ---
-@quiz_router.callback_query(F.data.startswith("q1_"), QuizStates.question_1)
-async def question_1_answered(callback: CallbackQuery, state: FSMContext):
-    answer = callback.data.replace("q1_", "")
-    
-    # Получаем ID результата квиза из состояния
-    user_data = await state.get_data()
-    quiz_result_id = user_data.get("quiz_result_id")
-    
-    if not quiz_result_id:
-        await callback.message.answer("Ошибка: не удалось найти результат квиза.")
-        await callback.answer()
-        return
-    
-    # Обновляем счетчики в базе данных
-    async with AsyncSessionLocal() as db:
-        result = await db.execute(
-            select(QuizResult).where(QuizResult.id == quiz_result_id)
-        )
-        quiz_result = result.scalar_one_or_none()
-        
-        if quiz_result:
-            if answer == "impostor":
-                quiz_result.impostor_score += 1
-                logger.info(f"Quiz {quiz_result_id}: +1 impostor (total={quiz_result.impostor_score})")
-            elif answer == "seeker":
-                quiz_result.seeker_score += 1
-                logger.info(f"Quiz {quiz_result_id}: +1 seeker (total={quiz_result.seeker_score})")
-            elif answer == "eternal_student":
-                quiz_result.eternal_student_score += 1
-                logger.info(f"Quiz {quiz_result_id}: +1 eternal_student (total={quiz_result.eternal_student_score})")
-            
-            await db.commit()
-        else:
-            await callback.message.answer("Ошибка: не удалось найти результат квиза.")
-            await callback.answer()
-            return
-    
-    # Отправляем второй вопрос
-    question_text = "<b>🗣 Если близкий человек критикует вас, ваша реакция:</b>"
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(
-            text="«Оправдываюсь, спорю и стараюсь лучше»",
-            callback_data="q2_eternal_student"
-        )],
-        [InlineKeyboardButton(
-            text="«Молчу, выпадаю и сомневаюсь в себе»",
-            callback_data="q2_seeker"
-        )],
-        [InlineKeyboardButton(
-            text="«Чувствую: я недостаточно хорош(а)»",
-            callback_data="q2_impostor"
-        )]
-    ])
-    
-    await callback.message.answer(question_text, parse_mode="HTML", reply_markup=keyboard)
-    await state.set_state(QuizStates.question_2)
-    await callback.answer()
+# --- Обработчик кнопки "Начать квиз" ---
+@quiz_router.callback_query(F.data == "start_quiz")
+async def start_quiz(callback: CallbackQuery, state: FSMContext):
+    await begin_quiz(callback, state, MAIN_PSYCH_QUIZ)
 
 
-# --- Обработчики ответов на второй вопрос ---
-@quiz_router.callback_query(F.data.startswith("q2_"), QuizStates.question_2)
-async def question_2_answered(callback: CallbackQuery, state: FSMContext):
-    answer = callback.data.replace("q2_", "")
-    
-    # Получаем ID результата квиза из состояния
-    user_data = await state.get_data()
-    quiz_result_id = user_data.get("quiz_result_id")
-    
-    if not quiz_result_id:
-        await callback.message.answer("Ошибка: не удалось найти результат квиза.")
-        await callback.answer()
+# --- Запуск любого квиза из quiz_definitions по кнопке "start_quiz:<code>" ---
+@quiz_router.callback_query(F.data.startswith(START_CALLBACK_PREFIX))
+async def start_quiz_by_code(callback: CallbackQuery, state: FSMContext):
+    quiz = get_quiz(callback.data[len(START_CALLBACK_PREFIX):])
+    if quiz is None:
         return
-    
-    # Обновляем счетчики в базе данных
-    async with AsyncSessionLocal() as db:
-        result = await db.execute(
-            select(QuizResult).where(QuizResult.id == quiz_result_id)
-        )
-        quiz_result = result.scalar_one_or_none()
-        
-        if quiz_result:
-            if answer == "impostor":
-                quiz_result.impostor_score += 1
-                logger.info(f"Quiz {quiz_result_id}: +1 impostor (total={quiz_result.impostor_score})")
-            elif answer == "seeker":
-                quiz_result.seeker_score += 1
-                logger.info(f"Quiz {quiz_result_id}: +1 seeker (total={quiz_result.seeker_score})")
-            elif answer == "eternal_student":
-                quiz_result.eternal_student_score += 1
-                logger.info(f"Quiz {quiz_result_id}: +1 eternal_student (total={quiz_result.eternal_student_score})")
-            
-            await db.commit()
-        else:
-            await callback.message.answer("Ошибка: не удалось найти результат квиза.")
-            await callback.answer()
-            return
-    
-    # Отправляем третий вопрос
-    question_text = "<b>🚧 Что вас больше всего тормозит?</b>"
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(
-            text="«Учусь и ищу, но не могу определиться»",
-            callback_data="q3_seeker"
-        )],
-        [InlineKeyboardButton(
-            text="«Хватит ли знаний помогать и брать деньги?»",
-            callback_data="q3_impostor"
-        )],
-        [InlineKeyboardButton(
-            text="«Хочу довести до идеала перед действием»",
-            callback_data="q3_eternal_student"
-        )]
-    ])
-    
-    await callback.message.answer(question_text, parse_mode="HTML", reply_markup=keyboard)
-    await state.set_state(QuizStates.question_3)
-    await callback.answer()
+    await begin_quiz(callback, state, quiz)
 
 
-# --- Обработчики ответов на третий вопрос ---
-@quiz_router.callback_query(F.data.startswith("q3_"), QuizStates.question_3)
-async def question_3_answered(callback: CallbackQuery, state: FSMContext):
-    answer = callback.data.replace("q3_", "")
-    
-    # Получаем ID результата квиза из состояния
+# --- Один обработчик ответов на все вопросы всех квизов ---
+@quiz_router.callback_query(QuizStates.answering, F.data.func(is_answer))
+async def question_answered(callback: CallbackQuery, state: FSMContext):
+    # Получаем ID результата квиза и текущий вопрос из состояния
     user_data = await state.get_data()
     quiz_result_id = user_data.get("quiz_result_id")
+    quiz = get_quiz(user_data.get("quiz_code") or MAIN_PSYCH_QUIZ.code)
     
-    if not quiz_result_id:
+    if not quiz_result_id or quiz is None:
         await callback.message.answer("Ошибка: не удалось найти результат квиза.")
-        await callback.answer()
         return
     
-    # Обновляем счетчики в базе данных
-    async with AsyncSessionLocal() as db:
-        result = await db.execute(
-            select(QuizResult).where(QuizResult.id == quiz_result_id)
-        )
-        quiz_result = result.scalar_one_or_none()
-        
-        if quiz_result:
-            if answer == "impostor":
-                quiz_result.impostor_score += 1
-                logger.info(f"Quiz {quiz_result_id}: +1 impostor (total={quiz_result.impostor_score})")
-            elif answer == "seeker":
-                quiz_result.seeker_score += 1
-                logger.info(f"Quiz {quiz_result_id}: +1 seeker (total={quiz_result.seeker_score})")
-            elif answer == "eternal_student":
-                quiz_result.eternal_student_score += 1
-                logger.info(f"Quiz {quiz_result_id}: +1 eternal_student (total={quiz_result.eternal_student_score})")
-            
-            await db.commit()
-        else:
-            await callback.message.answer("Ошибка: не удалось найти результат квиза.")
-            await callback.answer()
-            return
-    
-    # Отправляем четвёртый вопрос
-    question_text = "<b>✨ Когда у вас что-то получается хорошо, первая мысль:</b>"
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(
-            text="«Круто, но не чувствую, что это моё»",
-            callback_data="q4_seeker"
-        )],
-        [InlineKeyboardButton(
-            text="«Наверное повезло, другие лучше бы справились»",
-            callback_data="q4_impostor"
-        )],
-        [InlineKeyboardButton(
-            text="«Хорошо, но вижу, где можно было лучше»",
-            callback_data="q4_eternal_student"
-        )]
-    ])
-    
-    await callback.message.answer(question_text, parse_mode="HTML", reply_markup=keyboard)
-    await state.set_state(QuizStates.question_4)
-    await callback.answer()
-
-
-# --- Обработчики ответов на четвёртый вопрос ---
-@quiz_router.callback_query(F.data.startswith("q4_"), QuizStates.question_4)
-async def question_4_answered(callback: CallbackQuery, state: FSMContext):
-    answer = callback.data.replace("q4_", "")
-    
-    # Получаем ID результата квиза из состояния
-    user_data = await state.get_data()
-    quiz_result_id = user_data.get("quiz_result_id")
-    
-    if not quiz_result_id:
-        await callback.message.answer("Ошибка: не удалось найти результат квиза.")
-        await callback.answer()
+    route = quiz.route(callback.data)
+    current = user_data.get("quiz_question", 0)
+    if route is None or route[0] != current:
+        # Кнопка другого квиза или уже отвеченного вопроса
         return
+    index, weights = route
     
-    # Обновляем счетчики в базе данных
+    # Прибавляем веса ответа к счетчикам одним UPDATE
+    increments = quiz.score_increments(weights)
     async with AsyncSessionLocal() as db:
-        result = await db.execute(
-            select(QuizResult).where(QuizResult.id == quiz_result_id)
-        )
-        quiz_result = result.scalar_one_or_none()
-        
-        if quiz_result:
-            if answer == "impostor":
-                quiz_result.impostor_score += 1
-                logger.info(f"Quiz {quiz_result_id}: +1 impostor (total={quiz_result.impostor_score})")
-            elif answer == "seeker":
-                quiz_result.seeker_score += 1
-                logger.info(f"Quiz {quiz_result_id}: +1 seeker (total={quiz_result.seeker_score})")
-            elif answer == "eternal_student":
-                quiz_result.eternal_student_score += 1
-                logger.info(f"Quiz {quiz_result_id}: +1 eternal_student (total={quiz_result.eternal_student_score})")
-            
+        updated = 1
+        if increments:
+            result = await db.execute(
+                update(QuizResult).where(QuizResult.id == quiz_result_id).values(**increments)
+            )
+            updated = result.rowcount
             await db.commit()
-        else:
-            await callback.message.answer("Ошибка: не удалось найти результат квиза.")
-            await callback.answer()
-            return
     
-    # Отправляем пятый вопрос
-    question_text = "<b>🚀 Перед важным шагом вы чаще:</b>"
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(
-            text="«Сомневаюсь и ищу подтверждения, что справлюсь»",
-            callback_data="q5_impostor"
-        )],
-        [InlineKeyboardButton(
-            text="«Составляю план, чтобы учесть риски»",
-            callback_data="q5_eternal_student"
-        )],
-        [InlineKeyboardButton(
-            text="«Колеблюсь: а точно ли это тот шаг?»",
-            callback_data="q5_seeker"
-        )]
-    ])
-    
-    await callback.message.answer(question_text, parse_mode="HTML", reply_markup=keyboard)
-    await state.set_state(QuizStates.question_5)
-    await callback.answer()
-
-
-# --- Обработчики ответов на пятый вопрос ---
-@quiz_router.callback_query(F.data.startswith("q5_"), QuizStates.question_5)
-async def question_5_answered(callback: CallbackQuery, state: FSMContext):
-    answer = callback.data.replace("q5_", "")
-    
-    # Получаем ID результата квиза из состояния
-    user_data = await state.get_data()
-    quiz_result_id = user_data.get("quiz_result_id")
-    
-    if not quiz_result_id:
+    if not updated:
         await callback.message.answer("Ошибка: не удалось найти результат квиза.")
-        await callback.answer()
         return
+    _answer_log.info("Quiz {}: вопрос {}, ответ {}, веса {}", quiz_result_id, index + 1, callback.data, weights)
     
-    # Обновляем счетчики в базе данных
-    async with AsyncSessionLocal() as db:
-        result = await db.execute(
-            select(QuizResult).where(QuizResult.id == quiz_result_id)
-        )
-        quiz_result = result.scalar_one_or_none()
-        
-        if quiz_result:
-            if answer == "impostor":
-                quiz_result.impostor_score += 1
-                logger.info(f"Quiz {quiz_result_id}: +1 impostor (total={quiz_result.impostor_score})")
-            elif answer == "seeker":
-                quiz_result.seeker_score += 1
-                logger.info(f"Quiz {quiz_result_id}: +1 seeker (total={quiz_result.seeker_score})")
-            elif answer == "eternal_student":
-                quiz_result.eternal_student_score += 1
-                logger.info(f"Quiz {quiz_result_id}: +1 eternal_student (total={quiz_result.eternal_student_score})")
-            
-            await db.commit()
-        else:
-            await callback.message.answer("Ошибка: не удалось найти результат квиза.")
-            await callback.answer()
-            return
-    
-    # Показываем кнопку для результатов
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(
-            text="Узнать результаты сценариев",
-            callback_data="show_quiz_results"
-        )]
-    ])
-    
-    await callback.message.answer("Квиз завершен!", reply_markup=keyboard)
-    await callback.answer()
+    next_index = index + 1
+    if next_index < len(quiz.questions):
+        # Отправляем следующий вопрос
+        question = quiz.questions[next_index]
+        await callback.message.answer(question.text, parse_mode="HTML", reply_markup=quiz.keyboards[next_index])
+        await state.update_data(quiz_question=next_index)
+    else:
+        # Показываем кнопку для результатов; данные (quiz_result_id) остаются в состоянии
+        await callback.message.answer(quiz.finish_text, reply_markup=quiz.finish_keyboard)
+        await state.update_data(quiz_question=next_index)
+        await state.set_state(None)
 
 
 # --- Обработчик показа результатов квиза ---
@@ -397,7 +145,6 @@ async def show_quiz_results(callback: CallbackQuery, state: FSMContext):
     
     if not quiz_result_id:
         await callback.message.answer("Ошибка: не удалось найти результат квиза.")
-        await callback.answer()
         return
     
     # Получаем результаты из базы данных
@@ -409,99 +156,47 @@ async def show_quiz_results(callback: CallbackQuery, state: FSMContext):
         
         if not quiz_result:
             await callback.message.answer("Ошибка: не удалось найти результат квиза.")
-            await callback.answer()
             return
         
-        # Определяем доминирующий сценарий
-        scores = {
-            'impostor': quiz_result.impostor_score,
-            'seeker': quiz_result.seeker_score,
-            'eternal_student': quiz_result.eternal_student_score
-        }
+        # Определяем доминирующий сценарий (при равенстве — по порядку сценариев квиза)
+        quiz = get_quiz(user_data.get("quiz_code") or MAIN_PSYCH_QUIZ.code) or MAIN_PSYCH_QUIZ
+        dominant_scenario_key = quiz.dominant(quiz.totals_of(quiz_result))
+        # Строковое значение для совместимости с БД (например 'impostor')
+        dominant_value = quiz.stored_scenario(dominant_scenario_key)
         
-        dominant_scenario_key = max(scores, key=scores.get)
-        dominant_scenario = QuizScenario[dominant_scenario_key.upper()]
-        dominant_value = dominant_scenario.value  # сохраняем строковое значение для совместимости с БД
-        
-        # Сохраняем доминирующий сценарий в базе (как строку, например 'impostor')
         quiz_result.dominant_scenario = dominant_value
         quiz_result.is_completed = True
         quiz_result.finished_at = func.now()
         
-        # Также сохраняем в профиль пользователя
-        user_result = await db.execute(
-            select(User).where(User.id == quiz_result.user_id)
-        )
-        user = user_result.scalar_one_or_none()
-        if user:
-            # Сохраняем строковое значение в профиль пользователя
-            user.main_quiz_scenario = dominant_value
+        # Профиль пользователя хранит итог только основного квиза
+        user = None
+        if quiz.sets_main_scenario:
+            user_result = await db.execute(
+                select(User).where(User.id == quiz_result.user_id)
+            )
+            user = user_result.scalar_one_or_none()
+            if user:
+                user.main_quiz_scenario = dominant_value
         
         await db.commit()
+        if user:
+            await save_profile(state, user)
         
-        logger.info(f"Quiz {quiz_result_id} completed. Dominant scenario: {dominant_scenario_key}")
+        logger.info("Quiz {} ({}) completed. Dominant scenario: {}", quiz_result_id, quiz.code, dominant_scenario_key)
         # Логируем завершение квиза
-        await log_event(
+        log_event_nowait(
             user_telegram_id=callback.from_user.id,
             event_code="quiz_completed",
             payload={
                 "quiz_result_id": quiz_result_id,
                 "dominant_scenario": dominant_value,
             },
-            quiz_code="main_psych_quiz",
+            quiz_code=quiz.code,
         )
         
-        # Формируем сообщение в зависимости от сценария
-        if dominant_scenario == QuizScenario.IMPOSTOR:
-            await callback.message.answer_photo(photo="https://iimg.su/i/UaYJno")
-            result_text = (
-                "<b>Мы рассчитали ваш преобладающий сценарий.</b>\n"
-                "Внимание — это не ярлык, а точка осознанности.\n\n"
-                "🔑 Ваш сценарий — <b>«Синдром самозванца»</b>\n"
-                "Вы часто чувствуете, что знаний или опыта недостаточно. "
-                "Из-за этого сложно поднять цену или даже начать консультировать.\n\n"
-                "✨ Дойдите до конца — и мы покажем, как перестать ждать \"ещё одного диплома\" "
-                "и начать работать с тем, что уже есть.\n\n"
-                "<b>На следующем этапе вы увидите, как именно ваш сценарий влияет на вашу жизнь — "
-                "и почему вы теряете больше, чем кажется.</b>"
-            )
-        elif dominant_scenario == QuizScenario.ETERNAL_STUDENT:
-            await callback.message.answer_photo(photo="https://iimg.su/i/qAA138")
-            result_text = (
-                "<b>Мы рассчитали ваш преобладающий сценарий.</b>\n"
-                "Внимание — это не ярлык, а точка осознанности.\n\n"
-                "🔑 Ваш сценарий — <b>«Вечный ученик»</b>\n"
-                "Вы хотите сделать всё идеально — чтобы было «по уму», без ошибок и хаоса. "
-                "Но именно это желание тормозит: вы откладываете действия, пока не будет идеального плана.\n\n"
-                "✨ Дойдите до конца — и мы покажем, как выйти из паралича \"всё должно быть идеально\" "
-                "и начать двигаться прямо сейчас.\n\n"
-                "<b>На следующем этапе вы увидите, как именно ваш сценарий влияет на вашу жизнь — "
-                "и почему вы теряете больше, чем кажется.</b>"
-            )
-        else:  # QuizScenario.SEEKER
-            await callback.message.answer_photo(photo="https://iimg.su/i/OttTic")
-            result_text = (
-                "<b>Мы рассчитали ваш преобладающий сценарий.\n"
-                "Внимание — это не ярлык, а точка осознанности.</b>\n\n"
-                "🔑 Ваш сценарий — <b>«Искатель своего»</b>\n"
-                "Вы постоянно ищете, анализируете, пробуете разные направления. "
-                "Но чем больше думаете — тем труднее сделать выбор и двинуться дальше. "
-                "Сомнения забирают энергию и уверенность.\n\n"
-                "✨ Дойдите до конца — и мы покажем, как прекратить бесконечный поиск \"правильного пути\" "
-                "и наконец сделать выбор.\n\n"
-                "<b>На следующем этапе вы увидите, как именно ваш сценарий влияет на вашу жизнь — "
-                "и почему вы теряете больше, чем кажется.</b>"
-            )
-        
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(
-                text="Хочу узнать цену своего сценария",
-                callback_data="learn_scenario_cost"
-            )]
-        ])
-        
-        await callback.message.answer(result_text, parse_mode="HTML", reply_markup=keyboard)
+        # Экран результата для сценария — из описания квиза
+        photo, result_text = quiz.result_screen(dominant_scenario_key)
+        await answer_photo_with_text(callback.message, photo, result_text, quiz.results_keyboard)
     
     await state.clear()
-    await callback.answer()
 
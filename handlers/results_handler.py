@@ -1,25 +1,20 @@
 from aiogram import Router, F
-from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, InputFile
-from sqlalchemy import select
-from database import AsyncSessionLocal
-from models import User
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from user_profile import load_profile
+from messaging import answer_photo_with_text
 
 results_router = Router()
 
 
 @results_router.callback_query(F.data == "view_participant_results")
-async def handle_view_participant_results(callback: CallbackQuery):
-    async with AsyncSessionLocal() as db:
-        result = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+async def handle_view_participant_results(callback: CallbackQuery, state: FSMContext):
+    profile = await load_profile(state, callback.from_user.id)
 
-    is_psych = bool(user and user.is_psychologist)
+    is_psych = bool(profile and profile.is_psychologist)
 
     if is_psych:
-        await callback.message.answer_photo(photo="https://iimg.su/i/tRGYFX")
-
+        photo = "https://iimg.su/i/tRGYFX"
         text = (
             '⭐️ <b>Дина: от сомнений «не моё ли это?» до 2-х повышений чека '
             'и финансовой независимости</b>\n\n'
@@ -53,7 +48,7 @@ async def handle_view_participant_results(callback: CallbackQuery):
             'уверенность в себе и открывает новый уровень жизни 💚'
         )
     else:
-        await callback.message.answer_photo(photo="https://iimg.su/i/jRIJJE")
+        photo = "https://iimg.su/i/jRIJJE"
         text = (
             '⭐️ <b>Гузель: от «даже у дворника работа интереснее» до '
             'замужества, дома, машины и дохода мужа в 10 раз больше</b>\n\n'
@@ -104,5 +99,4 @@ async def handle_view_participant_results(callback: CallbackQuery):
         ]
     )
 
-    await callback.message.answer(text, parse_mode="HTML", reply_markup=keyboard)
-    await callback.answer()
+    await answer_photo_with_text(callback.message, photo, text, keyboard)
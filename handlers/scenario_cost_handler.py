@@ -10,8 +10,12 @@ from aiogram.fsm.state import State, StatesGroup
 from loguru import logger
 from sqlalchemy import select
 from database import AsyncSessionLocal
-from models import User, QuizScenario, ScenarioCostResult, Quiz
-from analytics import log_event
+from models import User, QuizScenario, ScenarioCostResult
+from quiz_cache import get_quiz_id
+from analytics import log_event_nowait
+from messaging import answer_photo_with_text
+import formulas
+from user_profile import load_profile
 
 # Создаем роутер для обработчика цены сценария
 scenario_cost_router = Router()
@@ -73,20 +77,17 @@ async def calculate_scenario_cost(
             )
             return None
         
-        # Получаем квиз
-        quiz_result = await db.execute(
-            select(Quiz).where(Quiz.code == "main_psych_quiz")
-        )
-        quiz = quiz_result.scalar_one_or_none()
+        # Получаем квиз (id из кэша)
+        quiz_id = await get_quiz_id(db, "main_psych_quiz")
         
-        if not quiz:
+        if not quiz_id:
             logger.error("Квиз main_psych_quiz не найден в базе данных")
             return None
         
         # Расчет
-        lost_per_month = max(expected_income - current_income, 0)
-        lost_total = lost_per_month * months_delay
-        lost_3_years = lost_per_month * 36
+        derived = formulas.scenario_cost(expected_income, current_income, months_delay)
+        lost_total = derived["lost_total"]
+        lost_3_years = derived["lost_3_years"]
         
         # Приводим сценарий к Enum, если в БД хранится строка
         scenario_field = user.main_quiz_scenario
@@ -99,15 +100,14 @@ async def calculate_scenario_cost(
         # Создание записи
         cost_result = ScenarioCostResult(
             user_id=user.id,
-            quiz_id=quiz.id,
+            quiz_id=quiz_id,
             is_psychologist_snapshot=True,
             scenario=scenario_field,
             expected_income=expected_income,
             current_income=current_income,
             months_delay=months_delay,
-            lost_per_month=lost_per_month,
-            lost_total=lost_total,
-            lost_3_years=lost_3_years,
+            formula_version=formulas.SCENARIO_COST_FORMULA_VERSION,
+            **derived,
         )
         
         db.add(cost_result)
@@ -153,7 +153,6 @@ async def show_cost_results(callback: CallbackQuery, cost_result: ScenarioCostRe
         lost_total = f"{cost_result.lost_total:,}".replace(",", " ")
         lost_3_years = f"{cost_result.lost_3_years:,}".replace(",", " ")
         
-        await callback.message.answer_photo(photo="https://iimg.su/i/KEDC1J")
         result_text = (
             f"📊 {user_name}, смотрите:\n\n"
             f"→ Вы хотите зарабатывать {expected} ₽ в месяц, "
@@ -179,15 +178,13 @@ async def show_cost_results(callback: CallbackQuery, cost_result: ScenarioCostRe
             ]
         )
         
-        await callback.message.answer(
-            result_text, parse_mode="HTML", reply_markup=keyboard
-        )
+        await answer_photo_with_text(callback.message, "https://iimg.su/i/KEDC1J", result_text, keyboard)
 
 
 # Обработчик кнопки "Нет, не хочу" вынесен в общий модуль (common_cta_handler.py)
 
 @scenario_cost_router.callback_query(F.data == "learn_scenario_cost")
-async def learn_scenario_cost(callback: CallbackQuery):
+async def learn_scenario_cost(callback: CallbackQuery, state: FSMContext):
     """
     Обработчик для всех трех сценариев после завершения квиза.
     Показывает информацию о цене/последствиях текущего сценария пользователя.
@@ -197,29 +194,17 @@ async def learn_scenario_cost(callback: CallbackQuery):
         f"Пользователь {callback.from_user.id} нажал 'Узнать цену сценария'"
     )
 
-    async with AsyncSessionLocal() as db:
-        result = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+    profile = await load_profile(state, callback.from_user.id)
 
-    if not user:
+    if not profile:
         await callback.message.answer("Ошибка: пользователь не найден.")
-        await callback.answer()
         return
 
     # Ветка для психологов
-    if user.is_psychologist:
-        scenario = user.main_quiz_scenario
-        if isinstance(scenario, str):
-            try:
-                scenario = QuizScenario(scenario)
-            except Exception:
-                scenario = None
-        scenario_ru = SCENARIO_RU_NAMES.get(scenario, "[не определён]")
-        user_name = user.user_name or "Пользователь"
+    if profile.is_psychologist:
+        scenario_ru = SCENARIO_RU_NAMES.get(profile.scenario, "[не определён]")
+        user_name = profile.user_name or "Пользователь"
 
-        await callback.message.answer_photo(photo="https://iimg.su/i/dEO7x1")
         msg = (
             f"{user_name}, вы узнали свой блокирующий сценарий: "
             f"<b>\"{scenario_ru}\".</b>\n\n"
@@ -235,23 +220,13 @@ async def learn_scenario_cost(callback: CallbackQuery):
                 )]
             ]
         )
-        await callback.message.answer(
-            msg, parse_mode="HTML", reply_markup=keyboard
-        )
-        await callback.answer()
+        await answer_photo_with_text(callback.message, "https://iimg.su/i/dEO7x1", msg, keyboard)
         return
 
     # Ветка для не психологов
-    scenario = user.main_quiz_scenario
-    if isinstance(scenario, str):
-        try:
-            scenario = QuizScenario(scenario)
-        except Exception:
-            scenario = None
-    scenario_ru = SCENARIO_RU_NAMES.get(scenario, "[не определён]")
-    user_name = user.user_name or "Пользователь"
+    scenario_ru = SCENARIO_RU_NAMES.get(profile.scenario, "[не определён]")
+    user_name = profile.user_name or "Пользователь"
 
-    await callback.message.answer_photo(photo="https://iimg.su/i/2VayBn")
     msg = (
         f"{user_name}, вы узнали свой блокирующий сценарий: "
         f"<b>\"{scenario_ru}\"</b>.\n\n"
@@ -267,8 +242,7 @@ async def learn_scenario_cost(callback: CallbackQuery):
             )]
         ]
     )
-    await callback.message.answer(msg, parse_mode="HTML", reply_markup=keyboard)
-    await callback.answer()
+    await answer_photo_with_text(callback.message, "https://iimg.su/i/2VayBn", msg, keyboard)
 
 
 @scenario_cost_router.callback_query(F.data == "calc_scenario_cost")
@@ -308,9 +282,8 @@ async def calc_scenario_cost(callback: CallbackQuery, state: FSMContext):
         question_text, parse_mode="HTML", reply_markup=keyboard
     )
     await state.set_state(CostQuizStates.waiting_income_expected)
-    await callback.answer()
     # Событие: старт расчёта стоимости сценария (психолог)
-    await log_event(
+    log_event_nowait(
         user_telegram_id=callback.from_user.id,
         event_code="scenario_cost_started",
         quiz_code="main_psych_quiz",
@@ -328,7 +301,6 @@ async def question_1_answered(callback: CallbackQuery, state: FSMContext):
     
     if not expected_income:
         await callback.message.answer("Ошибка: некорректный ответ.")
-        await callback.answer()
         return
     
     # Сохраняем ответ в состоянии
@@ -368,7 +340,6 @@ async def question_1_answered(callback: CallbackQuery, state: FSMContext):
         question_text, parse_mode="HTML", reply_markup=keyboard
     )
     await state.set_state(CostQuizStates.waiting_income_current)
-    await callback.answer()
 
 
 @scenario_cost_router.callback_query(
@@ -382,7 +353,6 @@ async def question_2_answered(callback: CallbackQuery, state: FSMContext):
     
     if current_income is None:
         await callback.message.answer("Ошибка: некорректный ответ.")
-        await callback.answer()
         return
     
     # Сохраняем ответ в состоянии
@@ -423,7 +393,6 @@ async def question_2_answered(callback: CallbackQuery, state: FSMContext):
         question_text, parse_mode="HTML", reply_markup=keyboard
     )
     await state.set_state(CostQuizStates.waiting_months_delay)
-    await callback.answer()
 
 
 @scenario_cost_router.callback_query(
@@ -438,7 +407,6 @@ async def question_3_answered(callback: CallbackQuery, state: FSMContext):
     
     if not months_delay:
         await callback.message.answer("Ошибка: некорректный ответ.")
-        await callback.answer()
         return
     
     # Получаем все ответы из состояния
@@ -448,7 +416,6 @@ async def question_3_answered(callback: CallbackQuery, state: FSMContext):
     
     if not expected_income or current_income is None:
         await callback.message.answer("Ошибка: не все ответы сохранены.")
-        await callback.answer()
         return
     
     logger.info(
@@ -469,15 +436,13 @@ async def question_3_answered(callback: CallbackQuery, state: FSMContext):
         await callback.message.answer(
             "Ошибка: не удалось рассчитать стоимость сценария."
         )
-        await callback.answer()
         return
     
     # Показываем результаты
     await show_cost_results(callback, cost_result)
     await state.clear()
-    await callback.answer()
     # Событие: завершение расчёта стоимости сценария (психолог)
-    await log_event(
+    log_event_nowait(
         user_telegram_id=callback.from_user.id,
         event_code="scenario_cost_completed",
         payload={
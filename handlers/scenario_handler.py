@@ -5,16 +5,21 @@ from aiogram.fsm.state import State, StatesGroup
 from sqlalchemy import select
 from database import AsyncSessionLocal
 from models import User
-from analytics import log_event
+from analytics import log_event_nowait
+from lifecycle import spawn
+from messaging import answer_photo_with_text
+from user_profile import load_profile, save_profile
 import aiohttp
 import json
+import os
 from loguru import logger
+from tracing import http_trace_configs
 
 # Создаем роутер для этого обработчика
 router = Router()
 
 # URL webhook N8N
-N8N_WEBHOOK_URL = "https://superegocomp.app.n8n.cloud/webhook/data"
+N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL", "https://superegocomp.app.n8n.cloud/webhook/data")
 
 
 # Функция отправки данных в N8N
@@ -36,18 +41,18 @@ async def send_to_n8n(user_name: str, phone: str, user_type: str, telegram_usern
     }
     
     try:
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(trace_configs=http_trace_configs()) as session:
             async with session.post(
                 N8N_WEBHOOK_URL,
                 json=payload,
                 timeout=aiohttp.ClientTimeout(total=10)
             ) as response:
                 if response.status == 200:
-                    logger.info(f"N8N webhook успешно отправлен для {user_name} ({user_type})")
+                    logger.info("N8N webhook успешно отправлен для {} ({})", user_name, user_type)
                 else:
-                    logger.warning(f"N8N webhook вернул статус {response.status} для {user_name}")
+                    logger.warning("N8N webhook вернул статус {} для {}", response.status, user_name)
     except Exception as e:
-        logger.error(f"Ошибка отправки в N8N webhook: {e}")
+        logger.error("Ошибка отправки в N8N webhook: {}", e)
 
 
 # Определяем состояния FSM
@@ -63,10 +68,9 @@ class ScenarioStates(StatesGroup):
 async def start_scenario(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer("Как Вас зовут?")
     await state.set_state(ScenarioStates.waiting_for_name)
-    await callback.answer()
 
 # --- 2. Обработчик получения имени ---
-@router.message(ScenarioStates.waiting_for_name)
+@router.message(ScenarioStates.waiting_for_name, flags={"throttling": "free_text"})
 async def name_received(message: Message, state: FSMContext):
     await state.update_data(user_name=message.text)
     
@@ -93,8 +97,9 @@ async def name_confirmed(callback: CallbackQuery, state: FSMContext):
         if user_record:
             user_record.user_name = user_name
             await db.commit()
+            await save_profile(state, user_record)
             # Аналитика: подтверждение имени
-            await log_event(
+            log_event_nowait(
                 user_telegram_id=callback.from_user.id,
                 event_code="name_confirmed",
                 payload={"user_name": user_name}
@@ -103,22 +108,19 @@ async def name_confirmed(callback: CallbackQuery, state: FSMContext):
         else:
             await callback.message.answer("Произошла ошибка: не удалось найти ваш профиль.")
             await state.clear()
-            await callback.answer()
             return
             
     await callback.message.answer("Напишите Ваш номер телефона")
     await state.set_state(ScenarioStates.waiting_for_phone)
-    await callback.answer()
 
 # --- 4. Обработчик исправления имени ("Неверно") ---
 @router.callback_query(F.data == "name_confirm_incorrect", ScenarioStates.confirming_name)
 async def name_incorrect(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer("Пожалуйста, введите Ваше имя еще раз.")
     await state.set_state(ScenarioStates.waiting_for_name)
-    await callback.answer()
 
 # --- 5. Обработчик получения номера телефона ---
-@router.message(ScenarioStates.waiting_for_phone)
+@router.message(ScenarioStates.waiting_for_phone, flags={"throttling": "free_text"})
 async def phone_received(message: Message, state: FSMContext):
     await state.update_data(phone=message.text)
     
@@ -145,8 +147,9 @@ async def phone_confirmed(callback: CallbackQuery, state: FSMContext):
         if user_record:
             user_record.phone = phone
             await db.commit()
+            await save_profile(state, user_record)
             # Аналитика: подтверждение телефона
-            await log_event(
+            log_event_nowait(
                 user_telegram_id=callback.from_user.id,
                 event_code="phone_confirmed",
                 payload={"phone": phone}
@@ -155,7 +158,6 @@ async def phone_confirmed(callback: CallbackQuery, state: FSMContext):
         else:
             await callback.message.answer("Произошла ошибка: не удалось найти ваш профиль.")
             await state.clear()
-            await callback.answer()
             return
 
     # Задаем следующий вопрос
@@ -168,14 +170,12 @@ async def phone_confirmed(callback: CallbackQuery, state: FSMContext):
     
     await callback.message.answer(question_text, reply_markup=keyboard)
     await state.set_state(ScenarioStates.waiting_for_goal)
-    await callback.answer()
 
 # --- 7. Обработчик исправления телефона ("Неверно") ---
 @router.callback_query(F.data == "phone_confirm_incorrect", ScenarioStates.confirming_phone)
 async def phone_incorrect(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer("Пожалуйста, введите Ваш номер телефона еще раз.")
     await state.set_state(ScenarioStates.waiting_for_phone)
-    await callback.answer()
 
 # --- 8. Обработчик выбора цели ---
 @router.callback_query(F.data.startswith("goal_"), ScenarioStates.waiting_for_goal)
@@ -197,8 +197,9 @@ async def goal_selected(callback: CallbackQuery, state: FSMContext):
                 user_record.is_psychologist = False
             
             await db.commit()
+            await save_profile(state, user_record)
             # Аналитика: выбор цели
-            await log_event(
+            log_event_nowait(
                 user_telegram_id=callback.from_user.id,
                 event_code="goal_selected",
                 payload={
@@ -210,7 +211,6 @@ async def goal_selected(callback: CallbackQuery, state: FSMContext):
             await callback.message.answer("Спасибо, ваш выбор сохранен!")
             
             # Отправляем следующее сообщение
-            await callback.message.answer_photo(photo="https://iimg.su/i/XzuijO")
             user_name = user_record.user_name or "Друг"
             next_message = (
                 f"Супер, {user_name}!\n\n"
@@ -229,38 +229,34 @@ async def goal_selected(callback: CallbackQuery, state: FSMContext):
                 [InlineKeyboardButton(text="Узнай свой сценарий", callback_data="discover_scenario")]
             ])
             
-            await callback.message.answer(next_message, parse_mode="HTML", reply_markup=keyboard)
+            await answer_photo_with_text(callback.message, "https://iimg.su/i/XzuijO", next_message, keyboard)
         else:
             await callback.message.answer("Произошла ошибка: не удалось найти ваш профиль.")
 
     await state.clear()
-    await callback.answer()
 
 
 # --- 9. Обработчик кнопки "Узнай свой сценарий" ---
 @router.callback_query(F.data == "discover_scenario")
 async def discover_scenario(callback: CallbackQuery, state: FSMContext):
-    # Получаем данные пользователя из БД для отправки в N8N
-    async with AsyncSessionLocal() as db:
-        result = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = result.scalar_one_or_none()
-        
-        if user and user.user_name and user.phone:
-            # Определяем тип пользователя
-            user_type = "psychologist" if user.is_psychologist else "non_psychologist"
-            
-            # Отправляем данные в N8N
-            await send_to_n8n(
-                user_name=user.user_name,
-                phone=user.phone,
+    # Данные пользователя для отправки в N8N — из снимка профиля
+    profile = await load_profile(state, callback.from_user.id)
+
+    if profile and profile.user_name and profile.phone:
+        # Определяем тип пользователя
+        user_type = "psychologist" if profile.is_psychologist else "non_psychologist"
+
+        # Отправляем данные в N8N в фоне: ответ пользователю его не ждёт
+        spawn(
+            send_to_n8n(
+                user_name=profile.user_name,
+                phone=profile.phone,
                 user_type=user_type,
-                telegram_username=user.telegram_username
-            )
+                telegram_username=profile.telegram_username
+            ),
+            name="send_to_n8n",
+        )
     
-    await callback.message.answer_photo(photo="https://iimg.su/i/5M3YB1")
-
     message_text = (
         "✨ <b>Пора заглянуть глубже.</b>\n\n"
         "Ни образование, ни опыт, ни даже харизма не играют ключевой роли, "
@@ -276,6 +272,5 @@ async def discover_scenario(callback: CallbackQuery, state: FSMContext):
         [InlineKeyboardButton(text="Начать квиз", callback_data="start_quiz")]
     ])
     
-    await callback.message.answer(message_text, parse_mode="HTML", reply_markup=keyboard)
-    await callback.answer()
+    await answer_photo_with_text(callback.message, "https://iimg.su/i/5M3YB1", message_text, keyboard)
 
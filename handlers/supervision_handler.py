@@ -1,32 +1,28 @@
 from aiogram import Router, F
+from aiogram.fsm.context import FSMContext
 from aiogram.types import (
     CallbackQuery,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
     FSInputFile,
 )
-from sqlalchemy import select
-from database import AsyncSessionLocal
-from models import User
 from pathlib import Path
-from analytics import log_event
+from analytics import log_event_nowait
+from messaging import answer_photo_with_text
+from user_profile import load_profile
 
 supervision_router = Router()
 
 
 @supervision_router.callback_query(F.data == "learn_more_supervision")
-async def handle_learn_more_supervision(callback: CallbackQuery):
+async def handle_learn_more_supervision(callback: CallbackQuery, state: FSMContext):
     """
     Показываем подробности о "Супервизии" с разными текстами
     для психологов и непсихологов. В конце — CTA на бронь разговора.
     """
-    async with AsyncSessionLocal() as db:
-        result = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+    profile = await load_profile(state, callback.from_user.id)
 
-    is_psych = bool(user and user.is_psychologist)
+    is_psych = bool(profile and profile.is_psychologist)
 
     if is_psych:
         text = (
@@ -49,8 +45,7 @@ async def handle_learn_more_supervision(callback: CallbackQuery):
                 )]
             ]
         )
-        await callback.message.answer_photo(photo="https://iimg.su/i/g2zYHi")
-        await callback.message.answer(text, parse_mode='HTML', reply_markup=keyboard)
+        await answer_photo_with_text(callback.message, "https://iimg.su/i/g2zYHi", text, keyboard)
     else:
         text = (
             '💫 <b>Хотите выйти из "выживания" в полноценную жизнь? Давайте '
@@ -75,22 +70,16 @@ async def handle_learn_more_supervision(callback: CallbackQuery):
         )
         await callback.message.answer(text, parse_mode='HTML', reply_markup=keyboard)
 
-    await callback.answer()
-
 
 @supervision_router.callback_query(F.data == 'book_call')
-async def handle_book_call(callback: CallbackQuery):
+async def handle_book_call(callback: CallbackQuery, state: FSMContext):
     """
     После запроса на бронь разговора показываем подтверждение
     и кнопку перехода в канал.
     """
-    async with AsyncSessionLocal() as db:
-        result = await db.execute(
-            select(User).where(User.telegram_id == callback.from_user.id)
-        )
-        user = result.scalar_one_or_none()
+    profile = await load_profile(state, callback.from_user.id)
 
-    display_name = (user.user_name if user and user.user_name else 'Коллега')
+    display_name = (profile.user_name if profile and profile.user_name else 'Коллега')
 
     text = (
         f"✅ Отлично, {display_name}! Заявка отправлена.\n\n"
@@ -112,9 +101,8 @@ async def handle_book_call(callback: CallbackQuery):
     )
 
     await callback.message.answer(text, parse_mode='HTML', reply_markup=keyboard)
-    await callback.answer()
     # Аналитика: пользователь запросил бронь разговора (шаг 10)
-    await log_event(
+    log_event_nowait(
         user_telegram_id=callback.from_user.id,
         event_code="book_call_requested",
     )
@@ -135,12 +123,12 @@ async def handle_go_to_channel(callback: CallbackQuery):
         'Откройте канал по кнопке ниже:', reply_markup=url_keyboard
     )
     # Аналитика: переход в канал (шаг 11)
-    await log_event(
+    log_event_nowait(
         user_telegram_id=callback.from_user.id,
         event_code="go_to_channel_clicked",
     )
 
-    await callback.message.answer('🎁 А теперь обещанный подарок:', parse_mode='HTML')
+    gift_text = '🎁 А теперь обещанный подарок:'
 
     # Путь к файлу относительно корня проекта
     file_path = Path(__file__).resolve().parent.parent / 'src' / 'Чек-лист реализации: от идеи до результата.pdf'
@@ -153,9 +141,10 @@ async def handle_go_to_channel(callback: CallbackQuery):
     if file_path.exists():
         try:
             document = FSInputFile(str(file_path))
-            await callback.message.answer_document(document)
+            # Заголовок подарка — подпись к файлу, а не отдельное сообщение
+            await callback.message.answer_document(document, caption=gift_text, parse_mode='HTML')
             logger.info("Файл успешно отправлен пользователю {}", callback.from_user.id)
-            await log_event(
+            log_event_nowait(
                 user_telegram_id=callback.from_user.id,
                 event_code="gift_sent_success",
                 payload={"path": str(file_path)}
@@ -163,9 +152,9 @@ async def handle_go_to_channel(callback: CallbackQuery):
         except Exception as e:
             logger.error("Ошибка отправки файла: {}", e)
             await callback.message.answer(
-                f'Не удалось приложить файл подарка. Ошибка: {e}'
+                f'{gift_text}\n\nНе удалось приложить файл подарка. Ошибка: {e}'
             )
-            await log_event(
+            log_event_nowait(
                 user_telegram_id=callback.from_user.id,
                 event_code="gift_sent_failed",
                 payload={"path": str(file_path), "error": str(e)}
@@ -173,12 +162,10 @@ async def handle_go_to_channel(callback: CallbackQuery):
     else:
         logger.error("Файл не найден: {}", file_path)
         await callback.message.answer(
-            f'Файл подарка не найден по пути: {file_path}'
+            f'{gift_text}\n\nФайл подарка не найден по пути: {file_path}'
         )
-        await log_event(
+        log_event_nowait(
             user_telegram_id=callback.from_user.id,
             event_code="gift_file_missing",
             payload={"path": str(file_path)}
         )
-
-    await callback.answer()
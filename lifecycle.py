@@ -0,0 +1,194 @@
+"""
+Жизненный цикл процесса бота: учёт апдейтов в обработке, фоновые задачи
+и корректная остановка (drain) по SIGTERM/SIGINT.
+
+aiogram по сигналу сам прекращает getUpdates, но уже запущенные обработчики
+и фоновые задачи продолжают жить, пока не закроется сессия. Хук shutdown
+отсюда дожидается их (не дольше SHUTDOWN_DRAIN_TIMEOUT), подтверждает offset
+в Telegram и закрывает пул БД, чтобы новый инстанс мог стартовать сразу.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import Update
+from loguru import logger
+
+from database import engine, replica_engine
+
+# Сколько секунд ждать завершения обработчиков и фоновых задач при остановке
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "25"))
+
+
+class InflightTracker(BaseMiddleware):
+    """
+    Outer-middleware уровня Update: помнит, какие апдейты сейчас
+    обрабатываются, и последний принятый update_id.
+    """
+
+    def __init__(self) -> None:
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.last_update_id: Optional[int] = None
+        # Наименьший update_id среди отменённых по дедлайну: отменённые
+        # обработчики убирают себя из _tasks, но подтверждать их нельзя
+        self.cancelled_floor: Optional[int] = None
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        self._tasks[event.update_id] = asyncio.current_task()
+        if self.last_update_id is None or event.update_id > self.last_update_id:
+            self.last_update_id = event.update_id
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self._tasks.pop(event.update_id, None)
+            if not self._tasks:
+                self._idle.set()
+
+    @property
+    def inflight_count(self) -> int:
+        return len(self._tasks)
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """Ждёт, пока все обработчики завершатся. False — если не успели."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=max(timeout, 0))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def cancel_all(self) -> int:
+        if self._tasks:
+            floor = min(self._tasks)
+            if self.cancelled_floor is None or floor < self.cancelled_floor:
+                self.cancelled_floor = floor
+        for task in self._tasks.values():
+            task.cancel()
+        return len(self._tasks)
+
+    def confirmable_offset(self) -> Optional[int]:
+        """
+        offset для getUpdates, подтверждающий только полностью
+        обработанные апдейты: недоделанные (и отменённые по дедлайну)
+        Telegram пришлёт снова.
+        """
+        if self._tasks:
+            offset: Optional[int] = min(self._tasks)
+        elif self.last_update_id is not None:
+            offset = self.last_update_id + 1
+        else:
+            offset = None
+        if self.cancelled_floor is not None:
+            offset = self.cancelled_floor if offset is None else min(offset, self.cancelled_floor)
+        return offset
+
+
+inflight_tracker = InflightTracker()
+
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def spawn(coro: Awaitable[Any], name: Optional[str] = None) -> asyncio.Task:
+    """
+    Запускает побочную работу (аналитика, вебхуки) в фоне.
+    Задача удерживается до завершения и будет дождана при остановке.
+    """
+    task = asyncio.ensure_future(coro)
+    if name:
+        task.set_name(name)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_done)
+    return task
+
+
+def _on_background_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.opt(exception=task.exception()).error(
+            "Фоновая задача {} завершилась с ошибкой", task.get_name()
+        )
+
+
+def background_count() -> int:
+    return len(_background_tasks)
+
+
+async def flush_background(timeout: float) -> int:
+    """Дожидается фоновых задач; не успевшие за timeout отменяет. Возвращает число отменённых."""
+    if not _background_tasks:
+        return 0
+    _, pending = await asyncio.wait(set(_background_tasks), timeout=max(timeout, 0))
+    for task in pending:
+        task.cancel()
+    return len(pending)
+
+
+async def commit_polling_offset(bot: Bot) -> Optional[int]:
+    """Подтверждает в Telegram все обработанные апдейты."""
+    offset = inflight_tracker.confirmable_offset()
+    if offset is None:
+        return None
+    try:
+        await bot.get_updates(offset=offset, limit=1, timeout=0)
+    except Exception as e:
+        logger.warning("Не удалось подтвердить offset {}: {}", offset, e)
+        return None
+    return offset
+
+
+async def drain(bot: Bot, commit_offset: bool = True) -> None:
+    """
+    Дожидается обработчиков и фоновых задач (не дольше SHUTDOWN_DRAIN_TIMEOUT),
+    подтверждает offset и закрывает пулы БД (основной и реплики). Воркеры кластера вызывают
+    с commit_offset=False: getUpdates у них делает только инжестер.
+    """
+    started = time.monotonic()
+    deadline = started + SHUTDOWN_DRAIN_TIMEOUT
+    logger.info(
+        "Остановка: в обработке {} апдейтов, фоновых задач {}",
+        inflight_tracker.inflight_count,
+        background_count(),
+    )
+
+    if not await inflight_tracker.wait_idle(deadline - time.monotonic()):
+        cancelled = inflight_tracker.cancel_all()
+        logger.warning("Дедлайн остановки: отменено {} обработчиков", cancelled)
+        await asyncio.sleep(0)
+
+    cancelled_background = await flush_background(deadline - time.monotonic())
+    if cancelled_background:
+        logger.warning("Дедлайн остановки: отменено {} фоновых задач", cancelled_background)
+
+    offset = await commit_polling_offset(bot) if commit_offset else None
+    await engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
+
+    logger.info(
+        "Остановка завершена за {:.2f} с (подтверждён offset {})",
+        time.monotonic() - started,
+        offset,
+    )
+
+
+async def on_shutdown(bot: Bot) -> None:
+    """
+    Хук dp.shutdown: вызывается aiogram после остановки getUpdates,
+    но до закрытия сессии бота.
+    """
+    await drain(bot)
+
+
+def setup_lifecycle(dp) -> None:
+    """Подключает учёт апдейтов и хук корректной остановки к диспетчеру."""
+    dp.update.outer_middleware(inflight_tracker)
+    dp.shutdown.register(on_shutdown)
@@ -0,0 +1,251 @@
+"""
+Настройка логирования: запись в фоновом потоке, JSON в файл с ротацией
+и сэмплирование частых info-сообщений.
+
+setup_logging() заменяет стандартный синхронный sink loguru одним
+sink'ом-очередью: вызывающий код только кладёт готовую запись loguru в
+queue.Queue (без pickle, в отличие от enqueue=True — тот на каждую запись
+сериализует её в межпроцессный канал и в обработчике стоит дороже
+синхронной записи в файл). Отдельный поток пишет:
+- stderr — текстом, или JSON при LOG_JSON=1;
+- LOG_FILE (если задан) — JSON-строками через собственный экземпляр
+  loguru с ротацией LOG_ROTATION, хранением LOG_RETENTION и сжатием
+  LOG_COMPRESSION; ротация и сжатие тоже идут в этом потоке. В кластере у
+  каждого процесса свой файл: <LOG_FILE без расширения>-<процесс>.log.
+Если поток не успевает и в очереди LOG_QUEUE_SIZE записей, новые
+отбрасываются со счётчиком (stats()), а не блокируют event loop.
+
+Сообщения, которые пишутся на каждый апдейт ("Записано событие…",
+ответ на вопрос квиза), идут через sampled(key): из каждых
+LOG_HOT_SAMPLE_EVERY пишется одно и не больше LOG_HOT_RATE в секунду на
+ключ. Решение принимается до форматирования: отброшенное сообщение стоит
+одного счётчика. Число пропущенных перед записью попадает в extra
+(sampled_out), счётчики по ключам — в stats().
+"""
+import atexit
+import copy
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_JSON = os.getenv("LOG_JSON", "0") == "1"
+LOG_FILE = os.getenv("LOG_FILE", "")
+LOG_ROTATION = os.getenv("LOG_ROTATION", "50 MB")
+LOG_RETENTION = os.getenv("LOG_RETENTION", "14 days")
+LOG_COMPRESSION = os.getenv("LOG_COMPRESSION", "gz")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "100000"))
+
+# Сэмплирование частых сообщений: одно из N и не больше R в секунду на ключ
+LOG_HOT_SAMPLE_EVERY = int(os.getenv("LOG_HOT_SAMPLE_EVERY", "1"))
+LOG_HOT_RATE = float(os.getenv("LOG_HOT_RATE", "20"))
+
+# Минимальный уровень настроенных sink'ов; до setup_logging пишется всё
+_min_level_no = 0
+
+_sampled: Dict[str, "SampledLog"] = {}
+
+
+class SampledLog:
+    """Логгер одного частого сообщения с сэмплированием и ограничением частоты."""
+
+    def __init__(self, key: str, every: Optional[int] = None, rate: Optional[float] = None) -> None:
+        self.key = key
+        self.every = max(1, every if every is not None else LOG_HOT_SAMPLE_EVERY)
+        self.rate = rate if rate is not None else LOG_HOT_RATE
+        self.seen = 0
+        self.emitted = 0
+        self.dropped = 0
+        self._dropped_since_emit = 0
+        self._tokens = self.rate
+        self._refilled_at = time.monotonic()
+
+    def _admit(self) -> bool:
+        self.seen += 1
+        if self.every > 1 and self.seen % self.every:
+            return False
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _log(self, level: str, level_no: int, message: str, args: tuple) -> None:
+        if level_no < _min_level_no:
+            return
+        if not self._admit():
+            self.dropped += 1
+            self._dropped_since_emit += 1
+            return
+        self.emitted += 1
+        skipped, self._dropped_since_emit = self._dropped_since_emit, 0
+        logger.opt(depth=2).bind(log_key=self.key, sampled_out=skipped).log(level, message, *args)
+
+    def debug(self, message: str, *args: Any) -> None:
+        self._log("DEBUG", 10, message, args)
+
+    def info(self, message: str, *args: Any) -> None:
+        self._log("INFO", 20, message, args)
+
+
+def sampled(key: str, every: Optional[int] = None, rate: Optional[float] = None) -> SampledLog:
+    """SampledLog для ключа key; один на ключ на процесс."""
+    log = _sampled.get(key)
+    if log is None:
+        log = _sampled[key] = SampledLog(key, every, rate)
+    return log
+
+
+# --- Запись в фоновом потоке ---
+
+def _exception_text(record: Dict[str, Any]) -> str:
+    exception = record["exception"]
+    if exception is None:
+        return ""
+    return "".join(traceback.format_exception(exception.type, exception.value, exception.traceback))
+
+
+def _json_line(record: Dict[str, Any]) -> str:
+    data = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "name": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "message": record["message"],
+        "process": record["process"].id,
+    }
+    if record["extra"]:
+        data["extra"] = record["extra"]
+    exception = _exception_text(record)
+    if exception:
+        data["exception"] = exception
+    return json.dumps(data, ensure_ascii=False, default=str) + "\n"
+
+
+def _text_line(record: Dict[str, Any]) -> str:
+    line = (
+        f"{record['time']:%Y-%m-%d %H:%M:%S}.{record['time'].microsecond // 1000:03d} | "
+        f"{record['level'].name: <8} | {record['name']}:{record['function']}:{record['line']} - "
+        f"{record['message']}\n"
+    )
+    return line + _exception_text(record)
+
+
+class _BackgroundWriter:
+    """Sink loguru: запись кладётся в очередь, пишет её отдельный поток."""
+
+    def __init__(self, console: bool, file_logger: Any) -> None:
+        self.console = console
+        self.file_logger = file_logger
+        self.queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.dropped = 0
+        self.written = 0
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def __call__(self, message: Any) -> None:
+        try:
+            self.queue.put_nowait(message.record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        if self.console:
+            sys.stderr.write(_json_line(record) if LOG_JSON else _text_line(record))
+        if self.file_logger is not None:
+            self.file_logger.opt(raw=True).info(_json_line(record))
+        self.written += 1
+
+    def _run(self) -> None:
+        while True:
+            record = self.queue.get()
+            try:
+                if record is None:
+                    return
+                self._write(record)
+                if self.console and self.queue.empty():
+                    sys.stderr.flush()
+            except Exception as e:
+                sys.stderr.write(f"Ошибка записи лога: {e}\n")
+            finally:
+                self.queue.task_done()
+
+    def flush(self) -> None:
+        self.queue.join()
+        if self.console:
+            sys.stderr.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self.queue.put(None)
+        self._thread.join()
+        if self.file_logger is not None:
+            self.file_logger.remove()
+
+
+_writer: Optional[_BackgroundWriter] = None
+
+
+def _log_file(log_file: str, process_name: Optional[str]) -> str:
+    if not process_name:
+        return log_file
+    path = Path(log_file)
+    return str(path.with_name(f"{path.stem}-{process_name}{path.suffix or '.log'}"))
+
+
+def setup_logging(process_name: Optional[str] = None, log_file: str = LOG_FILE, console: bool = True) -> None:
+    """Заменяет sink'и loguru; вызывается при старте процесса."""
+    global _min_level_no, _writer
+
+    logger.remove()
+    if _writer is not None:
+        _writer.close()
+
+    file_logger = None
+    if log_file:
+        # Отдельный экземпляр loguru (копия без sink'ов) только для потока записи
+        file_logger = copy.deepcopy(logger)
+        file_logger.add(
+            _log_file(log_file, process_name),
+            format="{message}",
+            rotation=LOG_ROTATION,
+            retention=LOG_RETENTION,
+            compression=LOG_COMPRESSION or None,
+        )
+    _writer = _BackgroundWriter(console, file_logger)
+    logger.add(_writer, level=LOG_LEVEL, format="{message}", backtrace=False, diagnose=False, catch=False)
+    _min_level_no = logger.level(LOG_LEVEL).no
+
+
+def flush_logging() -> None:
+    """Дожидается записи очереди логов (перед выходом процесса)."""
+    if _writer is not None:
+        _writer.flush()
+
+
+atexit.register(flush_logging)
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "queued": _writer.queue.qsize() if _writer else 0,
+        "written": _writer.written if _writer else 0,
+        "queue_dropped": _writer.dropped if _writer else 0,
+        "sampled": {key: {"emitted": log.emitted, "dropped": log.dropped} for key, log in _sampled.items()},
+    }
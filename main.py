@@ -2,77 +2,112 @@ import asyncio
 from aiogram import Bot, Dispatcher
 from aiogram.filters import Command, CommandStart
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.client.telegram import TelegramAPIServer
-from aiogram.exceptions import TelegramNetworkError
 from dotenv import load_dotenv
 import os
-from datetime import datetime
+import time
 from loguru import logger
-from database import init_db, AsyncSessionLocal
-from analytics import log_event
+from database import init_db, warmup_pool, AsyncSessionLocal
+from logging_setup import flush_logging, sampled, setup_logging
+import tracing
+from analytics import flush_user_events, register_bot_start
+from messaging import answer_photo_with_text
+from lifecycle import setup_lifecycle
+from backlog import backlog_guard, setup_backlog
+from quiz_cache import preload_quizzes
+from telegram_session import FORCE_IPV4, LIMIT_PER_HOST, TOTAL_TIMEOUT, create_telegram_session
+from transport import SwitchingSession, TransportManager, proxy_urls_from_env
+from middlewares.callback_answer_middleware import callback_answer
+from middlewares.callback_dedup_middleware import callback_dedup
+from middlewares.concurrency_limiter_middleware import concurrency_limiter
+from middlewares.throttling_middleware import throttling
+from user_profile import clear_profile
 from models import User, UserEvent
 from sqlalchemy import select, delete
-from handlers import scenario_handler
-from handlers.quiz_handler import quiz_router
-from handlers.scenario_cost_handler import scenario_cost_router
-from handlers.common_cta_handler import common_cta_router
-from handlers.results_handler import results_router
-from handlers.supervision_handler import supervision_router
-from handlers.consultation_handler import consultation_router
-from handlers.non_psych_cost_handler import non_psych_cost_router
 
 # Загрузка переменных окружения
 load_dotenv()
 
 # Инициализация FSM storage
-# Для продакшена рекомендуется использовать более персистентное хранилище, например Redis
-storage = MemoryStorage()
+# По умолчанию — MemoryStorage. Если задан FSM_STORAGE_URL (redis://...),
+# состояние хранится в Redis и общее для всех воркеров кластера (см. cluster.py)
+fsm_storage_url = os.getenv('FSM_STORAGE_URL')
+if fsm_storage_url:
+    from aiogram.fsm.storage.redis import RedisStorage
+    storage = RedisStorage.from_url(fsm_storage_url)
+else:
+    storage = MemoryStorage()
 
 # Диспетчер можно инициализировать заранее; бота создадим внутри main(),
 # чтобы использовать активный event loop при настройке сетевой сессии
 dp = Dispatcher(storage=storage)
 
-# Включаем роутеры
-dp.include_router(scenario_handler.router)
-dp.include_router(quiz_router)
-dp.include_router(scenario_cost_router)
-dp.include_router(non_psych_cost_router)
-dp.include_router(common_cta_router)
-dp.include_router(results_router)
-dp.include_router(supervision_router)
-dp.include_router(consultation_router)
+# Пишется на каждый /start — сэмплируется (logging_setup.py)
+_start_log = sampled("main.user_started")
 
+# Учёт апдейтов в обработке и корректная остановка по SIGTERM
+setup_lifecycle(dp)
 
-@dp.message(CommandStart())
-async def cmd_start(message: Message):
+# Корневой span на апдейт, span'ы SQL (TRACE_EXPORTER, см. tracing.py)
+tracing.setup_tracing(dp)
+
+# Дубли после падения и политика бэклога (BACKLOG_POLICY)
+setup_backlog(dp)
+
+# Не больше MAX_CONCURRENT_UPDATES апдейтов одновременно, остальные в очереди
+dp.update.outer_middleware(concurrency_limiter)
+
+# Двойные нажатия кнопок отвечаются сразу и не доходят до обработчиков
+dp.callback_query.outer_middleware(callback_dedup)
+
+# Частота сообщений пользователя по правилу обработчика (флаг "throttling").
+# Inner-middleware диспетчера действует и в подключённых к нему роутерах
+dp.message.middleware(throttling)
+
+
+def setup_routers(dispatcher: Dispatcher) -> None:
+    """
+    Включает роутеры обработчиков в диспетчер.
+    Модули обработчиков импортируются здесь, а не при импорте main.
+    Основное время импорта main — сам aiogram (aiogram.types): dp и
+    обработчики команд объявлены на уровне модуля, его не отложить.
+    """
+    from handlers import scenario_handler
+    from handlers.quiz_handler import quiz_router
+    from handlers.scenario_cost_handler import scenario_cost_router
+    from handlers.common_cta_handler import common_cta_router
+    from handlers.results_handler import results_router
+    from handlers.supervision_handler import supervision_router
+    from handlers.consultation_handler import consultation_router
+    from handlers.non_psych_cost_handler import non_psych_cost_router
+
+    for router in (
+        scenario_handler.router,
+        quiz_router,
+        scenario_cost_router,
+        non_psych_cost_router,
+        common_cta_router,
+        results_router,
+        supervision_router,
+        consultation_router,
+    ):
+        # Ответ на нажатие уходит сразу, параллельно с обработчиком
+        router.callback_query.middleware(callback_answer)
+        dispatcher.include_router(router)
+
+
+@dp.message(CommandStart(), flags={"throttling": "command"})
+async def cmd_start(message: Message, state: FSMContext):
     """Обработчик команды /start. Сохраняет пользователя в базу данных."""
-    async with AsyncSessionLocal() as db:
-        # Проверяем, существует ли пользователь
-        result = await db.execute(
-            select(User).where(User.telegram_id == message.from_user.id)
-        )
-        existing_user = result.scalar_one_or_none()
-        
-        if not existing_user:
-            # Создаем нового пользователя
-            new_user = User(
-                telegram_id=message.from_user.id,
-                telegram_username=message.from_user.username,
-                bot_start_datetime=datetime.utcnow()
-            )
-            db.add(new_user)
-            await db.commit()
-            logger.info(f"Новый пользователь {message.from_user.id} ({message.from_user.username}) добавлен в базу данных.")
-        else:
-            logger.info(f"Пользователь {message.from_user.id} ({message.from_user.username}) уже существует в базе данных.")
-
-    # Сначала отправляем картинку
-    await message.answer_photo(
-        photo="https://iimg.su/i/kWKWoN"
+    # Upsert пользователя и событие bot_start — один запрос к БД
+    await register_bot_start(
+        telegram_id=message.from_user.id,
+        telegram_username=message.from_user.username,
     )
-
+    # username мог смениться — снимок профиля перечитается при первом чтении
+    await clear_profile(state)
 
     start_text = (
         "<b>А вы знали, что 93% людей, которые чувствуют тягу к психологии, так и не реализуют этот потенциал полностью?</b>\n\n"
@@ -94,17 +129,18 @@ async def cmd_start(message: Message):
         [InlineKeyboardButton(text="Узнать сценарий", callback_data="learn_scenario")]
     ])
     
-    await message.answer(start_text, parse_mode="HTML", reply_markup=keyboard)
-    logger.info(f"Пользователь {message.from_user.id} запустил бота")
-    # Логируем событие старта бота
-    await log_event(user_telegram_id=message.from_user.id, event_code="bot_start")
+    # Картинка и текст — одним сообщением, если текст помещается в подпись
+    await answer_photo_with_text(message, "https://iimg.su/i/kWKWoN", start_text, keyboard)
+    _start_log.info("Пользователь {} запустил бота", message.from_user.id)
 
 
-@dp.message(Command("del"))
-async def cmd_delete_user(message: Message):
+@dp.message(Command("del"), flags={"throttling": "command"})
+async def cmd_delete_user(message: Message, state: FSMContext):
     """
     Обработчик команды /del - каскадное удаление пользователя и всех его данных.
     """
+    # Фоновые записи событий пользователя не должны пережить его удаление
+    await flush_user_events(message.from_user.id)
     async with AsyncSessionLocal() as db:
         result = await db.execute(
             select(User).where(User.telegram_id == message.from_user.id)
@@ -112,6 +148,7 @@ async def cmd_delete_user(message: Message):
         user = result.scalar_one_or_none()
 
         if not user:
+            await clear_profile(state)
             await message.answer(
                 "Вы не найдены в базе данных. Нечего удалять.",
                 parse_mode="HTML"
@@ -131,6 +168,9 @@ async def cmd_delete_user(message: Message):
         await db.delete(user)
         await db.commit()
 
+        # Снимок профиля (имя, телефон) в FSM storage — тоже данные пользователя
+        await clear_profile(state)
+
         logger.info(
             "Пользователь {} ({}) и все его данные удалены из БД",
             message.from_user.id,
@@ -144,58 +184,90 @@ async def cmd_delete_user(message: Message):
         )
 
 
+async def create_bot() -> Bot:
+    """Создаёт бота с сетевой сессией (прокси/прямое соединение) внутри running loop."""
+    api_base = os.getenv('TELEGRAM_API_BASE_URL')
+
+    # Коннектор (IPv4, DNS-кэш, пул keep-alive) и таймауты connect/read/total
+    # настраиваются из окружения, см. telegram_session.py.
+    # Адрес Bot API передаётся в сессию (aiogram 3 не принимает api в Bot)
+    session_kwargs = {}
+    if api_base:
+        session_kwargs['api'] = TelegramAPIServer.from_base(api_base)
+
+    # С прокси бот работает через менеджер транспортов: прокси и прямое
+    # соединение проверяются в фоне, активный выбирается по здоровью и задержке
+    # и меняется на лету, без перезапуска polling (см. transport.py)
+    if proxy_urls_from_env():
+        manager = TransportManager.from_env(session_kwargs)
+        session = SwitchingSession(manager, timeout=TOTAL_TIMEOUT, **session_kwargs)
+        bot = Bot(token=os.getenv('BOT_TOKEN'), session=session)
+        tracing.instrument_bot(bot)
+        await manager.start(bot)
+        logger.info(
+            "Бот инициализирован с транспортами {}, активный: {}",
+            [t.name for t in manager.transports],
+            manager.active.name,
+        )
+        return bot
+
+    session = create_telegram_session(**session_kwargs)
+    logger.info(
+        "Бот инициализирован без прокси (IPv4: {}, соединений на хост: {}, connect/read/total: {}/{}/{} с)",
+        FORCE_IPV4, LIMIT_PER_HOST, session.connect_timeout, session.read_timeout, session.timeout,
+    )
+    bot = Bot(token=os.getenv('BOT_TOKEN'), session=session)
+    tracing.instrument_bot(bot)
+    return bot
+
+
 async def main():
     """Главная функция запуска бота"""
-    await init_db()
+    # Служебная панель: воронка и здоровье из кэша (ADMIN_HTTP_PORT);
+    # aiohttp.web импортируется только здесь
+    from admin_dashboard import admin_dashboard
 
-    # Инициализируем сессию/бота внутри running loop
-    proxy_url = os.getenv('PROXY_URL')
-    force_ipv4 = os.getenv('FORCE_IPV4', '0') == '1'
-    api_base = os.getenv('TELEGRAM_API_BASE_URL')
+    started = time.perf_counter()
+    bot = None
+
+    async def prepare_db():
+        await init_db()
+        await preload_quizzes()
+
+    async def prepare_bot():
+        nonlocal bot
+        # Инициализируем сессию/бота внутри running loop; bot.me() кэширует getMe для polling
+        bot = await create_bot()
+        await bot.me()
 
-    # В aiogram 3 session.timeout ожидается числом (секунды),
-    # поэтому передаём именно float/int, а не aiohttp.ClientTimeout
-    timeout_seconds = float(os.getenv('HTTP_TIMEOUT', '180'))
-
-    # Используем прокси, если задано. Для текущей версии aiogram передаём proxy в сессию.
-    if proxy_url:
-        try:
-            session = AiohttpSession(proxy=proxy_url, timeout=timeout_seconds)
-            logger.info("Бот инициализирован с прокси: {}", proxy_url)
-        except Exception as e:
-            logger.error("Не удалось инициализировать прокси {}: {}", proxy_url, e)
-            session = AiohttpSession(timeout=timeout_seconds)
-    else:
-        session = AiohttpSession(timeout=timeout_seconds)
-        if force_ipv4:
-            logger.warning("FORCE_IPV4=1 указан, но коннектор IPv4 недоступен в текущей конфигурации; продолжаем без него")
-        else:
-            logger.info("Бот инициализирован без прокси")
-    api = TelegramAPIServer.from_base(api_base) if api_base else None
-    bot = Bot(token=os.getenv('BOT_TOKEN'), session=session, api=api) if api else Bot(token=os.getenv('BOT_TOKEN'), session=session)
-
-    # Быстрая проверка соединения; при недоступности прокси пробуем без него
-    if proxy_url:
-        try:
-            await bot.get_me()
-        except (TelegramNetworkError, Exception) as e:
-            err_text = str(e)
-            if "Couldn't connect to proxy" in err_text or "ProxyConnectionError" in err_text or "Connect call failed" in err_text:
-                logger.warning("Прокси недоступен ({}). Переключаемся на прямое соединение.", err_text)
-                await bot.session.close()
-                session = AiohttpSession(timeout=timeout_seconds)
-                bot = Bot(token=os.getenv('BOT_TOKEN'), session=session, api=api) if api else Bot(token=os.getenv('BOT_TOKEN'), session=session)
-                logger.info("Бот инициализирован без прокси (fallback)")
-            else:
-                # Если ошибка иная — пробрасываем дальше
-                raise
-
-    logger.info("Бот запущен")
     try:
-        await dp.start_polling(bot)
+        # Схема/кэш квизов, прогрев пула и getMe выполняются параллельно; при ошибке
+        # дожидаемся всех, чтобы созданная сессия бота не осталась незакрытой
+        results = await asyncio.gather(prepare_db(), warmup_pool(), prepare_bot(), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        setup_routers(dp)
+
+        await backlog_guard.start(bot)
+        await tracing.start_tracing()
+        await admin_dashboard.start(bot)
+
+        logger.info("Бот запущен за {:.2f} с", time.perf_counter() - started)
+        await dp.start_polling(bot, tasks_concurrency_limit=concurrency_limiter.polling_tasks_limit())
     finally:
-        await bot.session.close()
+        await admin_dashboard.stop()
+        if bot is not None:
+            await bot.session.close()
+        flush_logging()
 
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    setup_logging()
+    # WORKERS > 1 — один процесс читает апдейты, N воркеров их обрабатывают
+    workers = int(os.getenv('WORKERS', '1'))
+    if workers > 1:
+        from cluster import run_cluster
+        run_cluster(workers)
+    else:
+        asyncio.run(main())
@@ -0,0 +1,78 @@
+"""
+Отправка экранов воронки «картинка + текст + кнопки».
+
+Раньше каждый такой экран — два запроса к Bot API: answer_photo без подписи
+и следом answer с HTML-текстом и клавиатурой. answer_photo_with_text()
+отправляет один sendPhoto, где текст — подпись (caption), а клавиатура
+прикреплена к фото, если текст укладывается в лимит подписи Telegram
+(CAPTION_LIMIT символов после разбора разметки). Длинный текст, как и
+раньше, уходит отдельным сообщением после фото, клавиатура — на нём.
+
+Если Telegram всё же отклонил подпись как слишком длинную, экран
+переотправляется двумя сообщениями. Счётчики — в stats().
+"""
+import html
+import re
+from typing import Any, Dict, Optional, Union
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InputFile, Message
+from loguru import logger
+
+# Лимит подписи к медиа в Bot API: 0-1024 символа после разбора разметки
+CAPTION_LIMIT = 1024
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+_stats = {"captioned": 0, "split": 0, "caption_rejected": 0}
+
+
+def visible_length(text: str, parse_mode: Optional[str] = "HTML") -> int:
+    """
+    Длина текста так, как её считает Telegram: без HTML-тегов, с
+    раскрытыми сущностями, в UTF-16 (эмодзи вне BMP — два символа).
+    """
+    if parse_mode and parse_mode.upper() == "HTML":
+        text = html.unescape(_TAG_RE.sub("", text))
+    return len(text.encode("utf-16-le")) // 2
+
+
+def fits_caption(text: str, parse_mode: Optional[str] = "HTML") -> bool:
+    return visible_length(text, parse_mode) <= CAPTION_LIMIT
+
+
+async def answer_photo_with_text(
+    message: Message,
+    photo: Union[str, InputFile],
+    text: str,
+    reply_markup: Any = None,
+    parse_mode: Optional[str] = "HTML",
+) -> Message:
+    """
+    Отправляет в чат message фото с текстом и клавиатурой: одним sendPhoto,
+    если текст помещается в подпись, иначе фото и отдельное сообщение.
+    Возвращает сообщение, к которому прикреплена клавиатура.
+    """
+    if fits_caption(text, parse_mode):
+        try:
+            sent = await message.answer_photo(
+                photo=photo,
+                caption=text,
+                parse_mode=parse_mode,
+                reply_markup=reply_markup,
+            )
+            _stats["captioned"] += 1
+            return sent
+        except TelegramBadRequest as e:
+            if "caption is too long" not in str(e).lower():
+                raise
+            _stats["caption_rejected"] += 1
+            logger.warning("Подпись отклонена Telegram ({}), отправляем фото и текст отдельно", e)
+
+    _stats["split"] += 1
+    await message.answer_photo(photo=photo)
+    return await message.answer(text, parse_mode=parse_mode, reply_markup=reply_markup)
+
+
+def stats() -> Dict[str, int]:
+    return dict(_stats)
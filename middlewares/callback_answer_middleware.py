@@ -0,0 +1,77 @@
+"""
+Ответ на нажатие inline-кнопки до работы обработчика.
+
+Раньше обработчики вызывали callback.answer() в самом конце — после
+commit, записи событий и отправки сообщений, и всё это время у
+пользователя крутились «часики» на кнопке. Middleware отправляет
+answerCallbackQuery сразу, параллельно с обработчиком: «часики» гаснут
+через один запрос к Bot API, а обработчики сами callback.answer() больше
+не вызывают.
+
+Подключается как inner-middleware callback_query каждого роутера
+(setup_routers в main.py): так видны флаги обработчика. Обработчик,
+который отвечает сам — с текстом всплывающего уведомления, — помечается
+flags={"callback_answer": False}.
+
+Апдейт считается обработанным только после ответа: middleware дожидается
+его перед возвратом. Ошибка ответа (кнопка нажата слишком давно и
+query_id истёк) не мешает обработчику и только считается в stats().
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery
+from loguru import logger
+
+
+class CallbackAnswerMiddleware(BaseMiddleware):
+    def __init__(self) -> None:
+        self.answered = 0
+        self.manual = 0
+        self.failed = 0
+        self.answer_time_total = 0.0
+        self.answer_time_max = 0.0
+
+    async def _answer(self, event: CallbackQuery) -> None:
+        started = time.monotonic()
+        try:
+            await event.answer()
+        except Exception as e:
+            self.failed += 1
+            logger.debug("Не удалось ответить на нажатие {} от {}: {}", event.data, event.from_user.id, e)
+            return
+        elapsed = time.monotonic() - started
+        self.answered += 1
+        self.answer_time_total += elapsed
+        self.answer_time_max = max(self.answer_time_max, elapsed)
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any],
+    ) -> Any:
+        if get_flag(data, "callback_answer", default=True) is False:
+            self.manual += 1
+            return await handler(event, data)
+
+        answer = asyncio.ensure_future(self._answer(event))
+        try:
+            return await handler(event, data)
+        finally:
+            await answer
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "answered": self.answered,
+            "manual": self.manual,
+            "failed": self.failed,
+            "avg_answer_time": round(self.answer_time_total / self.answered, 4) if self.answered else 0.0,
+            "max_answer_time": round(self.answer_time_max, 4),
+        }
+
+
+callback_answer = CallbackAnswerMiddleware()
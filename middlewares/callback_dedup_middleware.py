@@ -0,0 +1,101 @@
+"""
+Подавление двойных нажатий inline-кнопок.
+
+Outer-middleware на callback_query:
+- повтор того же нажатия (чат, message_id, callback_data), пока первое
+  ещё обрабатывается или в течение CALLBACK_DEDUP_WINDOW секунд после него,
+  сразу получает callback.answer() и до обработчиков (и БД) не доходит;
+- разные нажатия одного пользователя выполняются строго по очереди
+  (per-user lock), поэтому два быстрых тапа не создают две записи в БД.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+from loguru import logger
+
+# Окно, в течение которого повторное нажатие той же кнопки считается дублем
+CALLBACK_DEDUP_WINDOW = float(os.getenv("CALLBACK_DEDUP_WINDOW", "1.5"))
+
+_Key = Tuple[int, int, str]
+
+
+class CallbackDedupMiddleware(BaseMiddleware):
+    def __init__(self, window: float = CALLBACK_DEDUP_WINDOW) -> None:
+        self.window = window
+        self.suppressed = 0
+        # ключ нажатия -> время завершения обработки (None — ещё обрабатывается)
+        self._recent: "OrderedDict[_Key, float | None]" = OrderedDict()
+        # user_id -> [lock, число ожидающих]
+        self._user_locks: Dict[int, list] = {}
+
+    @staticmethod
+    def _key(callback: CallbackQuery) -> _Key:
+        message = callback.message
+        chat_id = message.chat.id if message else callback.from_user.id
+        message_id = message.message_id if message else 0
+        return chat_id, message_id, callback.data or ""
+
+    def _prune(self, now: float) -> None:
+        while self._recent:
+            key, finished_at = next(iter(self._recent.items()))
+            if finished_at is None or now - finished_at < self.window:
+                break
+            self._recent.popitem(last=False)
+
+    def _is_duplicate(self, key: _Key, now: float) -> bool:
+        if key not in self._recent:
+            return False
+        finished_at = self._recent[key]
+        return finished_at is None or now - finished_at < self.window
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any],
+    ) -> Any:
+        now = time.monotonic()
+        self._prune(now)
+        key = self._key(event)
+
+        if self._is_duplicate(key, now):
+            self.suppressed += 1
+            logger.debug(
+                "Дубль нажатия {} от пользователя {} подавлен (всего {})",
+                event.data,
+                event.from_user.id,
+                self.suppressed,
+            )
+            await event.answer()
+            return None
+
+        self._recent.pop(key, None)
+        self._recent[key] = None
+
+        user_id = event.from_user.id
+        entry = self._user_locks.setdefault(user_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await handler(event, data)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._user_locks.pop(user_id, None)
+            self._recent.pop(key, None)
+            self._recent[key] = time.monotonic()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "suppressed": self.suppressed,
+            "tracked_keys": len(self._recent),
+            "users_in_flight": len(self._user_locks),
+        }
+
+
+callback_dedup = CallbackDedupMiddleware()
@@ -0,0 +1,156 @@
+"""
+Ограничение числа одновременно выполняемых апдейтов.
+
+Outer-middleware уровня Update (подключается после InflightTracker и
+BacklogGuard): не больше MAX_CONCURRENT_UPDATES апдейтов выполняются
+одновременно, остальные ждут в очереди. Без ограничения всплеск /start
+превращается в тысячи корутин, которые разом встают в очередь пула БД и
+падают по pool timeout; с ним лишние апдейты ждут до обработчиков, не
+занимая соединений, и задержка растёт плавно.
+
+OVERLOAD_POLICY — что делать, когда очередь полна:
+- backpressure — polling запускается с tasks_concurrency_limit, равным
+  MAX_CONCURRENT_UPDATES + MAX_QUEUED_UPDATES: aiogram перестаёт вызывать
+  getUpdates, лишние апдейты ждут на стороне Telegram (по умолчанию);
+- shed — апдейты сверх очереди сразу получают ответ OVERLOAD_TEXT
+  (нажатие — callback.answer, сообщение — ответ в чат) без обработчиков.
+
+В обоих режимах апдейт, прождавший в очереди дольше LIMITER_MAX_WAIT
+секунд, тоже получает OVERLOAD_TEXT: пользователь уже не ждёт ответа.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+from loguru import logger
+
+import tracing
+from database import DB_MAX_OVERFLOW, DB_POOL_SIZE
+
+# Обработчик с открытой сессией может занять второе соединение через
+# log_event, поэтому по умолчанию — половина максимального размера пула
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", str(max(1, (DB_POOL_SIZE + DB_MAX_OVERFLOW) // 2))))
+MAX_QUEUED_UPDATES = int(os.getenv("MAX_QUEUED_UPDATES", "1000"))
+LIMITER_MAX_WAIT = float(os.getenv("LIMITER_MAX_WAIT", "30"))
+OVERLOAD_POLICY = os.getenv("OVERLOAD_POLICY", "backpressure").lower()
+OVERLOAD_TEXT = os.getenv(
+    "OVERLOAD_TEXT",
+    "⏳ Сейчас очень много обращений. Пожалуйста, повторите через минуту.",
+)
+
+_POLICIES = ("backpressure", "shed")
+
+
+class ConcurrencyLimiterMiddleware(BaseMiddleware):
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT_UPDATES,
+        max_queued: int = MAX_QUEUED_UPDATES,
+        max_wait: float = LIMITER_MAX_WAIT,
+        policy: str = OVERLOAD_POLICY,
+    ) -> None:
+        if policy not in _POLICIES:
+            logger.warning("Неизвестная OVERLOAD_POLICY={}, используется backpressure", policy)
+            policy = "backpressure"
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        self.policy = policy
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+        self.inflight = 0
+        self.queued = 0
+        self.peak_inflight = 0
+        self.peak_queued = 0
+        self.admitted = 0
+        self.shed_full = 0
+        self.shed_timeout = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def polling_tasks_limit(self) -> Optional[int]:
+        """tasks_concurrency_limit для start_polling: None — getUpdates не сдерживается."""
+        if self.policy == "backpressure":
+            return self.max_concurrent + self.max_queued
+        return None
+
+    async def _shed(self, event: Update, reason: str) -> None:
+        logger.debug("Перегрузка ({}): апдейт {} отклонён", reason, event.update_id)
+        try:
+            if event.callback_query is not None:
+                await event.callback_query.answer(OVERLOAD_TEXT)
+            elif event.message is not None:
+                await event.message.answer(OVERLOAD_TEXT)
+        except Exception as e:
+            logger.debug("Ответ о перегрузке не отправлен: {}", e)
+
+    async def _acquire(self) -> bool:
+        if not self.max_wait:
+            await self._semaphore.acquire()
+            return True
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        if self._semaphore.locked():
+            if self.queued >= self.max_queued:
+                self.shed_full += 1
+                await self._shed(event, "очередь полна")
+                return None
+
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+            started = time.monotonic()
+            try:
+                with tracing.span("limiter.wait", queued=self.queued):
+                    acquired = await self._acquire()
+            finally:
+                self.queued -= 1
+            waited = time.monotonic() - started
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            if not acquired:
+                self.shed_timeout += 1
+                await self._shed(event, f"ожидание {waited:.1f} с")
+                return None
+        else:
+            await self._semaphore.acquire()
+
+        self.admitted += 1
+        self.inflight += 1
+        self.peak_inflight = max(self.peak_inflight, self.inflight)
+        try:
+            return await handler(event, data)
+        finally:
+            self.inflight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "peak_inflight": self.peak_inflight,
+            "peak_queued": self.peak_queued,
+            "admitted": self.admitted,
+            "shed_full": self.shed_full,
+            "shed_timeout": self.shed_timeout,
+            "avg_wait": round(self.wait_total / self.admitted, 4) if self.admitted else 0.0,
+            "max_wait": round(self.wait_max, 4),
+        }
+
+
+concurrency_limiter = ConcurrencyLimiterMiddleware()
@@ -0,0 +1,228 @@
+"""
+Ограничение частоты входящих сообщений пользователя.
+
+name_received / phone_received принимают любое сообщение в состоянии
+ожидания, /start — это запросы к БД: клиент, который шлёт сообщения
+скриптом, без ограничения занимает процесс и соединения пула.
+
+Inner-middleware message диспетчера (видны флаги обработчика, действует и
+во всех роутерах): у пользователя своя корзина токенов (token bucket) на
+каждое правило.
+Правило обработчика задаётся флагом flags={"throttling": "<имя>"},
+обработчики без флага идут по правилу "default". Правило — скорость
+пополнения (токенов в секунду), ёмкость корзины, политика и максимальная
+длина текста:
+- drop  — сообщение сверх лимита молча отбрасывается;
+- delay — ждёт токен, но не дольше THROTTLE_MAX_DELAY, иначе отбрасывается.
+  Ожидание идёт внутри апдейта, то есть с занятым слотом
+  ConcurrencyLimiterMiddleware: THROTTLE_MAX_DELAY ограничен половиной
+  LIMITER_MAX_WAIT, чтобы ожидающий флудер не выдерживал очередь до
+  OVERLOAD_TEXT; для ввода, который может прийти пачкой, лучше drop;
+- warn  — первое сообщение сверх лимита получает THROTTLE_WARN_TEXT,
+  следующие отбрасываются молча, пока корзина не пополнится.
+Текст (или подпись) длиннее max_length получает THROTTLE_TOO_LONG_TEXT
+и до обработчика не доходит.
+
+Правила по умолчанию — THROTTLE_RULES ниже, переопределяются переменной
+окружения THROTTLE_RULES="free_text=0.5/3/drop/256,command=0.2/3/warn".
+
+Состояние — [токены, время, предупреждён] на пару (пользователь, правило)
+в OrderedDict по времени последнего сообщения: корзины, успевшие
+наполниться целиком, удаляются (они ничем не отличаются от новой), при
+THROTTLE_MAX_BUCKETS вытесняются самые давние.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import Message
+from loguru import logger
+
+from middlewares.concurrency_limiter_middleware import LIMITER_MAX_WAIT
+
+THROTTLE_MAX_DELAY = float(os.getenv("THROTTLE_MAX_DELAY", "5"))
+THROTTLE_MAX_BUCKETS = int(os.getenv("THROTTLE_MAX_BUCKETS", "100000"))
+THROTTLE_WARN_TEXT = os.getenv(
+    "THROTTLE_WARN_TEXT",
+    "⏳ Слишком много сообщений подряд. Подождите немного и попробуйте снова.",
+)
+THROTTLE_TOO_LONG_TEXT = os.getenv(
+    "THROTTLE_TOO_LONG_TEXT",
+    "Сообщение слишком длинное. Пожалуйста, напишите короче.",
+)
+
+POLICIES = ("drop", "delay", "warn")
+
+
+class ThrottleRule:
+    def __init__(self, rate: float, burst: int, policy: str = "warn", max_length: Optional[int] = None) -> None:
+        if policy not in POLICIES:
+            logger.warning("Неизвестная политика троттлинга {}, используется warn", policy)
+            policy = "warn"
+        self.rate = rate
+        self.burst = burst
+        self.policy = policy
+        self.max_length = max_length
+
+    @classmethod
+    def parse(cls, value: str) -> "ThrottleRule":
+        """'rate/burst/policy[/max_length]', например '0.5/3/drop/256'."""
+        parts = value.split("/")
+        max_length = int(parts[3]) if len(parts) > 3 and parts[3] else None
+        return cls(float(parts[0]), int(parts[1]), parts[2] if len(parts) > 2 else "warn", max_length)
+
+    def refill_time(self) -> float:
+        """За сколько секунд пустая корзина наполняется целиком."""
+        return self.burst / self.rate
+
+
+# Имя правила (флаг "throttling" обработчика) -> правило
+THROTTLE_RULES: Dict[str, ThrottleRule] = {
+    # Обработчики без флага: обычному пользователю не заметно
+    "default": ThrottleRule(rate=1.0, burst=10, policy="warn", max_length=4096),
+    # Ввод имени и телефона: сообщение — это текст в FSM и ответ с клавиатурой
+    "free_text": ThrottleRule(rate=0.5, burst=3, policy="drop", max_length=256),
+    # /start и /del — запросы к БД
+    "command": ThrottleRule(rate=0.2, burst=3, policy="warn"),
+}
+
+
+def _load_rules(value: str) -> Dict[str, ThrottleRule]:
+    rules = dict(THROTTLE_RULES)
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, spec = item.partition("=")
+        try:
+            rule = ThrottleRule.parse(spec.strip())
+        except (ValueError, IndexError):
+            logger.warning("Не удалось разобрать правило троттлинга {!r}, пропущено", item)
+            continue
+        # not > 0 отсекает и nan; при нулевой скорости корзина не пополняется (деление на rate)
+        if not rule.rate > 0 or rule.burst < 1:
+            logger.warning("Правило троттлинга {!r}: нужны скорость > 0 и ёмкость >= 1, пропущено", item)
+            continue
+        rules[name.strip()] = rule
+    return rules
+
+
+_Key = Tuple[int, str]
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    def __init__(
+        self,
+        rules: Optional[Dict[str, ThrottleRule]] = None,
+        max_delay: float = THROTTLE_MAX_DELAY,
+        max_buckets: int = THROTTLE_MAX_BUCKETS,
+    ) -> None:
+        self.rules = rules if rules is not None else _load_rules(os.getenv("THROTTLE_RULES", ""))
+        if max_delay > LIMITER_MAX_WAIT / 2:
+            logger.warning(
+                "THROTTLE_MAX_DELAY={} больше половины LIMITER_MAX_WAIT={}, используется {}",
+                max_delay, LIMITER_MAX_WAIT, LIMITER_MAX_WAIT / 2,
+            )
+            max_delay = LIMITER_MAX_WAIT / 2
+        self.max_delay = max_delay
+        self.max_buckets = max_buckets
+        self.passed = 0
+        self.delayed = 0
+        self.dropped = 0
+        self.warned = 0
+        self.too_long = 0
+        self.evicted = 0
+        # (user_id, правило) -> [токены, время обновления, предупреждён]; порядок — по времени обновления
+        self._buckets: "OrderedDict[_Key, List[Any]]" = OrderedDict()
+
+    def _prune(self, now: float) -> None:
+        while self._buckets:
+            (_, name), (tokens, updated_at, _) = next(iter(self._buckets.items()))
+            rule = self.rules.get(name)
+            if len(self._buckets) >= self.max_buckets:
+                self.evicted += 1
+            elif rule is not None and now - updated_at < rule.refill_time():
+                break
+            self._buckets.popitem(last=False)
+
+    def _take(self, key: _Key, rule: ThrottleRule, now: float) -> Tuple[float, List[Any]]:
+        """
+        Забирает токен из корзины. Возвращает (сколько ждать токен, состояние):
+        0 — токен есть; при ожидании токен уже взят в долг.
+        """
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            bucket = [float(rule.burst), now, False]
+        else:
+            bucket[0] = min(float(rule.burst), bucket[0] + (now - bucket[1]) * rule.rate)
+            bucket[1] = now
+        self._buckets[key] = bucket
+        bucket[0] -= 1
+        if bucket[0] >= 0:
+            bucket[2] = False
+            return 0.0, bucket
+        return -bucket[0] / rule.rate, bucket
+
+    @staticmethod
+    def _text_length(event: Message) -> int:
+        return len(event.text or event.caption or "")
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        if event.from_user is None:
+            return await handler(event, data)
+        name = get_flag(data, "throttling", default="default")
+        rule = self.rules.get(name) or self.rules["default"]
+        user_id = event.from_user.id
+
+        now = time.monotonic()
+        self._prune(now)
+        wait, bucket = self._take((user_id, name), rule, now)
+
+        if wait > 0:
+            if rule.policy == "delay" and wait <= self.max_delay:
+                self.delayed += 1
+                await asyncio.sleep(wait)
+            else:
+                # Токен не понадобился — возвращаем долг, чтобы не копить его от флуда
+                bucket[0] += 1
+                if rule.policy == "warn" and not bucket[2]:
+                    bucket[2] = True
+                    self.warned += 1
+                    logger.info("Пользователь {} превысил лимит сообщений ({}), предупреждён", user_id, name)
+                    await event.answer(THROTTLE_WARN_TEXT)
+                else:
+                    self.dropped += 1
+                    logger.debug("Сообщение пользователя {} отброшено по лимиту ({})", user_id, name)
+                return None
+
+        if rule.max_length is not None and self._text_length(event) > rule.max_length:
+            self.too_long += 1
+            logger.info(
+                "Пользователь {}: сообщение длиной {} > {} ({}) не обработано",
+                user_id, self._text_length(event), rule.max_length, name,
+            )
+            await event.answer(THROTTLE_TOO_LONG_TEXT)
+            return None
+
+        self.passed += 1
+        return await handler(event, data)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "passed": self.passed,
+            "delayed": self.delayed,
+            "dropped": self.dropped,
+            "warned": self.warned,
+            "too_long": self.too_long,
+            "evicted": self.evicted,
+            "buckets": len(self._buckets),
+        }
+
+
+throttling = ThrottlingMiddleware()
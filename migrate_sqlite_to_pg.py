@@ -0,0 +1,296 @@
+"""
+Перенос исторических данных из SQLite (bot.db ранних деплоев) в Postgres.
+
+Строки читаются из SQLite потоком пачками и грузятся в Postgres через COPY
+(asyncpg copy_records_to_table) — на порядки быстрее, чем через ORM.
+
+ID перемапливаются, поэтому переносить можно и в непустую базу:
+    users    — по telegram_id: уже существующий пользователь не дублируется,
+               его строки из SQLite привязываются к существующему id;
+    quizzes  — так же по code;
+    остальные таблицы — новый id = старый id + текущий MAX(id) в Postgres,
+               user_id / quiz_id переводятся через карты выше.
+Строки, ссылающиеся на отсутствующего пользователя/квиз, пропускаются.
+После загрузки sequence'ы id выставляются на MAX(id).
+
+Таблицы без id (MERGES) грузятся COPY во временную таблицу и сливаются
+INSERT ... ON CONFLICT по первичному ключу:
+    user_progress          — у пользователя, уже бывшего в Postgres, строка
+                             остаётся как есть (её сверит progress --backfill);
+    event_daily_aggregates — счётчики одного дня, кода, квиза и сегмента
+                             складываются.
+app_meta не переносится: отпечаток схемы и offset polling'а — свои у
+каждой базы.
+
+Всё выполняется в одной транзакции; таблицы на это время закрыты на запись.
+Бот на время переноса лучше остановить. После переноса:
+    python -m event_fields --backfill   # ключи payload старых событий -> колонки
+    python -m progress --backfill       # user_progress пересобирается по событиям
+
+    DATABASE_URL=postgresql+asyncpg://... python -m migrate_sqlite_to_pg --sqlite bot.db --batch 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import aiosqlite
+import asyncpg
+from loguru import logger
+from sqlalchemy import JSON, Boolean, Date, DateTime, Enum, make_url
+
+from models import (
+    EventDailyAggregate,
+    NonPsychQuizResult,
+    Quiz,
+    QuizResult,
+    ScenarioCostResult,
+    User,
+    UserEvent,
+    UserProgress,
+)
+
+# Порядок важен: сначала таблицы, на которые ссылаются остальные
+TABLES = [
+    User, Quiz, QuizResult, ScenarioCostResult, NonPsychQuizResult, UserEvent,
+    UserProgress, EventDailyAggregate,
+]
+
+# Естественные ключи для сопоставления с уже существующими строками
+NATURAL_KEYS = {User: "telegram_id", Quiz: "code"}
+
+# Внешние ключи и таблица, через карту id которой они переводятся
+FOREIGN_KEYS = {"user_id": User, "quiz_id": Quiz}
+
+# Таблицы без id: что делать при совпадении первичного ключа ({table} — имя таблицы)
+MERGES = {
+    UserProgress: "DO NOTHING",
+    EventDailyAggregate: (
+        "DO UPDATE SET events = {table}.events + EXCLUDED.events, users = {table}.users + EXCLUDED.users"
+    ),
+}
+
+
+def _parse_datetime(value: Any) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def _to_json_text(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _converter(column) -> Callable[[Any], Any]:
+    """Приведение значения из SQLite к типу, который ждёт COPY asyncpg."""
+    if isinstance(column.type, DateTime):
+        return _parse_datetime
+    if isinstance(column.type, Date):
+        return _parse_date
+    if isinstance(column.type, Boolean):
+        return lambda v: None if v is None else bool(v)
+    if isinstance(column.type, JSON):
+        return _to_json_text
+    if isinstance(column.type, Enum):
+        return lambda v: None if v is None else str(v)
+    return lambda v: v
+
+
+def _missing_value(column) -> Any:
+    """Значение для колонки, которой нет в старом SQLite: скалярный default модели или NULL."""
+    default = column.default
+    if default is not None and default.is_scalar:
+        return default.arg
+    return None
+
+
+def pg_dsn(url: str) -> str:
+    """DSN для asyncpg из SQLAlchemy URL (postgresql+asyncpg://...)."""
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+class TableStats:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.read = 0
+        self.copied = 0
+        self.matched = 0
+        self.orphaned = 0
+        self.seconds = 0.0
+
+    def __str__(self) -> str:
+        rate = self.copied / self.seconds if self.seconds else 0
+        return (
+            f"{self.name:<24} прочитано {self.read:>9}  загружено {self.copied:>9}  "
+            f"совпало {self.matched:>7}  без родителя {self.orphaned:>7}  "
+            f"{self.seconds:7.2f} с  {rate:9.0f} строк/с"
+        )
+
+
+class Migrator:
+    def __init__(self, sqlite: aiosqlite.Connection, pg: asyncpg.Connection, batch: int) -> None:
+        self.sqlite = sqlite
+        self.pg = pg
+        self.batch = batch
+        # старый id -> новый id для таблиц, на которые ссылаются внешние ключи
+        self.id_maps: Dict[Any, Dict[int, int]] = {User: {}, Quiz: {}}
+
+    async def _sqlite_columns(self, table_name: str) -> Optional[List[str]]:
+        async with self.sqlite.execute(f"PRAGMA table_info({table_name})") as cursor:
+            rows = await cursor.fetchall()
+        return [row[1] for row in rows] or None
+
+    async def _existing_keys(self, model) -> Dict[Any, int]:
+        key = NATURAL_KEYS[model]
+        rows = await self.pg.fetch(f"SELECT {key}, id FROM {model.__tablename__}")
+        return {row[0]: row[1] for row in rows}
+
+    async def migrate_table(self, model) -> TableStats:
+        table = model.__table__
+        stats = TableStats(table.name)
+        source_columns = await self._sqlite_columns(table.name)
+        if source_columns is None:
+            logger.info("{}: таблицы нет в SQLite, пропуск", table.name)
+            return stats
+
+        started = time.perf_counter()
+        columns = [c for c in table.columns]
+        column_names = [c.name for c in columns]
+        readable = [c.name for c in columns if c.name in source_columns]
+        converters = {c.name: _converter(c) for c in columns}
+        missing = {c.name: _missing_value(c) for c in columns if c.name not in source_columns}
+
+        merge = MERGES.get(model)
+        if merge is None:
+            offset = await self.pg.fetchval(f"SELECT COALESCE(MAX(id), 0) FROM {table.name}")
+        else:
+            await self.pg.execute(
+                f"CREATE TEMP TABLE {table.name}_stage (LIKE {table.name}) ON COMMIT DROP"
+            )
+        natural_key = NATURAL_KEYS.get(model)
+        existing = await self._existing_keys(model) if natural_key else {}
+        id_map = self.id_maps.get(model)
+
+        order = ", ".join(c.name for c in table.primary_key.columns)
+        query = f"SELECT {', '.join(readable)} FROM {table.name} ORDER BY {order}"
+        async with self.sqlite.execute(query) as cursor:
+            while rows := await cursor.fetchmany(self.batch):
+                records: List[Tuple] = []
+                for row in rows:
+                    stats.read += 1
+                    values = dict(missing)
+                    values.update((name, converters[name](value)) for name, value in zip(readable, row))
+                    old_id = values.get("id")
+
+                    if natural_key and values[natural_key] in existing:
+                        id_map[old_id] = existing[values[natural_key]]
+                        stats.matched += 1
+                        continue
+
+                    orphan = False
+                    for fk, parent in FOREIGN_KEYS.items():
+                        # 0 — «без родителя» (quiz_id в event_daily_aggregates), id начинаются с 1
+                        if values.get(fk):
+                            mapped = self.id_maps[parent].get(values[fk])
+                            if mapped is None:
+                                orphan = True
+                                break
+                            values[fk] = mapped
+                    if orphan:
+                        stats.orphaned += 1
+                        continue
+
+                    if merge is None:
+                        values["id"] = old_id + offset
+                        if id_map is not None:
+                            id_map[old_id] = values["id"]
+                    records.append(tuple(values[name] for name in column_names))
+
+                if records and merge is not None:
+                    await self._merge(table, column_names, records, merge, stats)
+                elif records:
+                    await self.pg.copy_records_to_table(table.name, records=records, columns=column_names)
+                    stats.copied += len(records)
+
+        if merge is None:
+            await self.pg.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 1) FROM {table.name}))"
+            )
+        stats.seconds = time.perf_counter() - started
+        logger.info("{}", stats)
+        return stats
+
+    async def _merge(self, table, column_names: List[str], records: List[Tuple], merge: str, stats: TableStats) -> None:
+        """Пачка строк таблицы без id: COPY во временную таблицу и INSERT ... ON CONFLICT."""
+        stage = f"{table.name}_stage"
+        names = ", ".join(column_names)
+        key = ", ".join(c.name for c in table.primary_key.columns)
+        await self.pg.copy_records_to_table(stage, records=records, columns=column_names)
+        status = await self.pg.execute(
+            f"INSERT INTO {table.name} ({names}) SELECT {names} FROM {stage} "
+            f"ON CONFLICT ({key}) {merge.format(table=table.name)}"
+        )
+        await self.pg.execute(f"TRUNCATE {stage}")
+        # Статус 'INSERT 0 <строк>': вставленные и обновлённые; при DO NOTHING остальные совпали
+        inserted = int(status.split()[-1])
+        stats.copied += inserted
+        stats.matched += len(records) - inserted
+
+    async def run(self) -> List[TableStats]:
+        names = ", ".join(model.__tablename__ for model in TABLES)
+        async with self.pg.transaction():
+            # Чтение разрешено, запись ждёт конца переноса: offset'ы id не устареют
+            await self.pg.execute(f"LOCK TABLE {names} IN EXCLUSIVE MODE")
+            return [await self.migrate_table(model) for model in TABLES]
+
+
+async def migrate(sqlite_path: str, database_url: str, batch: int) -> List[TableStats]:
+    from database import engine, init_db
+
+    # Схема в Postgres создаётся так же, как при старте бота
+    await init_db()
+    await engine.dispose()
+
+    started = time.perf_counter()
+    async with aiosqlite.connect(sqlite_path) as sqlite:
+        pg = await asyncpg.connect(pg_dsn(database_url))
+        try:
+            stats = await Migrator(sqlite, pg, batch).run()
+        finally:
+            await pg.close()
+
+    elapsed = time.perf_counter() - started
+    copied = sum(s.copied for s in stats)
+    print()
+    for item in stats:
+        print(item)
+    print(f"\nИтого: {copied} строк за {elapsed:.2f} с ({copied / elapsed if elapsed else 0:.0f} строк/с)")
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sqlite", default="bot.db", help="путь к SQLite-файлу")
+    parser.add_argument("--batch", type=int, default=5000, help="строк в одном COPY")
+    args = parser.parse_args()
+
+    database_url = os.getenv("DATABASE_URL", "")
+    if not database_url.startswith("postgresql"):
+        raise SystemExit("DATABASE_URL должен указывать на Postgres (postgresql+asyncpg://...)")
+    asyncio.run(migrate(args.sqlite, database_url, args.batch))
+
+
+if __name__ == "__main__":
+    main()
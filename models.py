@@ -1,5 +1,5 @@
 import enum
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Enum, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, String, Date, DateTime, Boolean, Enum, ForeignKey, Index, JSON
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
@@ -7,6 +7,9 @@ from sqlalchemy.orm import relationship
 
 Base = declarative_base()
 
+# JSON, который на Postgres хранится как JSONB, а на SQLite — как текст
+PortableJSON = JSON().with_variant(JSONB(), "postgresql")
+
 
 class QuizScenario(enum.Enum):
     IMPOSTOR = "impostor"            # Синдром самозванца
@@ -52,6 +55,12 @@ class User(Base):
         back_populates="user",
         cascade="all, delete-orphan"
     )
+    progress = relationship(
+        "UserProgress",
+        back_populates="user",
+        uselist=False,
+        cascade="all, delete-orphan"
+    )
 
     def __repr__(self):
         return f"<User(telegram_id={self.telegram_id}, user_name='{self.user_name}')>"
@@ -141,6 +150,9 @@ class ScenarioCostResult(Base):
     lost_total = Column(Integer, nullable=False)       # упущено за период (months_delay)
     lost_3_years = Column(Integer, nullable=False)     # прогноз за 3 года
 
+    # версия формулы расчётных полей (formulas.py); NULL — записано до версионирования
+    formula_version = Column(Integer, nullable=True)
+
     created_at = Column(DateTime, default=func.now())
 
     # связи
@@ -166,8 +178,24 @@ class UserEvent(Base):
     # Короткий код события: 'bot_start', 'name_confirmed', 'quiz_started', ...
     event_code = Column(String, nullable=False)
 
-    # Доп. данные события (произвольные ключи), хранится как JSONB
-    payload = Column(JSONB, nullable=True)
+    # Часто фильтруемые поля события — отдельными колонками с индексами
+    # (заполняются в log_event из одноимённых ключей payload, см. event_fields.py)
+    quiz_result_id = Column(Integer, nullable=True, index=True)
+    dominant_scenario = Column(
+        Enum(
+            QuizScenario,
+            name="quizscenario",
+            values_callable=lambda obj: [e.value for e in obj],
+        ),
+        nullable=True,
+        index=True,
+    )
+    goal = Column(String, nullable=True, index=True)   # 'goal_career' / 'goal_skills' / 'goal_personal'
+    is_psychologist = Column(Boolean, nullable=True)
+    path = Column(String, nullable=True)                # путь отправленного файла
+
+    # Остальные доп. данные события (произвольные ключи), на Postgres хранится как JSONB
+    payload = Column(PortableJSON, nullable=True)
 
     # Флаг: отправлено ли напоминание спустя 24 часа после старта (или другого контрольного события)
     reminder_24h_sent = Column(Boolean, default=False, nullable=False)
@@ -236,6 +264,9 @@ class NonPsychQuizResult(Base):
     # "накопили {4 + количество выбранных} формы саботажа"
     sabotage_forms_total = Column(Integer, nullable=False)
 
+    # версия формулы расчётных полей (formulas.py); NULL — записано до версионирования
+    formula_version = Column(Integer, nullable=True)
+
     created_at = Column(DateTime, default=func.now())
 
     # связи
@@ -249,3 +280,82 @@ class NonPsychQuizResult(Base):
             f"coef={self.frequency_coef}, "
             f"sabotage_count={self.sabotage_items_count})>"
         )
+
+
+class UserProgress(Base):
+    """
+    Текущий шаг воронки пользователя (шаги — funnel.FUNNEL_STEPS) и время
+    первого достижения каждого шага. Ведётся инкрементально при записи
+    событий (progress.py), пересобирается: python -m progress --backfill
+    """
+
+    __tablename__ = 'user_progress'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+
+    # Максимальный пройденный шаг (0 — событий воронки ещё не было) и когда он достигнут
+    stage = Column(Integer, nullable=False, default=0)
+    stage_at = Column(DateTime, nullable=True)
+
+    # Первое достижение шагов 1..11, NULL — шаг не пройден
+    ts_01 = Column(DateTime, nullable=True)
+    ts_02 = Column(DateTime, nullable=True)
+    ts_03 = Column(DateTime, nullable=True)
+    ts_04 = Column(DateTime, nullable=True)
+    ts_05 = Column(DateTime, nullable=True)
+    ts_06 = Column(DateTime, nullable=True)
+    ts_07 = Column(DateTime, nullable=True)
+    ts_08 = Column(DateTime, nullable=True)
+    ts_09 = Column(DateTime, nullable=True)
+    ts_10 = Column(DateTime, nullable=True)
+    ts_11 = Column(DateTime, nullable=True)
+
+    # События пользователя раньше этого момента свёрнуты (compaction.py) и удалены:
+    # их первые касания остались только в ts_XX, отчёты funnel.py берут их отсюда
+    compacted_at = Column(DateTime, nullable=True)
+
+    # "кто застрял на шаге 6 дольше суток" — поиск по индексу
+    __table_args__ = (
+        Index("ix_user_progress_stage_stage_at", "stage", "stage_at"),
+    )
+
+    user = relationship("User", back_populates="progress")
+
+    def __repr__(self):
+        return f"<UserProgress(user_id={self.user_id}, stage={self.stage}, stage_at={self.stage_at})>"
+
+
+class EventDailyAggregate(Base):
+    """
+    Свёрнутые старые события user_events (compaction.py): число событий и
+    пользователей за день по коду события, квизу и сегменту пользователя.
+    """
+
+    __tablename__ = 'event_daily_aggregates'
+
+    day = Column(Date, primary_key=True)
+    event_code = Column(String, primary_key=True)
+    quiz_id = Column(Integer, primary_key=True, default=0)   # 0 — событие без квиза
+    segment = Column(String, primary_key=True)               # 'psych' / 'non_psych' / 'unknown'
+
+    events = Column(Integer, nullable=False, default=0)
+    # Уникальные пользователи; свёртка идёт диапазонами пользователей, поэтому части дня складываются без повторов
+    users = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<EventDailyAggregate(day={self.day}, event_code={self.event_code}, events={self.events})>"
+
+
+class AppMeta(Base):
+    """
+    Служебные ключ-значение самого бота (отпечаток схемы БД и т.п.).
+    """
+
+    __tablename__ = 'app_meta'
+
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=True)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<AppMeta(key='{self.key}', value='{self.value}')>"
@@ -0,0 +1,215 @@
+"""
+Таблица user_progress: текущий шаг воронки каждого пользователя и время
+первого достижения шагов (шаги и коды событий — funnel.FUNNEL_STEPS).
+
+Ведётся инкрементально: log_event и register_bot_start выполняют в той же
+транзакции, что и запись события, upsert из progress_upsert(). Строка
+меняется только при первом достижении шага (ON CONFLICT ... DO UPDATE
+WHERE ts_XX IS NULL), повторные события ничего не пишут.
+
+"Кто застрял на шаге 6 дольше суток" — поиск по индексу (stage, stage_at)
+вместо агрегации user_events.
+
+    python -m progress                         # распределение по шагам
+    python -m progress --stuck 6 --hours 24    # застрявшие на шаге
+    python -m progress --backfill              # пересобрать по user_events
+"""
+import argparse
+import asyncio
+import time
+from datetime import timedelta
+from typing import Any, Dict, List
+
+from loguru import logger
+from sqlalchemy import and_, case, func, or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import IS_SQLITE, db_now, engine
+from funnel import FUNNEL_STEPS, _ts_column, add_conversions, step_timestamps_query, transition_percentiles
+from models import User, UserProgress
+
+# Код события -> шаг воронки
+STEP_BY_EVENT: Dict[str, int] = {code: step for step, _, codes in FUNNEL_STEPS for code in codes}
+
+STEP_LABELS: Dict[int, str] = {step: label for step, label, _ in FUNNEL_STEPS}
+
+
+def _insert():
+    return sqlite_insert(UserProgress) if IS_SQLITE else pg_insert(UserProgress)
+
+
+def _earliest(current: Any, new: Any) -> Any:
+    return case((or_(current.is_(None), new < current), new), else_=current)
+
+
+def progress_upsert(user_id: Any, event_code: str):
+    """
+    Upsert user_progress для события event_code, или None, если событие не шаг воронки.
+    user_id — значение или скалярный подзапрос (например, из CTE в register_bot_start).
+    """
+    step = STEP_BY_EVENT.get(event_code)
+    if step is None:
+        return None
+    ts = _ts_column(step)
+    now = func.now()
+    stmt = _insert().values({"user_id": user_id, "stage": step, "stage_at": now, ts: now})
+    advanced = stmt.excluded.stage > UserProgress.stage
+    return stmt.on_conflict_do_update(
+        index_elements=[UserProgress.user_id],
+        set_={
+            ts: stmt.excluded[ts],
+            "stage": case((advanced, stmt.excluded.stage), else_=UserProgress.stage),
+            "stage_at": case((advanced, stmt.excluded.stage_at), else_=UserProgress.stage_at),
+        },
+        where=getattr(UserProgress, ts).is_(None),
+    )
+
+
+def _stage_expr(columns) -> Any:
+    """Номер последнего пройденного шага, как stage_reached в analytics_funnel.sql."""
+    return case(
+        *[(columns[_ts_column(step)].isnot(None), step) for step, _, _ in reversed(FUNNEL_STEPS)],
+        else_=0,
+    )
+
+
+def _stage_at_expr(columns) -> Any:
+    return case(
+        *[(columns[_ts_column(step)].isnot(None), columns[_ts_column(step)]) for step, _, _ in reversed(FUNNEL_STEPS)],
+        else_=None,
+    )
+
+
+def backfill_statement(low: int, high: int):
+    """
+    Слияние user_progress с событиями пользователей с id в [low, high):
+    самые ранние метки, самый дальний шаг. Используется и свёрткой (compaction.py).
+    """
+    flags = step_timestamps_query(compacted=False).where(User.id >= low, User.id < high).subquery()
+    ts_columns = [_ts_column(step) for step, _, _ in FUNNEL_STEPS]
+    stage = _stage_expr(flags.c)
+    source = select(
+        flags.c.user_id, stage, _stage_at_expr(flags.c), *[flags.c[name] for name in ts_columns]
+    ).where(stage > 0)
+
+    stmt = _insert().from_select(["user_id", "stage", "stage_at", *ts_columns], source)
+    # Слияние с тем, что успели записать обработчики: самые ранние метки, самый дальний шаг
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserProgress.user_id],
+        set_={
+            **{name: _earliest(getattr(UserProgress, name), excluded[name]) for name in ts_columns},
+            "stage": case((excluded.stage > UserProgress.stage, excluded.stage), else_=UserProgress.stage),
+            "stage_at": case(
+                (excluded.stage > UserProgress.stage, excluded.stage_at),
+                (excluded.stage == UserProgress.stage, _earliest(UserProgress.stage_at, excluded.stage_at)),
+                else_=UserProgress.stage_at,
+            ),
+        },
+    )
+    return stmt
+
+
+async def _backfill_chunk(low: int, high: int) -> int:
+    """Пересчёт user_progress по событиям пользователей с id в [low, high)."""
+    async with engine.begin() as conn:
+        result = await conn.execute(backfill_statement(low, high))
+        return result.rowcount
+
+
+async def backfill(chunk: int = 5000, pause: float = 0.0) -> int:
+    """Пересобирает user_progress из user_events диапазонами id пользователей."""
+    async with engine.connect() as conn:
+        low, high = (await conn.execute(select(func.min(User.id), func.max(User.id)))).one()
+    if low is None:
+        return 0
+
+    started = time.monotonic()
+    written = 0
+    for chunk_low in range(low, high + 1, chunk):
+        written += await _backfill_chunk(chunk_low, chunk_low + chunk)
+        if pause:
+            await asyncio.sleep(pause)
+
+    elapsed = time.monotonic() - started
+    logger.info("user_progress: записано {} строк за {:.1f} с", written, elapsed)
+    return written
+
+
+async def stage_counts(db: AsyncSession) -> Dict[int, int]:
+    """Сколько пользователей сейчас на каждом шаге."""
+    rows = await db.execute(
+        select(UserProgress.stage, func.count()).group_by(UserProgress.stage).order_by(UserProgress.stage)
+    )
+    return {stage: count for stage, count in rows.all()}
+
+
+async def funnel_counts(db: AsyncSession) -> Dict[str, Any]:
+    """
+    Воронка как funnel.funnel_counts, но по user_progress: count по колонкам
+    ts_XX вместо группировки всех user_events.
+    """
+    users_total = (await db.execute(select(func.count(User.id)))).scalar_one()
+    row = (await db.execute(
+        select(*[func.count(getattr(UserProgress, _ts_column(step))).label(label) for step, label, _ in FUNNEL_STEPS])
+    )).one()
+    return add_conversions({"users_total": users_total, **row._mapping})
+
+
+async def duration_percentiles(db: AsyncSession) -> List[Dict[str, Any]]:
+    """p50/p90 переходов между шагами (funnel.DURATION_PAIRS) по user_progress."""
+    columns = [getattr(UserProgress, _ts_column(step)) for step, _, _ in FUNNEL_STEPS]
+    rows = (await db.execute(select(*columns).where(UserProgress.stage >= 2))).all()
+    return transition_percentiles(rows)
+
+
+async def stuck_users(
+    db: AsyncSession,
+    stage: int,
+    older_than: timedelta,
+    limit: int = 1000,
+) -> List[UserProgress]:
+    """Пользователи, которые на шаге stage дольше older_than (по индексу stage, stage_at)."""
+    # stage_at пишется по часам БД (func.now()), граница — тоже по ним
+    cutoff = await db_now(db) - older_than
+    result = await db.execute(
+        select(UserProgress)
+        .where(and_(UserProgress.stage == stage, UserProgress.stage_at < cutoff))
+        .order_by(UserProgress.stage_at)
+        .limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backfill", action="store_true", help="пересобрать таблицу по user_events")
+    parser.add_argument("--chunk", type=int, default=5000, help="пользователей на транзакцию при --backfill")
+    parser.add_argument("--stuck", type=int, default=None, metavar="STEP", help="показать застрявших на шаге")
+    parser.add_argument("--hours", type=float, default=24, help="сколько часов на шаге считается застреванием")
+    args = parser.parse_args()
+
+    from database import init_db, read_session
+
+    try:
+        if args.backfill:
+            await init_db()
+            await backfill(args.chunk)
+
+        async with read_session() as db:
+            if args.stuck is not None:
+                users = await stuck_users(db, args.stuck, timedelta(hours=args.hours))
+                print(f"На шаге {STEP_LABELS.get(args.stuck, args.stuck)} дольше {args.hours} ч: {len(users)}")
+                for item in users:
+                    print(f"  user_id={item.user_id}  с {item.stage_at}")
+            else:
+                for stage, count in (await stage_counts(db)).items():
+                    print(f"{STEP_LABELS.get(stage, stage):<30} {count}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
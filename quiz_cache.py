@@ -0,0 +1,40 @@
+"""
+Кэш квизов code -> id. Квизы меняются редко, а id нужен почти каждому
+событию аналитики и каждому старту квиза, поэтому держим его в памяти.
+"""
+from typing import Dict, Optional
+
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import Quiz
+
+_quiz_ids: Dict[str, int] = {}
+
+
+async def preload_quizzes() -> int:
+    """Загружает все квизы в кэш. Возвращает их количество."""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(Quiz.code, Quiz.id))
+        rows = result.all()
+    _quiz_ids.update({code: quiz_id for code, quiz_id in rows})
+    logger.info("Загружено квизов в кэш: {}", len(rows))
+    return len(rows)
+
+
+async def get_quiz_id(db: AsyncSession, code: str) -> Optional[int]:
+    """id квиза по коду: из кэша, при промахе — из БД."""
+    quiz_id = _quiz_ids.get(code)
+    if quiz_id is not None:
+        return quiz_id
+    result = await db.execute(select(Quiz.id).where(Quiz.code == code))
+    quiz_id = result.scalar_one_or_none()
+    if quiz_id is not None:
+        _quiz_ids[code] = quiz_id
+    return quiz_id
+
+
+def remember_quiz(code: str, quiz_id: int) -> None:
+    _quiz_ids[code] = quiz_id
@@ -0,0 +1,98 @@
+"""
+Описания квизов для quiz_engine. Каждый ответ даёт баллы сценариям;
+порядок scenarios — приоритет при равенстве баллов, results — экран
+результата (фото, текст) для каждого сценария.
+"""
+from quiz_engine import Answer, Question, QuizDefinition, register
+
+MAIN_PSYCH_QUIZ = register(QuizDefinition(
+    code="main_psych_quiz",
+    # Как раньше: при равенстве баллов побеждает первый из списка
+    scenarios=("impostor", "seeker", "eternal_student"),
+    questions=[
+        Question(
+            "<b>🧠 Когда вы думаете о том, чтобы двигаться глубже в психологию…</b>",
+            [
+                Answer("impostor", "«А вдруг я сделаю что-то не так и наврежу?»", {"impostor": 1}),
+                Answer("seeker", "«А вдруг не про меня? Вдруг снова передумаю?»", {"seeker": 1}),
+                Answer("eternal_student", "«Хочу всё продумать: упаковку, клиентов...»", {"eternal_student": 1}),
+            ],
+        ),
+        Question(
+            "<b>🗣 Если близкий человек критикует вас, ваша реакция:</b>",
+            [
+                Answer("eternal_student", "«Оправдываюсь, спорю и стараюсь лучше»", {"eternal_student": 1}),
+                Answer("seeker", "«Молчу, выпадаю и сомневаюсь в себе»", {"seeker": 1}),
+                Answer("impostor", "«Чувствую: я недостаточно хорош(а)»", {"impostor": 1}),
+            ],
+        ),
+        Question(
+            "<b>🚧 Что вас больше всего тормозит?</b>",
+            [
+                Answer("seeker", "«Учусь и ищу, но не могу определиться»", {"seeker": 1}),
+                Answer("impostor", "«Хватит ли знаний помогать и брать деньги?»", {"impostor": 1}),
+                Answer("eternal_student", "«Хочу довести до идеала перед действием»", {"eternal_student": 1}),
+            ],
+        ),
+        Question(
+            "<b>✨ Когда у вас что-то получается хорошо, первая мысль:</b>",
+            [
+                Answer("seeker", "«Круто, но не чувствую, что это моё»", {"seeker": 1}),
+                Answer("impostor", "«Наверное повезло, другие лучше бы справились»", {"impostor": 1}),
+                Answer("eternal_student", "«Хорошо, но вижу, где можно было лучше»", {"eternal_student": 1}),
+            ],
+        ),
+        Question(
+            "<b>🚀 Перед важным шагом вы чаще:</b>",
+            [
+                Answer("impostor", "«Сомневаюсь и ищу подтверждения, что справлюсь»", {"impostor": 1}),
+                Answer("eternal_student", "«Составляю план, чтобы учесть риски»", {"eternal_student": 1}),
+                Answer("seeker", "«Колеблюсь: а точно ли это тот шаг?»", {"seeker": 1}),
+            ],
+        ),
+    ],
+    finish_text="Квиз завершен!",
+    finish_button=("Узнать результаты сценариев", "show_quiz_results"),
+    results={
+        "impostor": (
+            "https://iimg.su/i/UaYJno",
+            "<b>Мы рассчитали ваш преобладающий сценарий.</b>\n"
+            "Внимание — это не ярлык, а точка осознанности.\n\n"
+            "🔑 Ваш сценарий — <b>«Синдром самозванца»</b>\n"
+            "Вы часто чувствуете, что знаний или опыта недостаточно. "
+            "Из-за этого сложно поднять цену или даже начать консультировать.\n\n"
+            "✨ Дойдите до конца — и мы покажем, как перестать ждать \"ещё одного диплома\" "
+            "и начать работать с тем, что уже есть.\n\n"
+            "<b>На следующем этапе вы увидите, как именно ваш сценарий влияет на вашу жизнь — "
+            "и почему вы теряете больше, чем кажется.</b>",
+        ),
+        "eternal_student": (
+            "https://iimg.su/i/qAA138",
+            "<b>Мы рассчитали ваш преобладающий сценарий.</b>\n"
+            "Внимание — это не ярлык, а точка осознанности.\n\n"
+            "🔑 Ваш сценарий — <b>«Вечный ученик»</b>\n"
+            "Вы хотите сделать всё идеально — чтобы было «по уму», без ошибок и хаоса. "
+            "Но именно это желание тормозит: вы откладываете действия, пока не будет идеального плана.\n\n"
+            "✨ Дойдите до конца — и мы покажем, как выйти из паралича \"всё должно быть идеально\" "
+            "и начать двигаться прямо сейчас.\n\n"
+            "<b>На следующем этапе вы увидите, как именно ваш сценарий влияет на вашу жизнь — "
+            "и почему вы теряете больше, чем кажется.</b>",
+        ),
+        "seeker": (
+            "https://iimg.su/i/OttTic",
+            "<b>Мы рассчитали ваш преобладающий сценарий.\n"
+            "Внимание — это не ярлык, а точка осознанности.</b>\n\n"
+            "🔑 Ваш сценарий — <b>«Искатель своего»</b>\n"
+            "Вы постоянно ищете, анализируете, пробуете разные направления. "
+            "Но чем больше думаете — тем труднее сделать выбор и двинуться дальше. "
+            "Сомнения забирают энергию и уверенность.\n\n"
+            "✨ Дойдите до конца — и мы покажем, как прекратить бесконечный поиск \"правильного пути\" "
+            "и наконец сделать выбор.\n\n"
+            "<b>На следующем этапе вы увидите, как именно ваш сценарий влияет на вашу жизнь — "
+            "и почему вы теряете больше, чем кажется.</b>",
+        ),
+    },
+    results_button=("Хочу узнать цену своего сценария", "learn_scenario_cost"),
+    # Итог основного квиза определяет ветку «цена сценария» (scenario_cost_handler)
+    sets_main_scenario=True,
+))
@@ -0,0 +1,181 @@
+"""
+Движок квизов по декларативному описанию.
+
+Квиз — это QuizDefinition: вопросы, ответы и вектор весов ответа по
+сценариям. При регистрации описание разворачивается в таблицы: callback_data
+ответа -> (номер вопроса, вектор весов), готовые клавиатуры вопросов.
+Обработчик ответа один на все квизы (handlers/quiz_handler.py): поиск
+маршрута — один dict lookup, начисление баллов — один UPDATE с прибавкой
+вектора к колонкам <сценарий>_score в quiz_results.
+
+Доминирующий сценарий детерминирован: максимум баллов, при равенстве —
+сценарий, стоящий раньше в QuizDefinition.scenarios.
+
+Новый квиз добавляется описанием в quiz_definitions.py, строкой в quizzes
+с тем же code и кнопкой с callback_data "start_quiz:<code>" — без нового
+кода обработчиков.
+"""
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from models import QuizResult, QuizScenario
+
+# callback_data кнопки, запускающей квиз по коду: "start_quiz:<code>"
+START_CALLBACK_PREFIX = "start_quiz:"
+
+# Значения, которые принимают колонки quiz_results.dominant_scenario и users.main_quiz_scenario
+_SCENARIO_VALUES = {scenario.value for scenario in QuizScenario}
+
+
+class Answer:
+    """Вариант ответа: код в callback_data, текст кнопки и баллы по сценариям."""
+
+    def __init__(self, code: str, text: str, weights: Dict[str, int]) -> None:
+        self.code = code
+        self.text = text
+        self.weights = weights
+
+    def __repr__(self) -> str:
+        return f"<Answer({self.code}: {self.weights})>"
+
+
+class Question:
+    def __init__(self, text: str, answers: Sequence[Answer]) -> None:
+        self.text = text
+        self.answers = list(answers)
+
+
+class QuizDefinition:
+    """
+    Описание квиза. scenarios задаёт порядок вектора весов и приоритет
+    при равенстве баллов; для каждого сценария в quiz_results должна быть
+    колонка <сценарий>_score.
+
+    results — экран результата для каждого сценария: (фото, текст);
+    results_button — кнопка следующего шага под ним (или None).
+    sets_main_scenario — итог квиза пишется в users.main_quiz_scenario
+    (сценарии тогда должны быть значениями QuizScenario).
+    """
+
+    def __init__(
+        self,
+        code: str,
+        scenarios: Sequence[str],
+        questions: Sequence[Question],
+        finish_text: str,
+        finish_button: Tuple[str, str],
+        results: Dict[str, Tuple[str, str]],
+        results_button: Optional[Tuple[str, str]] = None,
+        sets_main_scenario: bool = False,
+        start_event: str = "quiz_started",
+        callback_prefix: str = "q",
+    ) -> None:
+        self.code = code
+        self.scenarios = tuple(scenarios)
+        self.questions = list(questions)
+        self.finish_text = finish_text
+        self.finish_button = finish_button
+        self.results = dict(results)
+        self.sets_main_scenario = sets_main_scenario
+        self.start_event = start_event
+        self.callback_prefix = callback_prefix
+
+        self.score_columns = []
+        for scenario in self.scenarios:
+            column = getattr(QuizResult, f"{scenario}_score", None)
+            if column is None:
+                raise ValueError(f"Квиз {code}: в quiz_results нет колонки {scenario}_score")
+            self.score_columns.append(column)
+            if scenario not in self.results:
+                raise ValueError(f"Квиз {code}: нет экрана результата для сценария {scenario}")
+            if sets_main_scenario and scenario not in _SCENARIO_VALUES:
+                raise ValueError(f"Квиз {code}: сценарий {scenario} не из QuizScenario")
+
+        # callback_data -> (индекс вопроса, вектор весов в порядке scenarios)
+        self.routes: Dict[str, Tuple[int, Tuple[int, ...]]] = {}
+        self.keyboards: List[InlineKeyboardMarkup] = []
+        for index, question in enumerate(self.questions):
+            rows = []
+            for answer in question.answers:
+                unknown = set(answer.weights) - set(self.scenarios)
+                if unknown:
+                    raise ValueError(f"Квиз {code}, ответ {answer.code}: неизвестные сценарии {sorted(unknown)}")
+                data = self.callback_data(index, answer)
+                self.routes[data] = (index, tuple(answer.weights.get(s, 0) for s in self.scenarios))
+                rows.append([InlineKeyboardButton(text=answer.text, callback_data=data)])
+            self.keyboards.append(InlineKeyboardMarkup(inline_keyboard=rows))
+
+        text, callback_data = finish_button
+        self.finish_keyboard = InlineKeyboardMarkup(
+            inline_keyboard=[[InlineKeyboardButton(text=text, callback_data=callback_data)]]
+        )
+        self.results_keyboard: Optional[InlineKeyboardMarkup] = None
+        if results_button is not None:
+            text, callback_data = results_button
+            self.results_keyboard = InlineKeyboardMarkup(
+                inline_keyboard=[[InlineKeyboardButton(text=text, callback_data=callback_data)]]
+            )
+
+    def callback_data(self, index: int, answer: Answer) -> str:
+        return f"{self.callback_prefix}{index + 1}_{answer.code}"
+
+    def route(self, data: str) -> Optional[Tuple[int, Tuple[int, ...]]]:
+        """(индекс вопроса, вектор весов) для callback_data или None."""
+        return self.routes.get(data)
+
+    def score_increments(self, weights: Sequence[int]) -> Dict[str, object]:
+        """values() для UPDATE quiz_results: прибавка ненулевых весов к колонкам."""
+        return {column.key: column + weight for column, weight in zip(self.score_columns, weights) if weight}
+
+    def totals(self, answers: Iterable[str]) -> Tuple[int, ...]:
+        """Сумма векторов весов по callback_data ответов (без БД)."""
+        routes = self.routes
+        vectors = [routes[data][1] for data in answers]
+        if not vectors:
+            return (0,) * len(self.scenarios)
+        return tuple(map(sum, zip(*vectors)))
+
+    @staticmethod
+    def stored_scenario(scenario: str) -> Optional[str]:
+        """Сценарий для quiz_results.dominant_scenario: только значения QuizScenario, иначе None."""
+        return scenario if scenario in _SCENARIO_VALUES else None
+
+    def dominant(self, totals: Sequence[int]) -> str:
+        """Сценарий с максимумом баллов; при равенстве — первый по порядку scenarios."""
+        # index() возвращает первое вхождение максимума — это и есть правило равенства
+        return self.scenarios[list(totals).index(max(totals))]
+
+    def totals_of(self, quiz_result: QuizResult) -> Tuple[int, ...]:
+        return tuple(getattr(quiz_result, column.key) or 0 for column in self.score_columns)
+
+    def initial_scores(self) -> Dict[str, int]:
+        """Нулевые счётчики сценариев квиза для новой строки quiz_results."""
+        return {column.key: 0 for column in self.score_columns}
+
+    def result_screen(self, scenario: str) -> Tuple[str, str]:
+        """(фото, текст) результата для сценария."""
+        return self.results[scenario]
+
+    def __repr__(self) -> str:
+        return f"<QuizDefinition({self.code}: {len(self.questions)} вопросов, {self.scenarios})>"
+
+
+_quizzes: Dict[str, QuizDefinition] = {}
+# callback_data ответов всех квизов — для фильтра обработчика
+_answer_callbacks: set = set()
+
+
+def register(definition: QuizDefinition) -> QuizDefinition:
+    _quizzes[definition.code] = definition
+    _answer_callbacks.update(definition.routes)
+    return definition
+
+
+def get_quiz(code: str) -> Optional[QuizDefinition]:
+    return _quizzes.get(code)
+
+
+def is_answer(data: Optional[str]) -> bool:
+    """Похожа ли callback_data на ответ какого-либо зарегистрированного квиза."""
+    return data in _answer_callbacks
@@ -0,0 +1,127 @@
+"""
+Массовый пересчёт расчётных полей сохранённых результатов по версии формулы
+(formulas.py): scenario_cost_results и non_psych_quiz_results.
+
+Пересчёт идёт set-based UPDATE'ами по диапазонам id, каждый диапазон — своя
+короткая транзакция. Блокируются только строки текущего диапазона и ненадолго,
+поэтому джоб можно запускать на живой базе: обработчики продолжают писать
+новые результаты. На Postgres у каждой транзакции lock_timeout, и диапазон,
+не дождавшийся блокировки, повторяется после паузы.
+
+    python -m recompute --table all
+    python -m recompute --table scenario_cost --version 2 --chunk 5000 --pause 0.05
+    python -m recompute --table non_psych --dry-run
+"""
+import argparse
+import asyncio
+import time
+from typing import Dict, Optional
+
+from loguru import logger
+from sqlalchemy import func, or_, select, text, update
+from sqlalchemy.exc import DBAPIError
+
+import formulas
+from database import engine
+from models import NonPsychQuizResult, ScenarioCostResult
+
+TABLES = {
+    "scenario_cost": (ScenarioCostResult, formulas.SCENARIO_COST_FORMULAS, formulas.SCENARIO_COST_FORMULA_VERSION),
+    "non_psych": (NonPsychQuizResult, formulas.NON_PSYCH_FORMULAS, formulas.NON_PSYCH_FORMULA_VERSION),
+}
+
+# Сколько ждать блокировку строки в одном диапазоне (только Postgres)
+LOCK_TIMEOUT = "2s"
+MAX_CHUNK_RETRIES = 5
+
+
+def _stale(model, version: int):
+    return or_(model.formula_version.is_(None), model.formula_version != version)
+
+
+async def _update_chunk(model, values: Dict, version: int, low: int, high: int, force: bool) -> int:
+    """UPDATE одного диапазона id [low, high) в отдельной транзакции."""
+    condition = (model.id >= low) & (model.id < high)
+    if not force:
+        condition = condition & _stale(model, version)
+    stmt = update(model).where(condition).values(formula_version=version, **values)
+
+    for attempt in range(1, MAX_CHUNK_RETRIES + 1):
+        try:
+            async with engine.begin() as conn:
+                if conn.dialect.name == "postgresql":
+                    await conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+                result = await conn.execute(stmt)
+                return result.rowcount
+        except DBAPIError as e:
+            if attempt == MAX_CHUNK_RETRIES:
+                raise
+            logger.warning("Диапазон id [{}, {}): {}; повтор {}", low, high, e.orig, attempt)
+            await asyncio.sleep(attempt)
+    return 0
+
+
+async def recompute_table(
+    name: str,
+    version: Optional[int] = None,
+    chunk: int = 5000,
+    pause: float = 0.05,
+    force: bool = False,
+    dry_run: bool = False,
+) -> int:
+    """Пересчитывает строки таблицы, записанные не по version. Возвращает число обновлённых строк."""
+    model, registry, current = TABLES[name]
+    version = current if version is None else version
+    formula = registry.get(version)
+    if formula is None:
+        raise ValueError(f"Формула {name} версии {version} не найдена, есть: {sorted(registry)}")
+
+    async with engine.connect() as conn:
+        low, high = (await conn.execute(select(func.min(model.id), func.max(model.id)))).one()
+        stale = (await conn.execute(
+            select(func.count()).select_from(model).where(_stale(model, version))
+        )).scalar_one()
+
+    logger.info(
+        "{}: {} строк не по версии {} ({}), id {}..{}",
+        model.__tablename__, stale, version, formula.description, low, high,
+    )
+    if dry_run or low is None or (stale == 0 and not force):
+        return 0
+
+    values = formula.sql(model.__table__)
+    started = time.monotonic()
+    updated = 0
+    for chunk_low in range(low, high + 1, chunk):
+        updated += await _update_chunk(model, values, version, chunk_low, chunk_low + chunk, force)
+        if pause:
+            await asyncio.sleep(pause)
+
+    elapsed = time.monotonic() - started
+    logger.info(
+        "{}: обновлено {} строк за {:.1f} с ({:.0f} строк/с)",
+        model.__tablename__, updated, elapsed, updated / elapsed if elapsed else 0,
+    )
+    return updated
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--table", choices=[*TABLES, "all"], default="all")
+    parser.add_argument("--version", type=int, default=None, help="версия формулы (по умолчанию текущая)")
+    parser.add_argument("--chunk", type=int, default=5000, help="строк id-диапазона на транзакцию")
+    parser.add_argument("--pause", type=float, default=0.05, help="пауза между диапазонами, с")
+    parser.add_argument("--force", action="store_true", help="пересчитать и строки, уже записанные по версии")
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать устаревшие строки")
+    args = parser.parse_args()
+
+    names = list(TABLES) if args.table == "all" else [args.table]
+    try:
+        for name in names:
+            await recompute_table(name, args.version, args.chunk, args.pause, args.force, args.dry_run)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
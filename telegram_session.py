@@ -0,0 +1,112 @@
+"""
+HTTP-сессия Bot API с настроенным коннектором и раздельными таймаутами.
+
+Штатная AiohttpSession создаёт TCPConnector почти с умолчаниями и применяет
+к каждому запросу один общий таймаут, поэтому мёртвое соединение обнаруживается
+только через HTTP_TIMEOUT. Здесь коннектор и таймауты задаются из окружения:
+
+    FORCE_IPV4               — 1: резолвить и соединяться только по IPv4
+    HTTP_DNS_TTL             — сколько секунд кэшировать DNS-ответы
+    HTTP_LIMIT               — максимум соединений всего
+    HTTP_LIMIT_PER_HOST      — максимум соединений к api.telegram.org; подбирается
+                               под число одновременно обрабатываемых апдейтов
+    HTTP_KEEPALIVE_TIMEOUT   — сколько секунд держать простаивающее соединение
+    HTTP_CONNECT_TIMEOUT     — таймаут установки соединения (включая прокси и TLS)
+    HTTP_READ_TIMEOUT        — таймаут ожидания данных от сервера
+    HTTP_TIMEOUT             — общий потолок на запрос (session.timeout)
+"""
+import os
+import socket
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import GetUpdates, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import InputFile
+from aiohttp import ClientTimeout
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+FORCE_IPV4 = os.getenv("FORCE_IPV4", "0") == "1"
+DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "300"))
+LIMIT = int(os.getenv("HTTP_LIMIT", "100"))
+LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "50"))
+KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60"))
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+TOTAL_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "180"))
+
+
+def connector_settings() -> Dict[str, Any]:
+    """Параметры TCPConnector из окружения (подходят и для ProxyConnector)."""
+    settings: Dict[str, Any] = {
+        "ttl_dns_cache": DNS_TTL,
+        "limit": LIMIT,
+        "limit_per_host": LIMIT_PER_HOST,
+        "keepalive_timeout": KEEPALIVE_TIMEOUT,
+    }
+    if FORCE_IPV4:
+        settings["family"] = socket.AF_INET
+    return settings
+
+
+def _has_upload(method: TelegramMethod) -> bool:
+    return any(isinstance(getattr(method, name, None), InputFile) for name in type(method).model_fields)
+
+
+class TunedAiohttpSession(AiohttpSession):
+    """
+    AiohttpSession с настроенным коннектором и таймаутами connect/read
+    вместо одного общего.
+
+    Для getUpdates таймаут чтения увеличивается на long-polling таймаут
+    запроса, для загрузки файлов не ограничивается: пока файл уходит,
+    сервер молчит.
+    """
+
+    def __init__(
+        self,
+        proxy: Optional[Any] = None,
+        connector: Optional[Dict[str, Any]] = None,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        **kwargs: Any,
+    ) -> None:
+        self._tuning = connector_settings() if connector is None else connector
+        super().__init__(proxy=proxy, **kwargs)
+        self._connector_init.update(self._tuning)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    def _setup_proxy_connector(self, proxy: Any) -> None:
+        super()._setup_proxy_connector(proxy)
+        self._connector_init.update(self._tuning)
+
+    def client_timeout(self, method: TelegramMethod, timeout: Optional[float]) -> ClientTimeout:
+        read_timeout: Optional[float] = self.read_timeout
+        if isinstance(method, GetUpdates):
+            read_timeout += method.timeout or 0
+        elif _has_upload(method):
+            read_timeout = None
+        return ClientTimeout(
+            total=self.timeout if timeout is None else timeout,
+            sock_connect=self.connect_timeout,
+            sock_read=read_timeout,
+        )
+
+    async def make_request(
+        self,
+        bot: "Bot",
+        method: TelegramMethod[TelegramType],
+        timeout: Optional[int] = None,
+    ) -> TelegramType:
+        # Базовая реализация передаёт timeout в aiohttp как есть, а тот
+        # принимает и число, и ClientTimeout
+        return await super().make_request(bot, method, timeout=self.client_timeout(method, timeout))
+
+
+def create_telegram_session(proxy: Optional[Any] = None, **kwargs: Any) -> TunedAiohttpSession:
+    """Сессия Bot API с настройками из окружения; kwargs — как у AiohttpSession."""
+    kwargs.setdefault("timeout", TOTAL_TIMEOUT)
+    return TunedAiohttpSession(proxy=proxy, **kwargs)
@@ -0,0 +1,557 @@
+"""
+Трассировка апдейтов: куда ушло время — в Postgres, в Bot API (через
+какой транспорт), в n8n или в очередь ограничителя.
+
+Каждый апдейт — корневой span "update" (TracingMiddleware), внутри него:
+- db — каждый SQL-запрос (события engine before/after_cursor_execute);
+- telegram — каждый вызов Bot API (middleware сессии бота), внутри —
+  transport: попытка через конкретный прокси/прямое соединение;
+- http — исходящие HTTP-запросы aiohttp (http_trace_configs(), n8n);
+- limiter.wait — ожидание в очереди ConcurrencyLimiterMiddleware.
+Фото по ссылке (iimg.su) Telegram скачивает сам, это время входит в span
+sendPhoto; ссылка пишется в его атрибут photo.
+
+Пока TRACE_EXPORTER не задан, трассировка выключена и span() ничего не
+делает. Иначе пишутся все апдейты, а экспортируются:
+- доля TRACE_SAMPLE_RATE случайных трасс;
+- все трассы дольше TRACE_SLOW_MS и все с ошибкой —
+  именно их ищут, когда "бот тормозит".
+
+Экспорт пачками раз в TRACE_EXPORT_INTERVAL секунд:
+- file — JSON-строка на span в TRACE_FILE, ротация по TRACE_FILE_MAX_MB
+  с gzip и TRACE_FILE_BACKUPS архивами (запись в отдельном потоке); в
+  кластере у каждого процесса свой файл: <TRACE_FILE без расширения>-<процесс>;
+- otlp — POST в формате OTLP/HTTP JSON на TRACE_OTLP_ENDPOINT
+  (OpenTelemetry Collector, Jaeger, Tempo и т.п.).
+Span'ы фоновых задач, закончившиеся после корневого, в трассу не попадают.
+
+Сводка по файлу: самые медленные апдейты и на что ушло их время:
+
+    python -m tracing                       # TRACE_FILE
+    python -m tracing traces/spans-worker-0.jsonl --slowest 20
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import random
+import shutil
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+import aiohttp
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import GetUpdates
+from aiogram.types import Update
+from loguru import logger
+from sqlalchemy import event
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "").lower()
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "5"))
+TRACE_FILE = os.getenv("TRACE_FILE", "traces/spans.jsonl")
+TRACE_FILE_MAX_MB = float(os.getenv("TRACE_FILE_MAX_MB", "50"))
+TRACE_FILE_BACKUPS = int(os.getenv("TRACE_FILE_BACKUPS", "10"))
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "psych-bot")
+
+# Защита от трасс-гигантов и от роста буфера, если экспорт не успевает
+MAX_SPANS_PER_TRACE = 500
+MAX_PENDING_TRACES = 10000
+# SQL в атрибуте span'а обрезается
+MAX_STATEMENT_LENGTH = 500
+# Span'ы обращений к внешним системам — kind CLIENT в OTLP
+_CLIENT_SPANS = ("db", "telegram", "transport", "http")
+
+ENABLED = TRACE_EXPORTER in ("file", "otlp")
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]) -> None:
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+            self.trace.error = True
+        if not self.trace.finished:
+            self.trace.spans.append(self)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "error", "finished", "dropped_spans")
+
+    def __init__(self) -> None:
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.spans: List[Span] = []
+        self.error = False
+        self.finished = False
+        self.dropped_spans = 0
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("tracing_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def start_span(name: str, **attributes: Any) -> Optional[Span]:
+    """Дочерний span текущего; None вне трассы. Закрывается span.end()."""
+    parent = _current.get()
+    if parent is None:
+        return None
+    trace = parent.trace
+    if len(trace.spans) >= MAX_SPANS_PER_TRACE:
+        trace.dropped_spans += 1
+        return None
+    return Span(trace, name, parent.span_id, attributes)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Дочерний span на время блока; вне трассы ничего не делает."""
+    child = start_span(name, **attributes)
+    if child is None:
+        yield None
+        return
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.end(e)
+        raise
+    finally:
+        _current.reset(token)
+        child.end()
+
+
+# --- Экспорт ---
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(item: Span) -> Dict[str, Any]:
+    data = {
+        "traceId": item.trace.trace_id,
+        "spanId": item.span_id,
+        "name": item.name,
+        "kind": 2 if item.parent_id is None else 3 if item.name in _CLIENT_SPANS else 1,
+        "startTimeUnixNano": str(item.start_ns),
+        "endTimeUnixNano": str(item.end_ns),
+        "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in item.attributes.items()],
+        "status": {"code": 2, "message": item.error} if item.error else {"code": 1},
+    }
+    if item.parent_id:
+        data["parentSpanId"] = item.parent_id
+    return data
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+class TraceExporter:
+    def __init__(
+        self,
+        kind: str = TRACE_EXPORTER,
+        sample_rate: float = TRACE_SAMPLE_RATE,
+        slow_ms: float = TRACE_SLOW_MS,
+        interval: float = TRACE_EXPORT_INTERVAL,
+    ) -> None:
+        self.kind = kind
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.interval = interval
+        self.path = TRACE_FILE
+        self._pending: List[Trace] = []
+        self._task: Optional[asyncio.Task] = None
+        self._file: Optional[RotatingFileHandler] = None
+        # Запись идёт в потоке (to_thread): отменённый экспорт не останавливает уже начатую
+        self._file_lock = threading.Lock()
+        self._http: Optional[aiohttp.ClientSession] = None
+
+        self.traces_started = 0
+        self.traces_exported = 0
+        self.traces_dropped = 0
+        self.spans_exported = 0
+        self.export_errors = 0
+
+    def finish(self, trace: Trace, root: Span) -> None:
+        """Решение об экспорте по законченной трассе (хвостовое сэмплирование)."""
+        trace.finished = True
+        keep = trace.error or root.duration_ms >= self.slow_ms or random.random() < self.sample_rate
+        if not keep:
+            return
+        if len(self._pending) >= MAX_PENDING_TRACES:
+            self.traces_dropped += 1
+            return
+        self._pending.append(trace)
+
+    def _write_file(self, lines: List[str]) -> None:
+        with self._file_lock:
+            self._write_file_locked(lines)
+
+    def _write_file_locked(self, lines: List[str]) -> None:
+        if self._file is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(
+                self.path,
+                maxBytes=int(TRACE_FILE_MAX_MB * 1024 * 1024),
+                backupCount=TRACE_FILE_BACKUPS,
+                encoding="utf-8",
+            )
+            handler.namer = lambda name: f"{name}.gz"
+            handler.rotator = _gzip_rotator
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._file = handler
+        for line in lines:
+            self._file.emit(logging.makeLogRecord({"msg": line}))
+        self._file.flush()
+
+    async def _post_otlp(self, traces: List[Trace]) -> None:
+        if self._http is None:
+            self._http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        body = {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    {"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}},
+                    {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": "tracing"},
+                    "spans": [_otlp_span(item) for trace in traces for item in trace.spans],
+                }],
+            }],
+        }
+        async with self._http.post(TRACE_OTLP_ENDPOINT, json=body) as response:
+            if response.status >= 300:
+                raise RuntimeError(f"OTLP-коллектор ответил {response.status}")
+
+    async def export(self) -> int:
+        """Отправляет накопленные трассы; возвращает число span'ов."""
+        traces, self._pending = self._pending, []
+        if not traces:
+            return 0
+        spans = sum(len(trace.spans) for trace in traces)
+        try:
+            if self.kind == "otlp":
+                await self._post_otlp(traces)
+            else:
+                lines = [json.dumps(item.to_dict(), ensure_ascii=False, default=str) for trace in traces for item in trace.spans]
+                await asyncio.to_thread(self._write_file, lines)
+        except Exception as e:
+            self.export_errors += 1
+            self.traces_dropped += len(traces)
+            logger.warning("Экспорт {} трасс не удался: {}", len(traces), e)
+            return 0
+        self.traces_exported += len(traces)
+        self.spans_exported += spans
+        return spans
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.export()
+
+    async def start(self, process_name: Optional[str] = None) -> None:
+        if process_name:
+            path = Path(TRACE_FILE)
+            self.path = str(path.with_name(f"{path.stem}-{process_name}{path.suffix}"))
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    def _close_file(self) -> None:
+        with self._file_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.export()
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+        # Дожидается записи, начатой отменённым экспортом
+        await asyncio.to_thread(self._close_file)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "exporter": self.kind or "off",
+            "started": self.traces_started,
+            "exported": self.traces_exported,
+            "dropped": self.traces_dropped,
+            "pending": len(self._pending),
+            "spans_exported": self.spans_exported,
+            "export_errors": self.export_errors,
+        }
+
+
+exporter = TraceExporter()
+
+
+# --- Точки подключения ---
+
+def _update_attributes(update: Update) -> Dict[str, Any]:
+    attributes: Dict[str, Any] = {"update_id": update.update_id, "update_type": update.event_type}
+    event = update.event
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        attributes["user_id"] = user.id
+    data = getattr(event, "data", None)
+    if data:
+        attributes["callback_data"] = data
+    text = getattr(event, "text", None)
+    if text and text.startswith("/"):
+        attributes["command"] = text.split()[0]
+    return attributes
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Outer-middleware уровня Update: корневой span апдейта."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        trace = Trace()
+        root = Span(trace, "update", None, _update_attributes(event))
+        exporter.traces_started += 1
+        token = _current.set(root)
+        try:
+            return await handler(event, data)
+        except BaseException as e:
+            root.end(e)
+            raise
+        finally:
+            _current.reset(token)
+            root.end()
+            if trace.dropped_spans:
+                root.set(dropped_spans=trace.dropped_spans)
+            exporter.finish(trace, root)
+
+
+class BotApiTracing(BaseRequestMiddleware):
+    """Middleware сессии бота: span на каждый вызов Bot API."""
+
+    async def __call__(self, make_request, bot, method):
+        if _current.get() is None or isinstance(method, GetUpdates):
+            return await make_request(bot, method)
+        attributes: Dict[str, Any] = {"method": type(method).__name__}
+        photo = getattr(method, "photo", None)
+        if isinstance(photo, str):
+            attributes["photo"] = photo
+        with span("telegram", **attributes):
+            return await make_request(bot, method)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    child = start_span(
+        "db",
+        statement=statement[:MAX_STATEMENT_LENGTH],
+        db_system=conn.dialect.name,
+        executemany=executemany,
+    )
+    if child is not None:
+        context._tracing_span = child
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    child = getattr(context, "_tracing_span", None)
+    if child is not None:
+        child.set(rows=cursor.rowcount)
+        child.end()
+
+
+def _handle_error(exception_context) -> None:
+    context = exception_context.execution_context
+    child = getattr(context, "_tracing_span", None) if context is not None else None
+    if child is not None:
+        child.end(exception_context.original_exception)
+
+
+def instrument_engine(async_engine) -> None:
+    """Span на каждый SQL-запрос движка (AsyncEngine)."""
+    sync_engine = async_engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+async def _on_request_start(session, ctx, params) -> None:
+    ctx.span = start_span("http", http_method=params.method, url=f"{params.url.host}{params.url.path}")
+
+
+async def _on_request_end(session, ctx, params) -> None:
+    if getattr(ctx, "span", None) is not None:
+        ctx.span.set(status=params.response.status)
+        ctx.span.end()
+
+
+async def _on_request_exception(session, ctx, params) -> None:
+    if getattr(ctx, "span", None) is not None:
+        ctx.span.end(params.exception)
+
+
+def http_trace_configs() -> List[aiohttp.TraceConfig]:
+    """trace_configs для aiohttp.ClientSession исходящих запросов."""
+    if not ENABLED:
+        return []
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(_on_request_start)
+    config.on_request_end.append(_on_request_end)
+    config.on_request_exception.append(_on_request_exception)
+    return [config]
+
+
+def setup_tracing(dp) -> None:
+    """
+    Корневой span апдейта и span'ы SQL. Подключать первым outer-middleware
+    после учёта апдейтов, чтобы в трассу попало ожидание в очереди.
+    """
+    if not ENABLED:
+        return
+    from database import engine, replica_engine
+
+    dp.update.outer_middleware(TracingMiddleware())
+    instrument_engine(engine)
+    if replica_engine is not None:
+        instrument_engine(replica_engine)
+    dp.shutdown.register(exporter.stop)
+    logger.info(
+        "Трассировка включена: экспорт {}, доля {}, медленнее {} мс — всегда",
+        TRACE_EXPORTER, TRACE_SAMPLE_RATE, TRACE_SLOW_MS,
+    )
+
+
+def instrument_bot(bot) -> None:
+    """Span'ы вызовов Bot API бота."""
+    if ENABLED:
+        bot.session.middleware(BotApiTracing())
+
+
+async def start_tracing(process_name: Optional[str] = None) -> None:
+    """Запускает периодический экспорт (внутри running loop)."""
+    if ENABLED:
+        await exporter.start(process_name)
+
+
+# --- Сводка по файлу трасс ---
+
+def _read_spans(path: str) -> List[Dict[str, Any]]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(spans: List[Dict[str, Any]], slowest: int = 10) -> None:
+    by_trace: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for item in spans:
+        by_trace[item["trace_id"]].append(item)
+    roots = sorted(
+        (item for item in spans if item["parent_id"] is None),
+        key=lambda item: item["duration_ms"],
+        reverse=True,
+    )
+    if not roots:
+        print("Трасс нет")
+        return
+
+    durations = sorted(item["duration_ms"] for item in roots)
+    total_by_name: Dict[str, float] = defaultdict(float)
+    for item in spans:
+        if item["parent_id"] is not None:
+            total_by_name[item["name"]] += item["duration_ms"]
+    total_root = sum(durations)
+    print(
+        f"Трасс: {len(roots)}, p50 {durations[len(durations) // 2]:.1f} мс, "
+        f"p95 {durations[min(len(durations) - 1, int(len(durations) * 0.95))]:.1f} мс, "
+        f"max {durations[-1]:.1f} мс"
+    )
+    print("Доля времени апдейтов по типам span'ов (вложенные считаются и в родителе):")
+    for name, value in sorted(total_by_name.items(), key=lambda kv: kv[1], reverse=True):
+        print(f"  {name:<14} {value:10.1f} мс  {value / total_root * 100:5.1f}%")
+
+    print(f"Самые медленные {min(slowest, len(roots))}:")
+    for root in roots[:slowest]:
+        attributes = root["attributes"]
+        what = attributes.get("command") or attributes.get("callback_data") or attributes.get("update_type")
+        breakdown: Dict[str, List[float]] = defaultdict(list)
+        for item in by_trace[root["trace_id"]]:
+            if item["parent_id"] is not None:
+                breakdown[item["name"]].append(item["duration_ms"])
+        parts = ", ".join(
+            f"{name} {sum(values):.1f} мс/{len(values)}" for name, values in sorted(breakdown.items())
+        )
+        error = f" ОШИБКА {root['error']}" if root["error"] else ""
+        print(f"  {root['duration_ms']:8.1f} мс  user={attributes.get('user_id')} {what}: {parts}{error}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", nargs="?", default=TRACE_FILE, help="файл span'ов (.jsonl или .jsonl.N.gz)")
+    parser.add_argument("--slowest", type=int, default=10)
+    args = parser.parse_args()
+    summarize(_read_spans(args.path), args.slowest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Сетевой транспорт бота: несколько прокси плюс прямое соединение
+с переключением на лету.
+
+TransportManager держит по сессии (telegram_session.py) на каждый транспорт и в фоне
+пингует их getMe, считая задержку (EWMA) и долю ошибок в скользящем окне.
+Бот работает через SwitchingSession, которая отдаёт каждый запрос активному
+транспорту, поэтому переключение не требует перезапуска polling: уже идущий
+getUpdates доживает на старом транспорте, следующий уходит в новый.
+
+Переменные окружения:
+    PROXY_URLS                 — прокси через запятую (PROXY_URL тоже учитывается)
+    TRANSPORT_DIRECT           — 1/0, участвует ли прямое соединение (по умолчанию 1)
+    TRANSPORT_PROBE_INTERVAL   — период фоновой проверки, с
+    TRANSPORT_PROBE_TIMEOUT    — таймаут одной проверки, с
+    TRANSPORT_MAX_ERROR_RATE   — доля ошибок в окне, после которой транспорт нездоров
+    TRANSPORT_SWITCH_MARGIN    — насколько здоровый транспорт должен быть быстрее
+                                 активного, чтобы на него переключиться
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, AsyncGenerator, Deque, Dict, List, Optional
+
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramNetworkError
+from aiogram.methods import GetMe, GetUpdates, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiohttp import ClientConnectorError
+from loguru import logger
+
+import tracing
+from telegram_session import TunedAiohttpSession, create_telegram_session
+
+try:
+    from aiohttp_socks import ProxyConnectionError, ProxyError, ProxyTimeoutError
+    _PROXY_ERRORS: tuple = (ProxyError, ProxyConnectionError, ProxyTimeoutError)
+except ImportError:  # без aiohttp-socks aiogram не умеет прокси вовсе
+    _PROXY_ERRORS = ()
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+DIRECT = "direct"
+
+PROBE_INTERVAL = float(os.getenv("TRANSPORT_PROBE_INTERVAL", "15"))
+PROBE_TIMEOUT = float(os.getenv("TRANSPORT_PROBE_TIMEOUT", "5"))
+MAX_ERROR_RATE = float(os.getenv("TRANSPORT_MAX_ERROR_RATE", "0.5"))
+SWITCH_MARGIN = float(os.getenv("TRANSPORT_SWITCH_MARGIN", "0.3"))
+
+# Размер окна результатов и вес нового замера в EWMA задержки
+_WINDOW = 20
+_EWMA_ALPHA = 0.3
+# Столько ошибок подряд делают транспорт нездоровым независимо от окна
+_MAX_CONSECUTIVE_FAILURES = 3
+
+
+def proxy_urls_from_env() -> List[str]:
+    """Список прокси из PROXY_URLS и PROXY_URL без повторов, в порядке приоритета."""
+    urls: List[str] = []
+    for raw in (os.getenv("PROXY_URLS", ""), os.getenv("PROXY_URL", "")):
+        for url in raw.split(","):
+            url = url.strip()
+            if url and url not in urls:
+                urls.append(url)
+    return urls
+
+
+def _is_connect_error(exc: BaseException) -> bool:
+    """Запрос не дошёл до Telegram: соединение с прокси или сервером не установлено."""
+    cause = exc.__cause__ if isinstance(exc, TelegramNetworkError) else exc
+    return isinstance(cause, (ClientConnectorError, ConnectionError) + _PROXY_ERRORS)
+
+
+class Transport:
+    """Один путь до Bot API и его статистика."""
+
+    def __init__(self, name: str, session: TunedAiohttpSession, proxy: Optional[str] = None) -> None:
+        self.name = name
+        self.proxy = proxy
+        self.session = session
+        self.latency: Optional[float] = None
+        self.results: Deque[bool] = deque(maxlen=_WINDOW)
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.last_probe_at: Optional[float] = None
+
+    @property
+    def error_rate(self) -> float:
+        if not self.results:
+            return 0.0
+        return self.results.count(False) / len(self.results)
+
+    @property
+    def healthy(self) -> bool:
+        return (
+            self.consecutive_failures < _MAX_CONSECUTIVE_FAILURES
+            and self.error_rate < MAX_ERROR_RATE
+        )
+
+    def record_success(self, latency: Optional[float]) -> None:
+        self.results.append(True)
+        self.consecutive_failures = 0
+        if latency is not None:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency = _EWMA_ALPHA * latency + (1 - _EWMA_ALPHA) * self.latency
+
+    def record_failure(self, error: BaseException) -> None:
+        self.results.append(False)
+        self.consecutive_failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+        }
+
+
+class TransportManager:
+    """Фоновая проверка транспортов и выбор активного по здоровью и задержке."""
+
+    def __init__(
+        self,
+        proxies: List[str],
+        include_direct: bool = True,
+        session_kwargs: Optional[Dict[str, Any]] = None,
+        probe_interval: float = PROBE_INTERVAL,
+        probe_timeout: float = PROBE_TIMEOUT,
+    ) -> None:
+        session_kwargs = session_kwargs or {}
+        self.transports: List[Transport] = [
+            Transport(proxy, create_telegram_session(proxy=proxy, **session_kwargs), proxy=proxy)
+            for proxy in proxies
+        ]
+        if include_direct or not self.transports:
+            self.transports.append(Transport(DIRECT, create_telegram_session(**session_kwargs)))
+        self.active: Transport = self.transports[0]
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.switches = 0
+        self._bot: Optional["Bot"] = None
+        self._probe_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, session_kwargs: Optional[Dict[str, Any]] = None) -> "TransportManager":
+        return cls(
+            proxies=proxy_urls_from_env(),
+            include_direct=os.getenv("TRANSPORT_DIRECT", "1") == "1",
+            session_kwargs=session_kwargs,
+        )
+
+    async def start(self, bot: "Bot") -> None:
+        """Первичная проверка всех транспортов и запуск фоновой."""
+        self._bot = bot
+        await self.probe_all()
+        if self._probe_task is None:
+            self._probe_task = asyncio.create_task(self._probe_loop(), name="transport-probe")
+
+    async def _probe(self, transport: Transport) -> None:
+        started = time.monotonic()
+        try:
+            await transport.session.make_request(self._bot, GetMe(), timeout=self.probe_timeout)
+        except Exception as e:
+            transport.record_failure(e)
+        else:
+            transport.record_success(time.monotonic() - started)
+        transport.last_probe_at = time.time()
+
+    async def probe_all(self) -> None:
+        await asyncio.gather(*(self._probe(t) for t in self.transports))
+        self.select()
+
+    async def _probe_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            try:
+                await self.probe_all()
+            except Exception:
+                logger.exception("Ошибка фоновой проверки транспортов")
+
+    def select(self) -> Transport:
+        """
+        Выбирает активный транспорт: самый быстрый из здоровых. На более быстрый
+        переключаемся только при выигрыше больше SWITCH_MARGIN, чтобы не скакать
+        между транспортами с близкой задержкой.
+        """
+        healthy = [t for t in self.transports if t.healthy and t.latency is not None]
+        if not healthy:
+            return self.active
+        best = min(healthy, key=lambda t: t.latency)
+        current = self.active
+        if best is current:
+            return current
+        if current.healthy and current.latency is not None:
+            if best.latency > current.latency * (1 - SWITCH_MARGIN):
+                return current
+        self._switch(best)
+        return best
+
+    def _switch(self, transport: Transport) -> None:
+        previous = self.active
+        self.active = transport
+        self.switches += 1
+        logger.warning(
+            "Транспорт переключён: {} -> {} (ошибки {:.0%}, задержка {})",
+            previous.name,
+            transport.name,
+            previous.error_rate,
+            f"{transport.latency * 1000:.0f} мс" if transport.latency is not None else "—",
+        )
+
+    def report(self, transport: Transport, error: Optional[BaseException], latency: Optional[float]) -> None:
+        """Учитывает результат боевого запроса; при деградации активного переключается сразу."""
+        if error is None:
+            transport.record_success(latency)
+            return
+        transport.record_failure(error)
+        if transport is self.active and not transport.healthy:
+            self.select()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active.name,
+            "switches": self.switches,
+            "transports": [t.stats() for t in self.transports],
+        }
+
+    async def close(self) -> None:
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+        for transport in self.transports:
+            await transport.session.close()
+
+
+class SwitchingSession(BaseSession):
+    """
+    Сессия бота, отдающая запросы активному транспорту менеджера.
+    Запрос, не сумевший установить соединение, один раз повторяется
+    через транспорт, выбранный после учёта ошибки: до Telegram он не дошёл,
+    поэтому дубля не будет.
+    """
+
+    def __init__(self, manager: TransportManager, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.manager = manager
+
+    async def _send(
+        self,
+        transport: Transport,
+        bot: "Bot",
+        method: TelegramMethod[TelegramType],
+        timeout: Optional[int],
+    ) -> TelegramType:
+        started = time.monotonic()
+        try:
+            with tracing.span("transport", transport=transport.name):
+                result = await transport.session.make_request(bot, method, timeout=timeout)
+        except TelegramNetworkError as e:
+            self.manager.report(transport, e, None)
+            raise
+        except _PROXY_ERRORS as e:
+            # Ошибки прокси из aiohttp-socks aiogram не оборачивает
+            self.manager.report(transport, e, None)
+            raise TelegramNetworkError(method=method, message=f"{type(e).__name__}: {e}") from e
+        # Long-polling getUpdates висит до таймаута, задержку по нему не считаем
+        latency = None if isinstance(method, GetUpdates) else time.monotonic() - started
+        self.manager.report(transport, None, latency)
+        return result
+
+    async def make_request(
+        self,
+        bot: "Bot",
+        method: TelegramMethod[TelegramType],
+        timeout: Optional[int] = None,
+    ) -> TelegramType:
+        transport = self.manager.active
+        try:
+            return await self._send(transport, bot, method, timeout)
+        except TelegramNetworkError as e:
+            retry = self.manager.active
+            if retry is transport or not _is_connect_error(e):
+                raise
+            logger.info("Повтор {} через транспорт {}", type(method).__name__, retry.name)
+            return await self._send(retry, bot, method, timeout)
+
+    async def stream_content(
+        self,
+        url: str,
+        headers: Optional[Dict[str, Any]] = None,
+        timeout: int = 30,
+        chunk_size: int = 65536,
+        raise_for_status: bool = True,
+    ) -> AsyncGenerator[bytes, None]:
+        async for chunk in self.manager.active.session.stream_content(
+            url,
+            headers=headers,
+            timeout=timeout,
+            chunk_size=chunk_size,
+            raise_for_status=raise_for_status,
+        ):
+            yield chunk
+
+    async def close(self) -> None:
+        await self.manager.close()
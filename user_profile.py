@@ -0,0 +1,134 @@
+"""
+Снимок профиля пользователя в FSM-хранилище.
+
+Экраны воронки часто открывают сессию БД только ради имени, признака
+психолога или сценария квиза. Эти поля меняются в нескольких обработчиках
+(name_confirmed, phone_confirmed, goal_selected, show_quiz_results) — там
+после commit снимок перезаписывается из той же записи User. Остальные
+обработчики читают load_profile(): из хранилища, а при промахе (новый
+процесс с MemoryStorage, /start) — один раз из primary, с записью снимка.
+
+Снимок лежит под отдельным StorageKey (destiny="profile"), поэтому
+state.clear() в сценариях его не стирает. С RedisStorage он общий
+для всех воркеров кластера.
+"""
+from dataclasses import replace
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import select
+
+from database import AsyncSessionLocal
+from models import QuizScenario, User
+
+PROFILE_DESTINY = "profile"
+# Поднять при изменении набора полей: старые снимки будут перечитаны из БД
+PROFILE_VERSION = 1
+
+_stats = {"hits": 0, "misses": 0, "saved": 0}
+
+
+class UserProfile:
+    """Поля пользователя, нужные экранам воронки."""
+
+    def __init__(
+        self,
+        user_name: Optional[str] = None,
+        phone: Optional[str] = None,
+        telegram_username: Optional[str] = None,
+        is_psychologist: bool = False,
+        main_quiz_scenario: Optional[str] = None,
+    ) -> None:
+        self.user_name = user_name
+        self.phone = phone
+        self.telegram_username = telegram_username
+        self.is_psychologist = is_psychologist
+        self.main_quiz_scenario = main_quiz_scenario
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserProfile":
+        scenario = user.main_quiz_scenario
+        if isinstance(scenario, QuizScenario):
+            scenario = scenario.value
+        return cls(
+            user_name=user.user_name,
+            phone=user.phone,
+            telegram_username=user.telegram_username,
+            is_psychologist=bool(user.is_psychologist),
+            main_quiz_scenario=scenario,
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> Optional["UserProfile"]:
+        if data.get("version") != PROFILE_VERSION:
+            return None
+        return cls(
+            user_name=data.get("user_name"),
+            phone=data.get("phone"),
+            telegram_username=data.get("telegram_username"),
+            is_psychologist=bool(data.get("is_psychologist")),
+            main_quiz_scenario=data.get("main_quiz_scenario"),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": PROFILE_VERSION,
+            "user_name": self.user_name,
+            "phone": self.phone,
+            "telegram_username": self.telegram_username,
+            "is_psychologist": self.is_psychologist,
+            "main_quiz_scenario": self.main_quiz_scenario,
+        }
+
+    @property
+    def scenario(self) -> Optional[QuizScenario]:
+        """Сценарий квиза как Enum (None — не пройден или неизвестное значение)."""
+        try:
+            return QuizScenario(self.main_quiz_scenario) if self.main_quiz_scenario else None
+        except ValueError:
+            return None
+
+    def __repr__(self) -> str:
+        return f"<UserProfile(name={self.user_name!r}, psych={self.is_psychologist}, scenario={self.main_quiz_scenario})>"
+
+
+def _profile_key(state: FSMContext) -> StorageKey:
+    return replace(state.key, destiny=PROFILE_DESTINY)
+
+
+async def save_profile(state: FSMContext, user: User) -> UserProfile:
+    """Перезаписывает снимок из только что сохранённой записи User."""
+    profile = UserProfile.from_user(user)
+    await state.storage.set_data(_profile_key(state), profile.to_dict())
+    _stats["saved"] += 1
+    return profile
+
+
+async def clear_profile(state: FSMContext) -> None:
+    """Сбрасывает снимок: следующий load_profile перечитает пользователя из БД."""
+    await state.storage.set_data(_profile_key(state), {})
+
+
+async def load_profile(state: FSMContext, telegram_id: int) -> Optional[UserProfile]:
+    """Профиль из хранилища; при промахе — из БД с записью снимка. None — пользователя нет."""
+    key = _profile_key(state)
+    profile = UserProfile.from_dict(await state.storage.get_data(key))
+    if profile is not None:
+        _stats["hits"] += 1
+        return profile
+
+    _stats["misses"] += 1
+    # Primary, а не реплика: отстающий снимок прожил бы до следующей записи
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User).where(User.telegram_id == telegram_id))
+        user = result.scalar_one_or_none()
+    if user is None:
+        return None
+    profile = UserProfile.from_user(user)
+    await state.storage.set_data(key, profile.to_dict())
+    return profile
+
+
+def stats() -> Dict[str, int]:
+    return dict(_stats)